@@ -0,0 +1,186 @@
+# admission.py
+# Ordonnancement par priorité des étapes coûteuses (LLM, TTS): chaque étape a un
+# nombre borné de tâches simultanées; au-delà, les demandes attendent dans une
+# file servie par classe de priorité (voix > texte > admin/lot) puis par ordre
+# d'arrivée. Quand la file est trop longue pour une classe, la demande est
+# refusée (503 + Retry-After): l'admin est délesté bien avant la voix.
+#
+# Utilisable depuis les threads (endpoints synchrones, pools) comme depuis la
+# boucle asyncio, sans bloquer de thread pendant l'attente côté async.
+
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager, contextmanager
+from threading import Event, Lock
+
+from latency_window import LatencyWindow
+
+PRIORITY_CLASSES = {"voice": 0, "text": 1, "admin": 2}
+
+
+class AdmissionRejected(Exception):
+    """File d'attente trop longue pour cette classe: réessayer après `retry_after_s`"""
+
+    def __init__(self, stage: str, priority_class: str, retry_after_s: int):
+        super().__init__(f"Serveur occupé ({stage}, priorité {priority_class}): réessayez dans {retry_after_s}s")
+        self.stage = stage
+        self.priority_class = priority_class
+        self.retry_after_s = retry_after_s
+
+
+class _Ticket:
+    __slots__ = ("priority_class", "event", "loop", "future", "granted", "cancelled")
+
+    def __init__(self, priority_class: str, loop=None):
+        self.priority_class = priority_class
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+        self.event = Event() if loop is None else None
+        self.granted = False
+        self.cancelled = False
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class StageLimiter:
+    """
+    `concurrency` tâches simultanées pour une étape. `max_queue[classe]`: longueur de file
+    (toutes classes confondues) au-delà de laquelle une nouvelle demande de cette classe est refusée.
+    """
+
+    def __init__(self, name: str, concurrency: int, max_queue: dict):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.lock = Lock()
+        self.active = 0
+        self.queued = 0
+        self.heap = []  # (priorité, rang d'arrivée, ticket)
+        self.sequence = itertools.count()
+        self.service = LatencyWindow()
+        self.queue_wait = {priority_class: LatencyWindow() for priority_class in PRIORITY_CLASSES}
+        self.admitted = {priority_class: 0 for priority_class in PRIORITY_CLASSES}
+        self.rejected = {priority_class: 0 for priority_class in PRIORITY_CLASSES}
+
+    def _retry_after(self) -> int:
+        p50 = self.service.stats()["p50_s"] or 1.0
+        return max(1, math.ceil((self.queued + 1) * p50 / self.concurrency))
+
+    def _enqueue(self, priority_class: str, shed: bool, loop=None):
+        """Sous verrou: None si admis tout de suite, sinon ticket à attendre; lève si délesté"""
+        if self.active < self.concurrency and not self.queued:
+            self.active += 1
+            self.admitted[priority_class] += 1
+            return None
+        if shed and self.queued >= self.max_queue[priority_class]:
+            self.rejected[priority_class] += 1
+            raise AdmissionRejected(self.name, priority_class, self._retry_after())
+        ticket = _Ticket(priority_class, loop)
+        heapq.heappush(self.heap, (PRIORITY_CLASSES[priority_class], next(self.sequence), ticket))
+        self.queued += 1
+        return ticket
+
+    def check(self, priority_class: str):
+        """Refus anticipé, avant d'ouvrir une réponse en flux (un 503 n'est plus possible ensuite)"""
+        with self.lock:
+            if self.active >= self.concurrency and self.queued >= self.max_queue[priority_class]:
+                self.rejected[priority_class] += 1
+                raise AdmissionRejected(self.name, priority_class, self._retry_after())
+
+    def acquire(self, priority_class: str, shed: bool = True):
+        started = time.perf_counter()
+        with self.lock:
+            ticket = self._enqueue(priority_class, shed)
+        if ticket is not None:
+            ticket.event.wait()
+        self.queue_wait[priority_class].add(time.perf_counter() - started)
+
+    async def acquire_async(self, priority_class: str, shed: bool = True):
+        started = time.perf_counter()
+        with self.lock:
+            ticket = self._enqueue(priority_class, shed, asyncio.get_running_loop())
+        if ticket is not None:
+            try:
+                await ticket.future
+            except asyncio.CancelledError:
+                with self.lock:
+                    if ticket.granted:
+                        self._grant_next()  # place obtenue juste avant l'annulation: on la rend
+                    else:
+                        ticket.cancelled = True
+                        self.queued -= 1
+                raise
+        self.queue_wait[priority_class].add(time.perf_counter() - started)
+
+    def _grant_next(self):
+        """Sous verrou: passe la place libérée à la demande la plus prioritaire, sinon la rend"""
+        while self.heap:
+            _, _, ticket = heapq.heappop(self.heap)
+            if ticket.cancelled:
+                continue
+            self.queued -= 1
+            ticket.granted = True
+            self.admitted[ticket.priority_class] += 1
+            if ticket.future is not None:
+                ticket.loop.call_soon_threadsafe(_wake, ticket.future)
+            else:
+                ticket.event.set()
+            return
+        self.active -= 1
+
+    def release(self, service_s: float):
+        self.service.add(service_s)
+        with self.lock:
+            self._grant_next()
+
+    def stats(self) -> dict:
+        with self.lock:
+            snapshot = {
+                "concurrency": self.concurrency,
+                "active": self.active,
+                "queued": self.queued,
+                "admitted": dict(self.admitted),
+                "rejected": dict(self.rejected)
+            }
+        snapshot["service"] = self.service.stats()
+        snapshot["queue_wait"] = {name: window.stats() for name, window in self.queue_wait.items()}
+        return snapshot
+
+
+class AdmissionScheduler:
+    """Étapes nommées ("llm", "tts") -> StageLimiter; `slot` / `aslot` réservent une place"""
+
+    def __init__(self, stages: dict):
+        self.stages = stages
+
+    def check(self, stage: str, priority_class: str):
+        self.stages[stage].check(priority_class)
+
+    @contextmanager
+    def slot(self, stage: str, priority_class: str, shed: bool = True):
+        limiter = self.stages[stage]
+        limiter.acquire(priority_class, shed)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            limiter.release(time.perf_counter() - started)
+
+    @asynccontextmanager
+    async def aslot(self, stage: str, priority_class: str, shed: bool = True):
+        limiter = self.stages[stage]
+        await limiter.acquire_async(priority_class, shed)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            limiter.release(time.perf_counter() - started)
+
+    def stats(self) -> dict:
+        return {name: limiter.stats() for name, limiter in self.stages.items()}
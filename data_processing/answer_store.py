@@ -0,0 +1,242 @@
+# answer_store.py
+# Réponses pré-calculées pour les questions les plus fréquentes.
+# QuestionLog journalise chaque question posée (JSONL écrit par lots en tâche
+# de fond, comptes en mémoire); AnswerStore conserve sur disque, pour les N
+# questions les plus posées par langue, le contexte retrouvé, la réponse du LLM
+# et son audio. Le magasin porte la version des index qui l'a produit: une
+# réponse d'une autre version n'est jamais servie.
+
+import hashlib
+import json
+import os
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from threading import Event, Lock, Thread
+
+from embedding_store import normalize_query
+
+
+def question_key(question: str, language: str) -> str:
+    # La ponctuation finale varie d'une transcription à l'autre ("...Money ?" / "...Money")
+    return f"{language}|{normalize_query(question).rstrip(' ?!.')}"
+
+
+class QuestionLog:
+    """
+    Journal des questions (une ligne JSON par question), tronqué aux `max_lines` dernières.
+    append() ne fait aucune E/S: les lignes sont écrites par lots par un thread toutes les
+    `flush_interval_s` secondes, et les comptes par question sont tenus en mémoire
+    (top_questions ne relit pas le fichier).
+    """
+
+    def __init__(self, path: Path, max_lines: int = 50000, flush_interval_s: float = 2.0):
+        self.path = Path(path)
+        self.max_lines = max_lines
+        self.flush_interval_s = flush_interval_s
+        self.lock = Lock()  # tampon et comptes
+        self.file_lock = Lock()  # écriture du fichier
+        self.pending = []
+        self.counts = Counter()  # clé normalisée -> occurrences
+        self.forms = {}  # clé normalisée -> Counter des formulations
+        self.lines = 0
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    self.lines += 1
+                    self._count_line(line)
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.stopped = Event()
+        self.thread = Thread(target=self._flush_loop, daemon=True, name="question-log")
+        self.thread.start()
+
+    def _count(self, entry: dict):
+        key = question_key(entry["question"], entry["language"])
+        self.counts[key] += 1
+        self.forms.setdefault(key, Counter())[entry["question"].strip()] += 1
+
+    def _count_line(self, line: str):
+        try:
+            self._count(json.loads(line))
+        except (json.JSONDecodeError, KeyError):
+            pass  # ligne tronquée par un arrêt brutal
+
+    def append(self, question: str, language: str, endpoint: str):
+        entry = {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "question": question,
+            "language": language,
+            "endpoint": endpoint
+        }
+        with self.lock:
+            self.pending.append(entry)
+            self._count(entry)
+
+    def _flush_loop(self):
+        while not self.stopped.wait(self.flush_interval_s):
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"⚠️  Journal des questions non écrit: {e}")
+
+    def flush(self):
+        """Écrit les questions en attente (thread d'écriture, arrêt du serveur)"""
+        with self.file_lock:
+            with self.lock:
+                batch, self.pending = self.pending, []
+            if not batch:
+                return
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(entry, ensure_ascii=False) + "\n" for entry in batch)
+            self.lines += len(batch)
+            if self.lines > self.max_lines:
+                self._truncate()
+
+    def _truncate(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            kept = f.readlines()[-(self.max_lines // 2):]
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(kept)
+        os.replace(tmp_path, self.path)
+        self.lines = len(kept)
+        # Comptes recalculés sur les lignes gardées + celles arrivées entre-temps
+        with self.lock:
+            self.counts, self.forms = Counter(), {}
+            for line in kept:
+                self._count_line(line)
+            for entry in self.pending:
+                self._count(entry)
+
+    def close(self):
+        self.stopped.set()
+        self.flush()
+
+    def top_questions(self, top_n: int, min_count: int = 2) -> dict:
+        """{langue: [{"question", "count"}]}: questions normalisées les plus posées, forme la plus fréquente"""
+        top = {}
+        with self.lock:
+            for key, count in self.counts.most_common():
+                if count < min_count:
+                    break
+                questions = top.setdefault(key.split("|", 1)[0], [])
+                if len(questions) < top_n:
+                    questions.append({"question": self.forms[key].most_common(1)[0][0], "count": count})
+        return top
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"file": str(self.path), "lines": self.lines, "pending": len(self.pending),
+                    "questions": len(self.counts)}
+
+
+class AnswerStore:
+    """
+    answers.json: {"version", "built_at", "entries": {clé: entrée}} + un WAV par réponse.
+    Une entrée: {"question", "language", "count", "passages", "response", "scores",
+    "audio_file", "tts_engine"}. Le fichier est remplacé atomiquement, et relu s'il a été
+    reconstruit par un autre processus (CLI).
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.path = self.directory / "answers.json"
+        self.lock = Lock()
+        self.version = None
+        self.built_at = None
+        self.entries = {}
+        self.mtime_ns = None
+        self.lookups = 0
+        self.hits = 0
+        self.builds = 0
+        self.last_build_s = None
+        self._reload_if_changed()
+
+    def _reload_if_changed(self):
+        try:
+            mtime_ns = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime_ns == self.mtime_ns:
+            return
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠️  Impossible de charger {self.path}: {e}")
+            return
+        self.version = data.get("version")
+        self.built_at = data.get("built_at")
+        self.entries = data.get("entries", {})
+        self.mtime_ns = mtime_ns
+
+    def is_current(self, version: str) -> bool:
+        with self.lock:
+            self._reload_if_changed()
+            return self.version == version
+
+    def lookup(self, question: str, language: str, version: str):
+        """Entrée pré-calculée (copie) pour cette question exacte (normalisée), ou None"""
+        with self.lock:
+            self._reload_if_changed()
+            self.lookups += 1
+            if self.version != version:
+                return None
+            entry = self.entries.get(question_key(question, language))
+            if entry is None:
+                return None
+            self.hits += 1
+            return {**entry, "response": dict(entry["response"])}
+
+    def audio(self, entry: dict):
+        """Octets WAV de l'entrée, None si absents"""
+        if not entry.get("audio_file"):
+            return None
+        try:
+            return (self.directory / entry["audio_file"]).read_bytes()
+        except OSError:
+            return None
+
+    def audio_name(self, key: str) -> str:
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16] + ".wav"
+
+    def replace(self, version: str, entries: dict, build_s: float):
+        """Publie un nouveau jeu d'entrées (WAV déjà écrits) et supprime les WAV orphelins"""
+        data = {
+            "version": version,
+            "built_at": datetime.utcnow().isoformat() + "Z",
+            "entries": entries
+        }
+        with self.lock:
+            tmp_path = self.path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp_path, self.path)
+            self.mtime_ns = self.path.stat().st_mtime_ns
+            self.version = version
+            self.built_at = data["built_at"]
+            self.entries = entries
+            self.builds += 1
+            self.last_build_s = round(build_s, 2)
+            used = {entry["audio_file"] for entry in entries.values() if entry.get("audio_file")}
+        for wav in self.directory.glob("*.wav"):
+            if wav.name not in used:
+                wav.unlink(missing_ok=True)
+
+    def invalidate(self):
+        """Réponses périmées (ex: changement de modèle LLM): plus servies jusqu'à la reconstruction"""
+        with self.lock:
+            self.version = None
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "version": self.version,
+                "built_at": self.built_at,
+                "builds": self.builds,
+                "last_build_s": self.last_build_s,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else None
+            }
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+benchmark_index.py - Compare les index approximatifs/compressés à l'index exact
+
+Mesure le rappel recall@k (par rapport à IndexFlatIP), la latence p50/p99
+d'une recherche unitaire et la mémoire de l'index, sur le corpus réel.
+
+Usage (depuis la racine du projet):
+    python data_processing/benchmark_index.py
+    python data_processing/benchmark_index.py --types hnsw --ef-search 32 --queries-file questions.txt
+    python data_processing/benchmark_index.py --types flat hnsw --codecs fp16 sq8 pq --rerank
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent))
+from index_factory import CODECS, INDEX_TYPES, RerankIndex, build_index, index_memory_bytes
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def encode(texts: list) -> np.ndarray:
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(EMBEDDING_MODEL)
+    embeddings = model.encode(texts, show_progress_bar=True, convert_to_numpy=True).astype(np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def load_corpus_vectors(args, texts: list) -> np.ndarray:
+    """Vecteurs du corpus: relus depuis l'index exact existant, sinon ré-encodés"""
+    if not args.reencode and Path(args.index).exists():
+        reference = faiss.read_index(args.index)
+        if reference.ntotal == len(texts):
+            try:
+                return reference.reconstruct_n(0, reference.ntotal)
+            except RuntimeError:
+                print("⚠️  Index non reconstructible (type compressé?), ré-encodage du corpus")
+        else:
+            print(f"⚠️  {args.index} ({reference.ntotal} vecteurs) ne correspond pas à {args.metadata} ({len(texts)} textes)")
+    print("🔄 Encodage du corpus...")
+    return encode(texts)
+
+
+def load_queries(args, corpus: np.ndarray) -> np.ndarray:
+    if args.queries_file:
+        path = Path(args.queries_file)
+        if path.suffix == ".json":
+            questions = json.loads(path.read_text(encoding="utf-8"))
+        else:
+            questions = [line.strip() for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+        print(f"🔄 Encodage de {len(questions)} questions...")
+        return encode(questions)
+    # Par défaut: un échantillon de passages du corpus sert de requêtes
+    rng = np.random.default_rng(args.seed)
+    picks = rng.choice(len(corpus), size=min(args.queries, len(corpus)), replace=False)
+    return corpus[picks]
+
+
+def time_searches(index, queries: np.ndarray, k: int):
+    latencies = []
+    results = np.empty((len(queries), k), dtype=np.int64)
+    for row, query in enumerate(queries):
+        started = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        results[row] = ids[0]
+    return results, np.array(latencies)
+
+
+def recall_at(found: np.ndarray, truth: np.ndarray, k: int) -> float:
+    hits = [len(set(found_row[:k]) & set(truth_row[:k])) / k for found_row, truth_row in zip(found, truth)]
+    return float(np.mean(hits))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark rappel/latence des index FAISS")
+    parser.add_argument("--index", default="orange_faq_v2.index", help="Index exact de référence")
+    parser.add_argument("--metadata", default="metadata_v2.json")
+    parser.add_argument("--types", nargs="+", default=["hnsw", "ivf"], choices=INDEX_TYPES)
+    parser.add_argument("--codecs", nargs="+", default=["none"], choices=CODECS,
+                        help="Compression testée pour chaque type (flat+none = référence, ignoré)")
+    parser.add_argument("--rerank", action="store_true", help="Ajouter les variantes compressées avec tri exact")
+    parser.add_argument("--rerank-factor", type=int, default=4)
+    parser.add_argument("--pq-m", type=int)
+    parser.add_argument("--k", nargs="+", type=int, default=[1, 3, 5, 10])
+    parser.add_argument("--queries", type=int, default=500, help="Nombre de passages tirés comme requêtes")
+    parser.add_argument("--queries-file", help="Questions réelles (.txt une par ligne ou .json liste)")
+    parser.add_argument("--reencode", action="store_true", help="Ré-encoder le corpus au lieu de relire l'index")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--hnsw-m", type=int)
+    parser.add_argument("--ef-search", type=int)
+    parser.add_argument("--nlist", type=int)
+    parser.add_argument("--nprobe", type=int)
+    args = parser.parse_args()
+
+    with open(args.metadata, "r", encoding="utf-8") as f:
+        texts = json.load(f)
+
+    corpus = np.ascontiguousarray(load_corpus_vectors(args, texts), dtype=np.float32)
+    queries = np.ascontiguousarray(load_queries(args, corpus), dtype=np.float32)
+    k_max = min(max(args.k), len(corpus))
+    print(f"📊 Corpus: {len(corpus)} vecteurs (dim {corpus.shape[1]}), {len(queries)} requêtes, k max = {k_max}")
+
+    flat, _ = build_index(corpus, "flat")
+    truth, flat_latencies = time_searches(flat, queries, k_max)
+
+    overrides = {
+        key: value for key, value in {
+            "M": args.hnsw_m, "ef_search": args.ef_search, "nlist": args.nlist, "nprobe": args.nprobe,
+            "pq_m": args.pq_m
+        }.items() if value is not None
+    }
+
+    flat_bytes = index_memory_bytes(flat)
+    rows = [("flat", {}, 0.0, flat_bytes, {k: 1.0 for k in args.k}, flat_latencies)]
+
+    def measure(label, index, params, build_s):
+        found, latencies = time_searches(index, queries, k_max)
+        recalls = {k: recall_at(found, truth, min(k, k_max)) for k in args.k}
+        rows.append((label, params, build_s, index_memory_bytes(index), recalls, latencies))
+
+    for index_type in args.types:
+        for codec in args.codecs:
+            if index_type == "flat" and codec == "none":
+                continue
+            label = index_type if codec == "none" else f"{index_type}+{codec}"
+            started = time.perf_counter()
+            index, params = build_index(corpus, index_type, {**overrides, "codec": codec})
+            build_s = time.perf_counter() - started
+            measure(label, index, params, build_s)
+            if args.rerank and codec != "none":
+                # Les vecteurs float32 restent sur disque (mmap) et ne comptent pas dans la mémoire
+                measure(f"{label}+rr", RerankIndex(index, corpus, args.rerank_factor),
+                        {**params, "rerank": True, "rerank_factor": args.rerank_factor}, build_s)
+
+    width = 52 + 8 * len(args.k)
+    print("\n" + "=" * width)
+    header = (f"{'index':<16} {'build s':>8} {'p50 ms':>8} {'p99 ms':>8} {'Mo':>7} {'gain':>6} "
+              + " ".join(f"{'R@' + str(k):>7}" for k in args.k))
+    print(header)
+    print("-" * width)
+    for label, params, build_s, size_bytes, recalls, latencies in rows:
+        line = (
+            f"{label:<16} {build_s:>8.2f} {np.percentile(latencies, 50):>8.3f} {np.percentile(latencies, 99):>8.3f} "
+            f"{size_bytes / 1e6:>7.2f} {1 - size_bytes / flat_bytes:>6.1%} "
+            + " ".join(f"{recalls[k]:>7.3f}" for k in args.k)
+        )
+        print(line)
+    print("=" * width)
+    print("   gain = mémoire économisée par rapport à flat, R@k = rappel (1 - R@k = rappel perdu)")
+    for label, params, *_ in rows[1:]:
+        print(f"   {label}: {params}")
+
+
+if __name__ == "__main__":
+    main()
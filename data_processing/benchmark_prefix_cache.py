@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+benchmark_prefix_cache.py - Temps d'évaluation du prompt avec/sans réutilisation du préfixe
+
+Compare, sur le modèle GGUF local, le temps jusqu'au premier token (max_tokens=1,
+donc essentiellement l'évaluation du prompt) entre des appels llm(...) consécutifs,
+comme dans les serveurs (llama-cpp-python réutilise déjà le plus long préfixe
+commun avec le prompt précédent), et PrefixStateCache, qui restaure l'état KV
+du préambule <|system|>.
+
+Le gain n'existe que si les préambules alternent (--mode alternating: messages
+système fr/en du serveur vocal); avec un préambule unique (--mode single, cas
+de rag_server_pi.py), les deux doivent être équivalents.
+
+Usage (depuis la racine du projet):
+    python data_processing/benchmark_prefix_cache.py
+    python data_processing/benchmark_prefix_cache.py --mode single --runs 20
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent))
+from llama_prefix_cache import PrefixStateCache
+
+# Même préambule que rag_server_pi.py / rag_server_tts.py
+SYSTEM_PREFIX = """<|system|>
+Tu es un assistant virtuel pour Orange Burkina Faso. Réponds aux questions en te basant UNIQUEMENT sur le contexte fourni. Si l'information n'est pas dans le contexte, dis-le poliment.<|end|>
+<|user|>
+"""
+
+SYSTEM_PREFIX_EN = """<|system|>
+You are a virtual assistant for Orange Burkina Faso. Answer ONLY from the provided context. If the information is not in the context, say so politely.<|end|>
+<|user|>
+"""
+
+QUESTIONS = [
+    "Comment consulter mon solde?",
+    "Comment activer Orange Money?",
+    "Quels sont les forfaits internet disponibles?",
+    "Comment payer ma facture SONABEL?",
+    "Quel est le numéro du service client?",
+]
+
+
+def build_suffix(passages: list, question: str) -> str:
+    context = "\n\n".join(passages)
+    return f"""Contexte:
+{context}
+
+Question: {question}<|end|>
+<|assistant|>"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark réutilisation de l'état KV du préambule")
+    parser.add_argument("--model", default="tinyllama-1.1b-chat-v1.0.Q4_K_M.gguf")
+    parser.add_argument("--metadata", default="metadata_v2.json", help="Passages servant de contexte")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--passages", type=int, default=3, help="Passages par prompt (TOP_K)")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--ctx", type=int, default=2048)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mode", choices=("alternating", "single"), default="alternating",
+                        help="Préambules fr/en en alternance, ou préambule unique")
+    args = parser.parse_args()
+
+    from llama_cpp import Llama
+
+    with open(args.metadata, "r", encoding="utf-8") as f:
+        texts = json.load(f)
+    rng = random.Random(args.seed)
+    suffixes = [
+        build_suffix(rng.sample(texts, args.passages), QUESTIONS[run % len(QUESTIONS)])
+        for run in range(args.runs)
+    ]
+    if args.mode == "alternating":
+        prefixes = [(SYSTEM_PREFIX, SYSTEM_PREFIX_EN)[run % 2] for run in range(args.runs)]
+    else:
+        prefixes = [SYSTEM_PREFIX] * args.runs
+
+    print(f"🔄 Chargement de {args.model}...")
+    llm = Llama(
+        model_path=args.model,
+        n_ctx=args.ctx,
+        n_threads=args.threads,
+        n_batch=256,
+        n_gpu_layers=0,
+        use_mmap=True,
+        use_mlock=False,
+        verbose=False
+    )
+    prefix_tokens = len(llm.tokenize(SYSTEM_PREFIX.encode("utf-8"), add_bos=True, special=True))
+    prompt_tokens = [len(llm.tokenize((prefix + suffix).encode("utf-8"), add_bos=True, special=True))
+                     for prefix, suffix in zip(prefixes, suffixes)]
+
+    # Avant: appels consécutifs sans reset(), comme les serveurs
+    llm(prefixes[0] + suffixes[0], max_tokens=1)  # préchauffage
+    before = []
+    for prefix, suffix in zip(prefixes, suffixes):
+        started = time.perf_counter()
+        llm(prefix + suffix, max_tokens=1)
+        before.append((time.perf_counter() - started) * 1000)
+
+    # Après: état du préambule restauré quand il change, seuls contexte + question sont évalués
+    llm.reset()
+    cache = PrefixStateCache(llm)
+    for prefix in dict.fromkeys(prefixes):
+        cache.warm(prefix)
+    after = []
+    for prefix, suffix in zip(prefixes, suffixes):
+        started = time.perf_counter()
+        cache.complete(prefix, suffix, max_tokens=1)
+        after.append((time.perf_counter() - started) * 1000)
+
+    print("\n" + "=" * 60)
+    print(f"   Mode: {args.mode} / tokens du préambule: {prefix_tokens} / prompt moyen: {np.mean(prompt_tokens):.0f}")
+    print(f"{'':<22} {'moyenne ms':>12} {'p50 ms':>10} {'p95 ms':>10}")
+    print("-" * 60)
+    for label, values in (("llm() consécutifs", before), ("avec cache préfixe", after)):
+        print(f"{label:<22} {np.mean(values):>12.1f} {np.percentile(values, 50):>10.1f} {np.percentile(values, 95):>10.1f}")
+    print("=" * 60)
+    print(f"   Gain sur l'évaluation du prompt: {1 - np.mean(after) / np.mean(before):.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# context_packer.py
+# Assemblage du contexte RAG sous budget de tokens: les passages retrouvés
+# (souvent une seule phrase dans metadata_v2.json) sont dédoublonnés, les
+# phrases voisines d'une même page/document fusionnées, puis ajoutés par
+# score décroissant tant que le budget le permet.
+
+import math
+import re
+from threading import Lock
+
+from embedding_store import normalize_query
+
+WORD_RE = re.compile(r"\w+")
+PIECE_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimation du nombre de tokens pour un tokenizer BPE (Llama 3, TinyLlama)
+    en français: ~1.3 token par mot ou signe de ponctuation.
+    """
+    return math.ceil(len(PIECE_RE.findall(text)) * 1.3)
+
+
+def _shingles(text: str) -> set:
+    words = WORD_RE.findall(normalize_query(text))
+    if len(words) < 3:
+        return set(words)
+    return {" ".join(words[i:i + 3]) for i in range(len(words) - 2)}
+
+
+def _similarity(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+class ContextPacker:
+    """
+    pack(items) -> blocs de contexte. Chaque item est un passage du RetrievalEngine
+    ({"text", "score", ...}); "url" ou "doc_id" identifie sa source et "position"
+    son rang dans cette source (pour fusionner les phrases adjacentes).
+    """
+
+    def __init__(self, budget_tokens: int = 200, duplicate_threshold: float = 0.8,
+                 min_words: int = 3, count_tokens=estimate_tokens):
+        self.budget_tokens = budget_tokens
+        self.duplicate_threshold = duplicate_threshold
+        self.min_words = min_words
+        self.count_tokens = count_tokens
+        self.lock = Lock()
+        self.stats_counters = {"calls": 0, "candidates": 0, "dropped": 0, "merged": 0,
+                               "over_budget": 0, "tokens": 0}
+
+    def _deduplicate(self, items: list) -> tuple:
+        kept, kept_shingles, dropped = [], [], 0
+        for item in sorted(items, key=lambda entry: entry["score"], reverse=True):
+            # Titres de page et fragments trop courts ("Les services et offres mobile.")
+            if len(WORD_RE.findall(item["text"])) < self.min_words:
+                dropped += 1
+                continue
+            shingles = _shingles(item["text"])
+            if any(_similarity(shingles, other) >= self.duplicate_threshold for other in kept_shingles):
+                dropped += 1
+                continue
+            kept.append(item)
+            kept_shingles.append(shingles)
+        return kept, dropped
+
+    @staticmethod
+    def _merge_adjacent(items: list) -> tuple:
+        """Regroupe les passages consécutifs d'une même source en un bloc, dans l'ordre du texte"""
+        by_source, blocks, merged = {}, [], 0
+        for item in items:
+            source = item.get("url") or item.get("doc_id")
+            if source is None or item.get("position") is None:
+                blocks.append({**item, "parts": 1})
+                continue
+            by_source.setdefault(source, []).append(item)
+
+        for group in by_source.values():
+            group.sort(key=lambda entry: entry["position"])
+            current = None
+            for item in group:
+                if current is not None and item["position"] == current["last_position"] + 1:
+                    current["text"] = f"{current['text']} {item['text']}"
+                    current["score"] = max(current["score"], item["score"])
+                    current["last_position"] = item["position"]
+                    current["parts"] += 1
+                    merged += 1
+                    continue
+                current = {**item, "last_position": item["position"], "parts": 1}
+                blocks.append(current)
+        for block in blocks:
+            block.pop("last_position", None)
+        return blocks, merged
+
+    def pack(self, items: list) -> list:
+        """Blocs retenus, par score décroissant, dont le total tient dans le budget (le meilleur bloc est toujours gardé)"""
+        if not items:
+            return []
+        kept, dropped = self._deduplicate(items)
+        if not kept:
+            kept = [max(items, key=lambda entry: entry["score"])]
+        blocks, merged = self._merge_adjacent(kept)
+
+        packed, used, over_budget = [], 0, 0
+        for block in sorted(blocks, key=lambda entry: entry["score"], reverse=True):
+            tokens = self.count_tokens(block["text"])
+            if used + tokens > self.budget_tokens and packed:
+                over_budget += 1
+                continue  # un bloc plus court peut encore tenir
+            packed.append({**block, "tokens": tokens})
+            used += tokens
+
+        with self.lock:
+            counters = self.stats_counters
+            counters["calls"] += 1
+            counters["candidates"] += len(items)
+            counters["dropped"] += dropped
+            counters["merged"] += merged
+            counters["over_budget"] += over_budget
+            counters["tokens"] += used
+        return packed
+
+    def stats(self) -> dict:
+        with self.lock:
+            counters = dict(self.stats_counters)
+        calls = counters["calls"]
+        return {
+            "budget_tokens": self.budget_tokens,
+            **counters,
+            "avg_tokens": round(counters["tokens"] / calls, 1) if calls else None
+        }
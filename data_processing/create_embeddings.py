@@ -1,9 +1,20 @@
+import argparse
 import json
+import sys
+from pathlib import Path
 from tqdm import tqdm
 from sentence_transformers import SentenceTransformer
-import faiss
 import numpy as np
 
+sys.path.insert(0, str(Path(__file__).parent))
+from index_factory import CODECS, INDEX_TYPES, build_index, write_index
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat")
+parser.add_argument("--codec", choices=CODECS, default="none")
+parser.add_argument("--rerank", action="store_true")
+args = parser.parse_args()
+
 # Fichier contenant les paragraphes (créé par ton script précédent)
 input_file = "orange_services_paragraphs.json"
 index_file = "orange_faq.index"
@@ -24,13 +35,11 @@ embeddings = model.encode(texts, show_progress_bar=True, convert_to_numpy=True)
 # Normalisation pour améliorer la recherche cosine
 embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
 
-# Créer un index FAISS
-dimension = embeddings.shape[1]
-index = faiss.IndexFlatIP(dimension)
-index.add(embeddings)
+# Créer un index FAISS (flat = exact, hnsw/ivf = approximatif, codec = compression)
+index, index_params = build_index(embeddings, args.index_type, {"codec": args.codec, "rerank": args.rerank})
 
-# Sauvegarder l’index et les métadonnées
-faiss.write_index(index, index_file)
+# Sauvegarder l’index (+ paramètres) et les métadonnées
+write_index(index, index_file, index_params, embeddings)
 
 with open(metadata_file, "w") as f:
     json.dump(texts, f, ensure_ascii=False, indent=2)
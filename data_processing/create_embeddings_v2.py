@@ -4,16 +4,53 @@
 create_embeddings_v2.py - Création d'embeddings à partir des données nettoyées v2
 """
 
+import argparse
 import json
+import sys
+from pathlib import Path
 from tqdm import tqdm
 from sentence_transformers import SentenceTransformer
-import faiss
 import numpy as np
 
+sys.path.insert(0, str(Path(__file__).parent))
+from index_factory import CODECS, INDEX_TYPES, build_index, index_memory_bytes, write_index
+
+# Options de construction de l'index
+parser = argparse.ArgumentParser(description="Création des embeddings et de l'index FAISS v2")
+parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat",
+                    help="flat = exact, hnsw/ivf = recherche approximative (gros corpus)")
+parser.add_argument("--hnsw-m", type=int, help="HNSW: voisins par nœud (défaut 32)")
+parser.add_argument("--ef-construction", type=int, help="HNSW: largeur à la construction (défaut 200)")
+parser.add_argument("--ef-search", type=int, help="HNSW: largeur à la recherche (défaut 64)")
+parser.add_argument("--nlist", type=int, help="IVF: nombre de listes (défaut: automatique)")
+parser.add_argument("--nprobe", type=int, help="IVF: listes visitées par requête (défaut 8)")
+parser.add_argument("--codec", choices=CODECS, help="Compression des vecteurs: fp16, sq8 ou pq (défaut: none)")
+parser.add_argument("--pq-m", type=int, help="PQ: sous-quantifieurs, diviseur de la dimension (défaut 48)")
+parser.add_argument("--pq-nbits", type=int, help="PQ: bits par code (défaut 8)")
+parser.add_argument("--rerank", action="store_true", help="Tri exact de la présélection (vecteurs float32 sur disque)")
+parser.add_argument("--rerank-factor", type=int, help="Taille de la présélection = k * facteur (défaut 4)")
+args = parser.parse_args()
+
+index_params = {
+    key: value for key, value in {
+        "M": args.hnsw_m,
+        "ef_construction": args.ef_construction,
+        "ef_search": args.ef_search,
+        "nlist": args.nlist,
+        "nprobe": args.nprobe,
+        "codec": args.codec,
+        "pq_m": args.pq_m,
+        "pq_nbits": args.pq_nbits,
+        "rerank": args.rerank or None,
+        "rerank_factor": args.rerank_factor,
+    }.items() if value is not None
+}
+
 # Fichiers
 input_file = "orange_services_clean_v2.json"
 index_file = "orange_faq_v2.index"
 metadata_file = "metadata_v2.json"
+sources_file = "metadata_v2_sources.json"
 
 print("=" * 60)
 print("🔧 CRÉATION DES EMBEDDINGS - VERSION 2 (DONNÉES PROPRES)")
@@ -30,7 +67,8 @@ print(f"\n📂 Chargement de {input_file}...")
 with open(input_file, "r", encoding="utf-8") as f:
     data = json.load(f)
 
-texts = [item["text"] for item in data if "text" in item and len(item["text"]) > 10]
+items = [item for item in data if "text" in item and len(item["text"]) > 10]
+texts = [item["text"] for item in items]
 
 print(f"✅ {len(texts)} paragraphes chargés")
 print(f"   Longueur moyenne: {sum(len(t) for t in texts) / len(texts):.0f} caractères")
@@ -46,24 +84,27 @@ print("\n🔧 Normalisation des embeddings...")
 embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
 print("✅ Embeddings normalisés")
 
-# Créer un index FAISS (IndexFlatIP = Inner Product, pour cosine similarity)
-print("\n📊 Création de l'index FAISS...")
+# Créer un index FAISS en produit scalaire (cosine similarity sur vecteurs normalisés)
+print(f"\n📊 Création de l'index FAISS ({args.index_type})...")
 dimension = embeddings.shape[1]
 print(f"   Dimension: {dimension}")
-index = faiss.IndexFlatIP(dimension)
-index.add(embeddings)
+index, index_params = build_index(embeddings, args.index_type, index_params)
 print(f"✅ Index créé avec {index.ntotal} vecteurs")
+print(f"   Paramètres: {index_params}")
+print(f"   Mémoire: {index_memory_bytes(index) / 1e6:.2f} Mo (float32: {embeddings.nbytes / 1e6:.2f} Mo)")
 
-# Sauvegarder l'index
+# Sauvegarder l'index (+ paramètres dans {index_file}.params.json, vecteurs float32 si --rerank)
 print(f"\n💾 Sauvegarde de l'index dans {index_file}...")
-faiss.write_index(index, index_file)
+write_index(index, index_file, index_params, embeddings)
 print("✅ Index sauvegardé")
 
 # Sauvegarder les métadonnées (textes)
 print(f"\n💾 Sauvegarde des métadonnées dans {metadata_file}...")
 with open(metadata_file, "w", encoding="utf-8") as f:
     json.dump(texts, f, ensure_ascii=False, indent=2)
-print("✅ Métadonnées sauvegardées")
+with open(sources_file, "w", encoding="utf-8") as f:
+    json.dump([item.get("url") for item in items], f, ensure_ascii=False)
+print(f"✅ Métadonnées sauvegardées (URL des passages dans {sources_file})")
 
 # Statistiques finales
 print("\n" + "=" * 60)
@@ -71,6 +112,7 @@ print("📊 STATISTIQUES FINALES")
 print("=" * 60)
 print(f"   Paragraphes indexés: {len(texts)}")
 print(f"   Dimension des vecteurs: {dimension}")
+print(f"   Type d'index: {index_params['factory']}")
 print(f"   Taille de l'index: {index.ntotal} vecteurs")
 print(f"   Fichier index: {index_file}")
 print(f"   Fichier metadata: {metadata_file}")
@@ -0,0 +1,267 @@
+# embedding_store.py
+# Cache disque des embeddings, adressé par le contenu:
+# une matrice float16/float32 mappée en mémoire + une table hash -> ligne.
+# Un même texte n'est donc encodé qu'une seule fois par modèle d'embeddings.
+
+import hashlib
+import json
+import os
+import re
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+
+import numpy as np
+
+
+class EmbeddingStore:
+    """Stockage persistant des embeddings indexé par sha1(texte), un dossier par modèle"""
+
+    def __init__(self, directory, model_name: str, dimension: int, dtype: str = "float16"):
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        self.directory = Path(directory) / slug
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.model_name = model_name
+        self.dimension = dimension
+        self.dtype = np.dtype(dtype)
+        self.matrix_path = self.directory / f"vectors.{self.dtype.name}"
+        self.table_path = self.directory / "rows.json"
+        self.lock = Lock()
+        self.rows = {}
+        self.hits = 0
+        self.misses = 0
+        self._matrix = None
+        self._load()
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    @property
+    def _row_bytes(self) -> int:
+        return self.dimension * self.dtype.itemsize
+
+    def _load(self):
+        if self.table_path.exists():
+            try:
+                self.rows = json.loads(self.table_path.read_text(encoding="utf-8"))
+            except Exception as e:
+                print(f"⚠️  Table d'embeddings illisible ({self.table_path}): {e}")
+                self.rows = {}
+
+        # Aligner la table et la matrice après un arrêt brutal entre les deux écritures
+        stored_size = self.matrix_path.stat().st_size if self.matrix_path.exists() else 0
+        stored_rows = stored_size // self._row_bytes
+        self.rows = {key: row for key, row in self.rows.items() if row < stored_rows}
+        if sorted(self.rows.values()) != list(range(len(self.rows))):
+            # Table incohérente: repartir d'un cache vide plutôt que de servir de faux vecteurs
+            self.rows = {}
+        expected_size = len(self.rows) * self._row_bytes
+        if stored_size != expected_size:
+            with open(self.matrix_path, "ab") as f:
+                f.truncate(expected_size)
+            self._save_table()
+
+    def _save_table(self):
+        tmp_path = self.table_path.with_suffix(".json.tmp")
+        tmp_path.write_text(json.dumps(self.rows), encoding="utf-8")
+        os.replace(tmp_path, self.table_path)
+
+    def _open_matrix(self):
+        count = len(self.rows)
+        if count == 0:
+            return None
+        if self._matrix is None or self._matrix.shape[0] != count:
+            self._matrix = np.memmap(self.matrix_path, dtype=self.dtype, mode="r", shape=(count, self.dimension))
+        return self._matrix
+
+    def get_or_encode(self, texts: list, encode_fn) -> np.ndarray:
+        """
+        Retourne les embeddings (float32) de `texts` dans l'ordre.
+        `encode_fn(liste_de_textes)` n'est appelé que pour les textes jamais vus.
+        """
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+
+        hashes = [self.text_hash(text) for text in texts]
+        result = np.empty((len(texts), self.dimension), dtype=np.float32)
+        missing = {}  # hash -> texte
+        with self.lock:
+            matrix = self._open_matrix()
+            for position, (key, text) in enumerate(zip(hashes, texts)):
+                row = self.rows.get(key)
+                if row is not None:
+                    result[position] = matrix[row]
+                else:
+                    missing.setdefault(key, text)
+            self.misses += len(missing)
+            self.hits += len(texts) - len(missing)
+
+        if not missing:
+            return result
+
+        # Encodage hors verrou pour ne pas bloquer les autres threads
+        encoded = np.asarray(encode_fn(list(missing.values())), dtype=np.float32)
+        fresh = dict(zip(missing, encoded))
+        for position, key in enumerate(hashes):
+            vector = fresh.get(key)
+            if vector is not None:
+                result[position] = vector
+
+        with self.lock:
+            # Un autre thread a pu encoder les mêmes textes entre-temps
+            new_keys = [key for key in missing if key not in self.rows]
+            if new_keys:
+                with open(self.matrix_path, "ab") as f:
+                    f.write(np.array([fresh[key] for key in new_keys]).astype(self.dtype).tobytes())
+                next_row = len(self.rows)
+                for offset, key in enumerate(new_keys):
+                    self.rows[key] = next_row + offset
+                self._save_table()
+        return result
+
+    def compact(self, keep_texts: list):
+        """Réécrit la matrice en ne gardant que les textes encore utilisés"""
+        keep = {self.text_hash(text) for text in keep_texts}
+        with self.lock:
+            if keep >= set(self.rows):
+                return 0
+            matrix = self._open_matrix()
+            kept = [key for key in self.rows if key in keep]
+            vectors = np.array([matrix[self.rows[key]] for key in kept], dtype=self.dtype)
+            removed = len(self.rows) - len(kept)
+            self._matrix = None
+            tmp_path = self.matrix_path.with_suffix(".tmp")
+            tmp_path.write_bytes(vectors.tobytes())
+            os.replace(tmp_path, self.matrix_path)
+            self.rows = {key: row for row, key in enumerate(kept)}
+            self._save_table()
+            return removed
+
+    def stats(self) -> dict:
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "model": self.model_name,
+                "dtype": self.dtype.name,
+                "rows": len(self.rows),
+                "size_bytes": len(self.rows) * self._row_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else None
+            }
+
+
+def normalize_query(text: str) -> str:
+    """Forme canonique d'une question: sans accents, casse repliée, espaces réduits"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return re.sub(r"\s+", " ", stripped.casefold()).strip()
+
+
+class QueryEmbeddingCache:
+    """
+    Cache LRU borné question normalisée -> embedding, partagé entre les threads.
+    C'est la forme normalisée qui est encodée: le modèle MiniLM (uncased) retire
+    déjà accents et majuscules, les variantes d'une même question sont donc identiques.
+    """
+
+    def __init__(self, model_name: str, max_entries: int = 2048, persist_path=None):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.persist_path = Path(persist_path) if persist_path else None
+        self.lock = Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if self.persist_path:
+            self.load()
+
+    def get_or_encode(self, query: str, encode_fn) -> np.ndarray:
+        """Retourne l'embedding (1, d) de la question; `encode_fn` reçoit une liste de textes"""
+        key = normalize_query(query)
+        with self.lock:
+            vector = self.entries.get(key)
+            if vector is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return vector
+
+        # Encodage hors verrou pour ne pas bloquer les autres threads
+        vector = np.asarray(encode_fn([key]), dtype=np.float32)
+        with self.lock:
+            self.misses += 1
+            self._put(key, vector)
+        return vector
+
+    def get_or_encode_many(self, queries: list, encode_fn) -> np.ndarray:
+        """Embeddings (n, d) de plusieurs questions: un seul appel `encode_fn` pour toutes les absentes"""
+        keys = [normalize_query(query) for query in queries]
+        found = {}
+        with self.lock:
+            for key in keys:
+                vector = self.entries.get(key)
+                if vector is not None:
+                    self.entries.move_to_end(key)
+                    found[key] = vector
+            self.hits += sum(1 for key in keys if key in found)
+
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        if missing:
+            encoded = np.asarray(encode_fn(missing), dtype=np.float32)
+            with self.lock:
+                for key, vector in zip(missing, encoded):
+                    vector = vector.reshape(1, -1)
+                    self.misses += 1
+                    self._put(key, vector)
+                    found[key] = vector
+        return np.vstack([found[key] for key in keys])
+
+    def _put(self, key: str, vector: np.ndarray):
+        self.entries[key] = vector
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def load(self):
+        if not self.persist_path or not self.persist_path.exists():
+            return
+        try:
+            with np.load(self.persist_path, allow_pickle=False) as data:
+                if str(data["model"]) != self.model_name:
+                    print(f"⚠️  Cache de requêtes ignoré (modèle différent: {data['model']})")
+                    return
+                keys = json.loads(str(data["keys"]))
+                vectors = data["vectors"]
+            with self.lock:
+                for key, vector in zip(keys, vectors):
+                    self._put(key, vector.reshape(1, -1).astype(np.float32))
+            print(f"✅ Cache de requêtes chargé: {len(self.entries)} entrées")
+        except Exception as e:
+            print(f"⚠️  Impossible de charger {self.persist_path}: {e}")
+
+    def save(self):
+        if not self.persist_path:
+            return
+        with self.lock:
+            keys = list(self.entries.keys())
+            vectors = np.vstack(list(self.entries.values())) if keys else np.zeros((0, 0), dtype=np.float32)
+        try:
+            tmp_path = self.persist_path.with_suffix(".tmp.npz")
+            np.savez(tmp_path, model=self.model_name, keys=json.dumps(keys), vectors=vectors)
+            os.replace(tmp_path, self.persist_path)
+        except Exception as e:
+            print(f"⚠️  Impossible de sauvegarder {self.persist_path}: {e}")
+
+    def stats(self) -> dict:
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else None,
+                "persistent": self.persist_path is not None
+            }
@@ -0,0 +1,202 @@
+# index_factory.py
+# Construction et chargement des index FAISS (exact ou approximatif, vecteurs
+# complets ou compressés). Les paramètres de construction/recherche sont stockés
+# à côté de l'index dans "<index>.params.json" pour que les serveurs chargent
+# n'importe quel type.
+
+import json
+import math
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "hnsw", "ivf")
+
+# Stockage des vecteurs: none = float32, fp16 = 2 octets/dim, sq8 = 1 octet/dim,
+# pq = pq_m octets par vecteur (pq_nbits = 8)
+CODECS = ("none", "fp16", "sq8", "pq")
+
+COMMON_PARAMS = {
+    "codec": "none",
+    # PQ: nombre de sous-quantifieurs (doit diviser la dimension) et bits par code
+    "pq_m": 48,
+    "pq_nbits": 8,
+    # rerank: tri exact de la présélection (k * rerank_factor) sur les vecteurs float32
+    # gardés sur disque dans "<index>.vectors.npy" et lus en mmap (hors RAM)
+    "rerank": False,
+    "rerank_factor": 4,
+}
+
+DEFAULT_PARAMS = {
+    "flat": {},
+    # M: voisins par nœud du graphe, ef_search: largeur de la recherche (rappel vs latence)
+    "hnsw": {"M": 32, "ef_construction": 200, "ef_search": 64},
+    # nlist: nombre de listes (0 = automatique), nprobe: listes visitées par requête
+    "ivf": {"nlist": 0, "nprobe": 8},
+}
+
+
+def params_path(index_file) -> Path:
+    return Path(f"{index_file}.params.json")
+
+
+def vectors_path(index_file) -> Path:
+    return Path(f"{index_file}.vectors.npy")
+
+
+def _auto_nlist(n_vectors: int) -> int:
+    # ~4*sqrt(n) listes, en gardant au moins 39 vecteurs par centroïde pour l'entraînement
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39))
+
+
+def _codec_string(params: dict, dimension: int) -> str:
+    codec = params["codec"]
+    if codec not in CODECS:
+        raise ValueError(f"Codec inconnu: {codec} (attendu: {', '.join(CODECS)})")
+    if codec == "none":
+        return "Flat"
+    if codec == "fp16":
+        return "SQfp16"
+    if codec == "sq8":
+        return "SQ8"
+    pq_m = int(params["pq_m"])
+    if dimension % pq_m:
+        raise ValueError(f"pq_m={pq_m} doit diviser la dimension {dimension}")
+    return f"PQ{pq_m}x{int(params['pq_nbits'])}"
+
+
+def factory_string(index_type: str, dimension: int, params: dict) -> str:
+    """Description faiss.index_factory, ex: "HNSW32_SQ8", "IVF39,PQ48x8", "SQfp16" """
+    codec = _codec_string(params, dimension)
+    if index_type == "flat":
+        return codec
+    if index_type == "hnsw":
+        graph = f"HNSW{int(params['M'])}"
+        return graph if codec == "Flat" else f"{graph}_{codec}"
+    return f"IVF{int(params['nlist'])},{codec}"
+
+
+def _effective_params(index_type: str, params: dict | None) -> dict:
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Type d'index inconnu: {index_type} (attendu: {', '.join(INDEX_TYPES)})")
+    return {**COMMON_PARAMS, **DEFAULT_PARAMS[index_type], **(params or {})}
+
+
+def new_index(dimension: int, index_type: str = "flat", params: dict | None = None,
+              train_vectors: np.ndarray | None = None):
+    """
+    Crée un index vide, entraîné si le type/codec l'exige (IVF, SQ8, PQ).
+    Retourne (index, paramètres effectifs).
+    """
+    effective = _effective_params(index_type, params)
+    if index_type == "ivf":
+        if train_vectors is None:
+            raise ValueError("Un index IVF doit être entraîné: train_vectors manquant")
+        effective["nlist"] = int(effective["nlist"]) or _auto_nlist(len(train_vectors))
+
+    description = factory_string(index_type, dimension, effective)
+    index = faiss.index_factory(dimension, description, faiss.METRIC_INNER_PRODUCT)
+    if index_type == "hnsw":
+        faiss.downcast_index(index).hnsw.efConstruction = int(effective["ef_construction"])
+    if not index.is_trained:
+        if train_vectors is None:
+            raise ValueError(f"L'index {description} doit être entraîné: train_vectors manquant")
+        index.train(np.ascontiguousarray(train_vectors, dtype=np.float32))
+
+    apply_search_params(index, index_type, effective)
+    return index, {"type": index_type, "dimension": dimension, "factory": description, **effective}
+
+
+def build_index(embeddings: np.ndarray, index_type: str = "flat", params: dict | None = None):
+    """
+    Construit un index produit scalaire (vecteurs normalisés = cosinus).
+    Retourne (index, paramètres effectifs).
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    index, effective = new_index(embeddings.shape[1], index_type, params, train_vectors=embeddings)
+    index.add(embeddings)
+    return index, effective
+
+
+def apply_search_params(index, index_type: str, params: dict):
+    """Applique les paramètres de recherche (non sérialisés par FAISS)"""
+    space = faiss.ParameterSpace()
+    if index_type == "hnsw" and "ef_search" in params:
+        space.set_index_parameter(index, "efSearch", int(params["ef_search"]))
+    elif index_type == "ivf" and "nprobe" in params:
+        space.set_index_parameter(index, "nprobe", int(params["nprobe"]))
+
+
+def index_memory_bytes(index) -> int:
+    """Taille sérialisée de l'index, proche de son empreinte en RAM"""
+    if isinstance(index, RerankIndex):
+        index = index.index
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def write_index(index, index_file, params: dict, embeddings: np.ndarray | None = None):
+    faiss.write_index(index, str(index_file))
+    params_path(index_file).write_text(json.dumps(params, indent=2), encoding="utf-8")
+    if params.get("rerank"):
+        if embeddings is None:
+            raise ValueError("rerank activé: les vecteurs float32 doivent être sauvegardés avec l'index")
+        np.save(vectors_path(index_file), np.ascontiguousarray(embeddings, dtype=np.float32))
+
+
+def read_params(index_file) -> dict:
+    path = params_path(index_file)
+    if not path.exists():
+        return {"type": "flat"}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+class RerankIndex:
+    """
+    Index compressé + vecteurs float32 en mmap: la recherche présélectionne
+    k * factor candidats puis les retrie par produit scalaire exact.
+    Expose search/ntotal/d/reconstruct_n comme un index FAISS.
+    """
+
+    def __init__(self, index, vectors: np.ndarray, factor: int = 4):
+        self.index = index
+        self.vectors = vectors
+        self.factor = max(1, int(factor))
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    @property
+    def d(self) -> int:
+        return self.index.d
+
+    def reconstruct_n(self, start: int, count: int) -> np.ndarray:
+        return np.asarray(self.vectors[start:start + count], dtype=np.float32)
+
+    def search(self, queries: np.ndarray, k: int):
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        shortlist = min(k * self.factor, self.ntotal)
+        _, candidates = self.index.search(queries, shortlist)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        for row, (query, row_ids) in enumerate(zip(queries, candidates)):
+            row_ids = row_ids[row_ids >= 0]
+            exact = np.asarray(self.vectors[row_ids], dtype=np.float32) @ query
+            order = np.argsort(-exact)[:k]
+            scores[row, :len(order)] = exact[order]
+            ids[row, :len(order)] = row_ids[order]
+        return scores, ids
+
+
+def load_index(index_file):
+    """Charge un index quel que soit son type et applique ses paramètres de recherche"""
+    index = faiss.read_index(str(index_file))
+    params = read_params(index_file)
+    apply_search_params(index, params.get("type", "flat"), params)
+    if params.get("rerank"):
+        path = vectors_path(index_file)
+        if path.exists():
+            return RerankIndex(index, np.load(path, mmap_mode="r"), params.get("rerank_factor", 4))
+        print(f"⚠️  {path} absent: recherche sans tri exact")
+    return index
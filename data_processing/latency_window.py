@@ -0,0 +1,33 @@
+# latency_window.py
+# Fenêtre glissante de mesures de latence (secondes) pour /admin/metrics:
+# dernière valeur, p50, p95 sur les N derniers appels.
+
+from collections import deque
+from threading import Lock
+
+import numpy as np
+
+
+class LatencyWindow:
+    def __init__(self, max_samples: int = 500):
+        self.lock = Lock()
+        self.samples = deque(maxlen=max_samples)
+        self.count = 0
+
+    def add(self, seconds: float):
+        with self.lock:
+            self.samples.append(seconds)
+            self.count += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            samples = np.array(self.samples)
+            count = self.count
+        if not len(samples):
+            return {"count": count, "last_s": None, "p50_s": None, "p95_s": None}
+        return {
+            "count": count,
+            "last_s": round(float(samples[-1]), 3),
+            "p50_s": round(float(np.percentile(samples, 50)), 3),
+            "p95_s": round(float(np.percentile(samples, 95)), 3)
+        }
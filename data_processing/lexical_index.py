@@ -0,0 +1,145 @@
+# lexical_index.py
+# Index inversé BM25 en mémoire, complémentaire des embeddings: les codes USSD
+# ("*144#", "*160#"), numéros courts ("127") et noms de produits ("SONABEL",
+# "Max it") sont mal représentés par MiniLM mais retrouvés mot pour mot ici.
+# Les documents sont identifiés par (nom d'index, id FAISS) pour être fusionnés
+# avec les résultats vectoriels du RetrievalEngine.
+
+import heapq
+import math
+import re
+from collections import Counter
+from threading import Lock
+
+from embedding_store import normalize_query
+
+# Codes USSD/numéros ("*144*2#", "127") d'abord, puis mots alphanumériques
+TOKEN_RE = re.compile(r"\*?\d+(?:\*\d+)*#?|\w+")
+
+STOPWORDS = frozenset("""
+a au aux avec ce ces cette comment dans de des du elle en est et il je la le les leur lui ma mais me
+mes moi mon ne nous on ou par pas pour qu que quel quelle qui sa se ses son sur ta te tes toi ton tu
+un une vos votre vous y
+an and are can do does for how i is my of on or the to what with you your
+""".split())
+
+
+def tokenize(text: str) -> list:
+    """Termes normalisés (sans accents, casse repliée); un code "*144#" donne aussi "144" """
+    tokens = []
+    for token in TOKEN_RE.findall(normalize_query(text)):
+        if token[0] == "*" or token[-1] == "#":
+            tokens.append(token)
+            tokens.extend(part for part in re.split(r"[*#]", token) if part)
+        elif token not in STOPWORDS and (len(token) > 1 or token.isdigit()):
+            tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """Index BM25 incrémental: ajout/suppression de documents sans reconstruction"""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.lock = Lock()
+        self.postings = {}  # terme -> {clé document: fréquence}
+        self.doc_terms = {}  # clé document -> Counter des termes (pour la suppression)
+        self.doc_lengths = {}
+        self.total_length = 0
+
+    def add(self, key, text: str):
+        self.add_many([(key, text)])
+
+    def add_many(self, documents):
+        """documents: itérable de (clé, texte), clé = (nom d'index, id FAISS)"""
+        analysed = [(key, Counter(tokenize(text))) for key, text in documents]
+        with self.lock:
+            for key, terms in analysed:
+                self._remove(key)
+                self.doc_terms[key] = terms
+                length = sum(terms.values())
+                self.doc_lengths[key] = length
+                self.total_length += length
+                for term, frequency in terms.items():
+                    self.postings.setdefault(term, {})[key] = frequency
+
+    def remove(self, keys):
+        with self.lock:
+            for key in keys:
+                self._remove(key)
+
+    def remove_index(self, name: str):
+        """Retire tous les documents d'un index nommé"""
+        with self.lock:
+            for key in [key for key in self.doc_terms if key[0] == name]:
+                self._remove(key)
+
+    def _remove(self, key):
+        terms = self.doc_terms.pop(key, None)
+        if terms is None:
+            return
+        self.total_length -= self.doc_lengths.pop(key)
+        for term in terms:
+            documents = self.postings.get(term)
+            if documents is None:
+                continue
+            documents.pop(key, None)
+            if not documents:
+                del self.postings[term]
+
+    def search(self, query: str, top_k: int, names=None) -> list:
+        """[(clé, score BM25)] par score décroissant, limité aux index `names` si fourni"""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        scores = {}
+        with self.lock:
+            count = len(self.doc_lengths)
+            if count == 0:
+                return []
+            average_length = self.total_length / count
+            for term in terms:
+                documents = self.postings.get(term)
+                if not documents:
+                    continue
+                idf = math.log(1 + (count - len(documents) + 0.5) / (len(documents) + 0.5))
+                for key, frequency in documents.items():
+                    if names is not None and key[0] not in names:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[key] / average_length)
+                    scores[key] = scores.get(key, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return heapq.nlargest(top_k, scores.items(), key=lambda entry: entry[1])
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"documents": len(self.doc_lengths), "terms": len(self.postings)}
+
+
+def fuse(vector_hits: list, lexical_hits: list, top_k: int, method: str = "rrf",
+         vector_weight: float = 0.7, rrf_k: int = 60) -> list:
+    """
+    Fusion de deux listes de passages déjà triées (chaque passage a "score").
+    rrf: somme des 1/(rrf_k + rang); weighted: vector_weight * cosinus + (1 - vector_weight) * BM25/max.
+    Le score fusionné remplace "score"; "vector_score" et "bm25_score" gardent les originaux.
+    """
+    fused = {}
+
+    def entry_for(item):
+        key = re.sub(r"\s+", " ", item["text"]).strip().lower()
+        if key not in fused:
+            fused[key] = {**item, "score": 0.0, "vector_score": None, "bm25_score": None}
+        return fused[key]
+
+    top_bm25 = max((item["score"] for item in lexical_hits), default=0.0) or 1.0
+    for rank, item in enumerate(vector_hits):
+        entry = entry_for(item)
+        entry["vector_score"] = item["score"]
+        entry["score"] += 1 / (rrf_k + rank + 1) if method == "rrf" else vector_weight * item["score"]
+    for rank, item in enumerate(lexical_hits):
+        entry = entry_for(item)
+        if entry["bm25_score"] is not None:
+            continue  # même texte présent dans deux index: garder le meilleur rang
+        entry["bm25_score"] = item["score"]
+        entry["score"] += 1 / (rrf_k + rank + 1) if method == "rrf" else (1 - vector_weight) * item["score"] / top_bm25
+    return heapq.nlargest(top_k, fused.values(), key=lambda item: item["score"])
@@ -0,0 +1,71 @@
+# llama_prefix_cache.py
+# Réutilisation de l'état KV de llama.cpp pour le préambule fixe des prompts
+# (<|system|> ... <|user|>). Le préambule est évalué une seule fois puis son
+# état est sauvegardé (save_state); chaque requête restaure cet état
+# (load_state) et llama-cpp-python n'évalue plus que le contexte et la question,
+# grâce à sa détection du plus long préfixe commun avec les tokens déjà en cache.
+#
+# Cette détection suffit quand le préfixe ne change pas d'une requête à l'autre:
+# l'état n'est restauré que si le préfixe diffère du précédent (ex: messages
+# système fr/en qui alternent dans LlamaCppBackend du serveur vocal).
+
+from collections import OrderedDict
+from threading import Lock
+
+
+class PrefixStateCache:
+    """États llama.cpp sauvegardés après un préfixe de prompt (LRU de `max_prefixes` préfixes)"""
+
+    def __init__(self, llm, max_prefixes: int = 4):
+        self.llm = llm
+        self.max_prefixes = max_prefixes
+        self.states = OrderedDict()  # préfixe -> LlamaState
+        self.lock = Lock()  # un contexte llama.cpp n'est pas réentrant
+        self.current = None  # préfixe en tête du cache KV de llm
+        self.hits = 0
+        self.misses = 0
+        self.reused = 0
+
+    def _restore(self, prefix: str):
+        if prefix == self.current:
+            # Déjà en tête du cache KV: llama-cpp-python le réutilise sans copie d'état
+            self.reused += 1
+            return
+        state = self.states.get(prefix)
+        if state is not None:
+            self.states.move_to_end(prefix)
+            self.llm.load_state(state)
+            self.current = prefix
+            self.hits += 1
+            return
+        # Même tokenisation que create_completion (BOS + tokens spéciaux)
+        tokens = self.llm.tokenize(prefix.encode("utf-8"), add_bos=True, special=True)
+        self.llm.reset()
+        self.llm.eval(tokens)
+        self.states[prefix] = self.llm.save_state()
+        self.current = prefix
+        self.misses += 1
+        while len(self.states) > self.max_prefixes:
+            self.states.popitem(last=False)
+
+    def warm(self, prefix: str):
+        """Évalue le préfixe au démarrage pour que la première requête en profite aussi"""
+        with self.lock:
+            self._restore(prefix)
+
+    def complete(self, prefix: str, suffix: str, **params) -> dict:
+        """Équivalent de llm(prefix + suffix, **params), sans réévaluer le préfixe"""
+        with self.lock:
+            self._restore(prefix)
+            return self.llm(prefix + suffix, **params)
+
+    def stream(self, prefix: str, suffix: str, **params):
+        """Fragments de completion (stream=True), verrou tenu jusqu'à la fin du flux"""
+        with self.lock:
+            self._restore(prefix)
+            for chunk in self.llm(prefix + suffix, stream=True, **params):
+                yield chunk
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"prefixes": len(self.states), "hits": self.hits, "misses": self.misses, "reused": self.reused}
@@ -0,0 +1,519 @@
+# llm_backends.py
+# Couche de génération interchangeable: Groq, OpenAI, Anthropic (cloud) et
+# modèle GGUF local (llama.cpp). Le routeur envoie chaque requête au backend le
+# plus rapide récemment parmi ceux de qualité suffisante; un disjoncteur par
+# backend l'écarte quand il devient lent ou renvoie trop d'erreurs, puis le
+# resonde périodiquement. Le modèle local reste le dernier recours.
+#
+# Une "requête" est le dict produit par _llm_request() dans le serveur:
+# {"messages": [...], "model": ..., "max_tokens": ..., "temperature": ..., "top_p": ...}
+
+import asyncio
+import math
+import random
+import time
+from collections import deque
+from pathlib import Path
+from threading import Lock
+
+from latency_window import LatencyWindow
+from llama_prefix_cache import PrefixStateCache
+
+
+class RemoteBackend:
+    """
+    API de génération distante: client synchrone + client asynchrone à pool de connexions.
+    Sans client asynchrone (serveurs synchrones), agenerate passe par generate dans un thread.
+    Les sous-classes traduisent la requête (_create, _acreate, stream).
+    """
+
+    def __init__(self, name: str, client, async_client, model: str | None = None, quality: int = 2,
+                 timeout_s: float = 20.0, max_retries: int = 2, retry_base_s: float = 0.5,
+                 retryable_errors: tuple = ()):
+        self.name = name
+        self.client = client
+        self.async_client = async_client
+        self.model = model
+        self.quality = quality
+        self.timeout_s = timeout_s
+        self.max_retries = max_retries
+        self.retry_base_s = retry_base_s
+        self.retryable_errors = retryable_errors
+
+    @property
+    def available(self) -> bool:
+        return True
+
+    def _retry_delay(self, attempt: int, deadline: float, error: Exception):
+        """Attente avant la tentative `attempt`, None si plus de relance possible avant `deadline`"""
+        # "Full jitter": attente aléatoire dans [0, base * 2^n] pour étaler les relances
+        delay = random.uniform(0, self.retry_base_s * 2 ** (attempt - 1))
+        if attempt > self.max_retries or time.monotonic() + delay >= deadline:
+            return None
+        print(f"⚠️  {self.name}: {type(error).__name__}, nouvelle tentative {attempt}/{self.max_retries} dans {delay:.2f}s")
+        return delay
+
+    def _timeout_error(self) -> TimeoutError:
+        return TimeoutError(f"{self.name}: délai de {self.timeout_s:.0f}s dépassé")
+
+    def generate(self, request: dict) -> str:
+        """Même politique que agenerate (threads du lot, pré-calcul); relances du SDK désactivées"""
+        deadline = time.monotonic() + self.timeout_s
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise self._timeout_error()
+            try:
+                return self._create(request, remaining)
+            except self.retryable_errors as e:
+                attempt += 1
+                delay = self._retry_delay(attempt, deadline, e)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+
+    async def agenerate(self, request: dict) -> str:
+        """
+        Délai global `timeout_s` pour toutes les tentatives, relances avec jitter
+        sur erreurs transitoires. L'annulation de la tâche interrompt la requête HTTP.
+        """
+        if self.async_client is None:
+            return await asyncio.to_thread(self.generate, request)
+        deadline = time.monotonic() + self.timeout_s
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise self._timeout_error()
+            try:
+                return await asyncio.wait_for(self._acreate(request), timeout=remaining)
+            except asyncio.TimeoutError:
+                raise self._timeout_error()
+            except self.retryable_errors as e:
+                attempt += 1
+                delay = self._retry_delay(attempt, deadline, e)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+
+    async def aclose(self):
+        if self.async_client is not None:
+            await self.async_client.close()
+
+
+class ChatCompletionsBackend(RemoteBackend):
+    """
+    API au format chat.completions: Groq et OpenAI (même forme de SDK).
+    Sans `model`, le modèle de la requête est utilisé (réglage llm_model de Groq).
+    """
+
+    def _request(self, request: dict) -> dict:
+        return {**request, "model": self.model} if self.model else request
+
+    def _create(self, request: dict, timeout: float) -> str:
+        client = self.client.with_options(max_retries=0, timeout=timeout)
+        completion = client.chat.completions.create(**self._request(request))
+        return completion.choices[0].message.content.strip()
+
+    async def _acreate(self, request: dict) -> str:
+        completion = await self.async_client.chat.completions.create(**self._request(request))
+        return completion.choices[0].message.content.strip()
+
+    def stream(self, request: dict):
+        stream = self.client.chat.completions.create(**self._request(request), stream=True)
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        finally:
+            # Client déconnecté: fermer la connexion HTTP plutôt que de laisser l'API terminer
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+
+
+class AnthropicBackend(RemoteBackend):
+    """API Messages d'Anthropic: le message système passe dans le paramètre `system`"""
+
+    def _request(self, request: dict) -> dict:
+        messages = request["messages"]
+        return {
+            "model": self.model,
+            "system": "\n\n".join(m["content"] for m in messages if m["role"] == "system"),
+            "messages": [m for m in messages if m["role"] != "system"],
+            "max_tokens": request.get("max_tokens", 200),
+            "temperature": request.get("temperature", 0.2)
+        }
+
+    @staticmethod
+    def _text(message) -> str:
+        return "".join(block.text for block in message.content if block.type == "text").strip()
+
+    def _create(self, request: dict, timeout: float) -> str:
+        client = self.client.with_options(max_retries=0, timeout=timeout)
+        return self._text(client.messages.create(**self._request(request)))
+
+    async def _acreate(self, request: dict) -> str:
+        return self._text(await self.async_client.messages.create(**self._request(request)))
+
+    def stream(self, request: dict):
+        # La sortie du bloc with ferme la connexion si le client se déconnecte
+        with self.client.messages.stream(**self._request(request)) as stream:
+            for delta in stream.text_stream:
+                if delta:
+                    yield delta
+
+
+class LlamaCppBackend:
+    """
+    Modèle GGUF local via llama-cpp-python (même réglage que rag_server_pi.py).
+    Chargé au premier appel; les appels sont sérialisés (un contexte llama.cpp
+    n'est pas réentrant) et l'état KV du message système est réutilisé.
+    """
+
+    name = "local"
+
+    def __init__(self, model_path: str, n_ctx: int = 2048, n_threads: int = 4, quality: int = 1):
+        self.model_path = model_path
+        self.model = Path(model_path).name
+        self.quality = quality
+        self.n_ctx = n_ctx
+        self.n_threads = n_threads
+        self.llm = None
+        self.prefix_cache = None
+        self.lock = Lock()
+
+    @property
+    def available(self) -> bool:
+        return Path(self.model_path).exists()
+
+    def load(self):
+        """Charge le modèle d'avance (au démarrage plutôt qu'à la première question)"""
+        self._load()
+
+    def _load(self) -> PrefixStateCache:
+        with self.lock:
+            if self.llm is None:
+                from llama_cpp import Llama
+                print(f"🔄 Chargement du LLM local {self.model_path}...")
+                self.llm = Llama(
+                    model_path=self.model_path,
+                    n_ctx=self.n_ctx,
+                    n_threads=self.n_threads,
+                    n_batch=256,
+                    n_gpu_layers=0,
+                    use_mmap=True,
+                    use_mlock=False,
+                    verbose=False
+                )
+                self.prefix_cache = PrefixStateCache(self.llm)
+                print("✅ LLM local prêt")
+        return self.prefix_cache
+
+    @staticmethod
+    def build_prompt(messages: list) -> tuple:
+        """
+        Format de chat TinyLlama utilisé par les serveurs Pi, en deux parties:
+        préfixe fixe (message système + ouverture du tour utilisateur) et suite variable
+        """
+        prefix = ""
+        for message in messages[:-1]:
+            prefix += f"<|{message['role']}|>\n{message['content']}<|end|>\n"
+        last = messages[-1]
+        prefix += f"<|{last['role']}|>\n"
+        return prefix, f"{last['content']}<|end|>\n<|assistant|>"
+
+    def _params(self, request: dict) -> dict:
+        return {
+            "max_tokens": request.get("max_tokens", 200),
+            "temperature": 0.1,
+            "top_p": 0.9,
+            "repeat_penalty": 1.1,
+            "stop": ["<|end|>", "<|user|>"],
+            "echo": False
+        }
+
+    def generate(self, request: dict) -> str:
+        prefix, suffix = self.build_prompt(request["messages"])
+        response = self._load().complete(prefix, suffix, **self._params(request))
+        return response["choices"][0]["text"].strip()
+
+    async def agenerate(self, request: dict) -> str:
+        return await asyncio.to_thread(self.generate, request)
+
+    async def aclose(self):
+        pass
+
+    def stream(self, request: dict):
+        prefix, suffix = self.build_prompt(request["messages"])
+        for chunk in self._load().stream(prefix, suffix, **self._params(request)):
+            delta = chunk["choices"][0]["text"]
+            if delta:
+                yield delta
+
+
+class CircuitBreaker:
+    """
+    fermé: appels normaux; ouvert: backend évité pendant `cooldown_s`;
+    semi-ouvert: un seul appel de sonde, qui referme ou rouvre le disjoncteur.
+    Un appel plus lent que `latency_budget_s` compte comme un échec.
+    """
+
+    def __init__(self, latency_budget_s: float = 6.0, error_rate: float = 0.5,
+                 window: int = 20, min_calls: int = 5, cooldown_s: float = 30.0, name: str = ""):
+        self.name = name
+        self.latency_budget_s = latency_budget_s
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.cooldown_s = cooldown_s
+        self.outcomes = deque(maxlen=window)  # True = échec (erreur ou trop lent)
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.trips = 0
+        self.lock = Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown_s:
+                self.state = "half_open"
+            if self.state == "half_open" and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return True
+            return False
+
+    def record(self, latency_s: float | None, error: bool = False):
+        failed = error or latency_s is None or latency_s > self.latency_budget_s
+        with self.lock:
+            if self.state == "half_open":
+                self.probe_in_flight = False
+                if failed:
+                    self._open()
+                else:
+                    self.state = "closed"
+                    self.outcomes.clear()
+                    print(f"✅ Disjoncteur LLM {self.name} refermé (sonde réussie)")
+                return
+            self.outcomes.append(failed)
+            failures = sum(self.outcomes)
+            if (self.state == "closed" and len(self.outcomes) >= self.min_calls
+                    and failures / len(self.outcomes) >= self.error_rate):
+                self._open()
+
+    def release_probe(self):
+        """Sonde abandonnée (client déconnecté): une autre requête pourra sonder"""
+        with self.lock:
+            self.probe_in_flight = False
+
+    def _open(self):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.trips += 1
+        print(f"⚠️  Disjoncteur LLM {self.name} ouvert pendant {self.cooldown_s:.0f}s")
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "state": self.state,
+                "trips": self.trips,
+                "recent_failure_rate": round(sum(self.outcomes) / len(self.outcomes), 3) if self.outcomes else None,
+                "latency_budget_s": self.latency_budget_s,
+                "cooldown_s": self.cooldown_s
+            }
+
+
+_STREAM_END = object()
+
+
+class LatencyRouter:
+    """
+    Pour chaque requête, le backend de plus faible latence récente (moyenne mobile
+    exponentielle des appels réussis) parmi ceux de qualité >= `min_quality` dont le
+    disjoncteur laisse passer; en cas d'échec, les suivants sont essayés dans l'ordre.
+    Les backends de qualité inférieure (modèle local) ne servent qu'en dernier recours.
+    Une fraction `explore_rate` des requêtes part vers un autre backend éligible pour
+    que la latence de chacun reste à jour.
+    """
+
+    def __init__(self, backends: list, min_quality: int = 0, explore_rate: float = 0.05,
+                 ewma_alpha: float = 0.2, breaker_factory=None):
+        self.backends = [backend for backend in backends if backend.available]
+        if not self.backends:
+            raise ValueError("Aucun backend LLM disponible")
+        self.min_quality = min_quality
+        self.explore_rate = explore_rate
+        self.ewma_alpha = ewma_alpha
+        breaker_factory = breaker_factory or (lambda backend: CircuitBreaker(name=backend.name))
+        self.breakers = {backend.name: breaker_factory(backend) for backend in self.backends}
+        self.latencies = {backend.name: LatencyWindow() for backend in self.backends}
+        self.ewma = {backend.name: None for backend in self.backends}
+        self.errors = {backend.name: 0 for backend in self.backends}
+        self.chosen = {backend.name: 0 for backend in self.backends}  # premier choix du routage
+        self.served = {backend.name: 0 for backend in self.backends}
+        self.failovers = 0
+        self.explorations = 0
+        self.lock = Lock()
+
+    def _ranking(self) -> tuple:
+        """(backends de qualité suffisante par latence croissante, backends de secours par qualité)"""
+        def expected_latency(backend):
+            latency = self.ewma[backend.name]
+            return -1.0 if latency is None else latency  # jamais mesuré: essayé en premier
+
+        with self.lock:
+            preferred = sorted((b for b in self.backends if b.quality >= self.min_quality), key=expected_latency)
+        degraded = sorted((b for b in self.backends if b.quality < self.min_quality),
+                          key=lambda backend: backend.quality, reverse=True)
+        return preferred, degraded
+
+    def _candidates(self):
+        """Backends à essayer, dans l'ordre, en consultant chaque disjoncteur au dernier moment"""
+        preferred, degraded = self._ranking()
+        if len(preferred) > 1 and random.random() < self.explore_rate:
+            preferred.insert(0, preferred.pop(random.randrange(1, len(preferred))))
+            with self.lock:
+                self.explorations += 1
+        plan = preferred + degraded
+        attempts = 0
+        for backend in plan:
+            if not self.breakers[backend.name].allow():
+                continue
+            self._count_attempt(backend, attempts)
+            attempts += 1
+            yield backend
+        if not attempts:
+            # Tous les disjoncteurs ouverts: dernier recours quand même
+            self._count_attempt(plan[-1], 0)
+            yield plan[-1]
+
+    def _count_attempt(self, backend, attempt: int):
+        with self.lock:
+            if attempt == 0:
+                self.chosen[backend.name] += 1
+            else:
+                self.failovers += 1
+
+    def _record(self, backend, elapsed: float, error: bool = False):
+        breaker = self.breakers[backend.name]
+        # Un échec compte au moins comme le budget de latence: le backend recule dans le classement
+        sample = max(elapsed, breaker.latency_budget_s) if error and math.isfinite(breaker.latency_budget_s) else elapsed
+        with self.lock:
+            previous = self.ewma[backend.name]
+            self.ewma[backend.name] = sample if previous is None else previous + self.ewma_alpha * (sample - previous)
+            if error:
+                self.errors[backend.name] += 1
+            else:
+                self.served[backend.name] += 1
+        if not error:
+            self.latencies[backend.name].add(elapsed)
+        breaker.record(None if error else elapsed, error)
+
+    def generate(self, request: dict):
+        """Retourne (texte, nom du backend); lève la dernière erreur si aucun backend n'a répondu"""
+        last_error = None
+        for backend in self._candidates():
+            started = time.perf_counter()
+            try:
+                text = backend.generate(request)
+            except Exception as e:
+                self._record(backend, time.perf_counter() - started, error=True)
+                print(f"⚠️  {backend.name} en échec ({e})")
+                last_error = e
+                continue
+            self._record(backend, time.perf_counter() - started)
+            return text, backend.name
+        raise last_error
+
+    async def agenerate(self, request: dict):
+        last_error = None
+        for backend in self._candidates():
+            started = time.perf_counter()
+            try:
+                text = await backend.agenerate(request)
+            except asyncio.CancelledError:
+                self.breakers[backend.name].release_probe()
+                raise
+            except Exception as e:
+                self._record(backend, time.perf_counter() - started, error=True)
+                print(f"⚠️  {backend.name} en échec ({e})")
+                last_error = e
+                continue
+            self._record(backend, time.perf_counter() - started)
+            return text, backend.name
+        raise last_error
+
+    def stream(self, request: dict):
+        """
+        Fragments de texte; passe au backend suivant seulement si l'échec précède le premier fragment.
+        Seul le temps passé dans l'itérateur du backend est mesuré (pas le traitement du consommateur
+        entre deux fragments); un flux abandonné n'est compté ni comme succès ni comme échec.
+        """
+        last_error = None
+        for backend in self._candidates():
+            deltas = iter(backend.stream(request))
+            backend_s = 0.0
+            produced = False
+            try:
+                while True:
+                    started = time.perf_counter()
+                    try:
+                        delta = next(deltas, _STREAM_END)
+                    finally:
+                        backend_s += time.perf_counter() - started
+                    if delta is _STREAM_END:
+                        break
+                    produced = True
+                    yield delta
+            except GeneratorExit:
+                self.breakers[backend.name].release_probe()
+                if hasattr(deltas, "close"):
+                    deltas.close()
+                raise
+            except Exception as e:
+                self._record(backend, backend_s, error=True)
+                if produced:
+                    raise
+                print(f"⚠️  {backend.name} en échec ({e})")
+                last_error = e
+                continue
+            self._record(backend, backend_s)
+            return
+        raise last_error
+
+    async def aclose(self):
+        for backend in self.backends:
+            await backend.aclose()
+
+    def stats(self) -> dict:
+        preferred, degraded = self._ranking()
+        with self.lock:
+            backends = {
+                backend.name: {
+                    "model": backend.model,
+                    "quality": backend.quality,
+                    "ewma_s": round(self.ewma[backend.name], 3) if self.ewma[backend.name] is not None else None,
+                    "chosen": self.chosen[backend.name],
+                    "served": self.served[backend.name],
+                    "errors": self.errors[backend.name]
+                }
+                for backend in self.backends
+            }
+            failovers, explorations = self.failovers, self.explorations
+        for name, entry in backends.items():
+            entry.update(self.latencies[name].stats())
+            entry["circuit_breaker"] = self.breakers[name].stats()
+        return {
+            "policy": "latency",
+            "min_quality": self.min_quality,
+            "explore_rate": self.explore_rate,
+            "routing_order": [backend.name for backend in preferred + degraded],
+            "failovers": failovers,
+            "explorations": explorations,
+            "backends": backends
+        }
@@ -0,0 +1,460 @@
+# piper_worker.py
+# Processus Piper persistant: le modèle ONNX et les données espeak-ng restent
+# chargés entre deux synthèses au lieu d'être relus à chaque phrase.
+#
+# Piper est lancé une fois avec --json-input --output-raw: chaque ligne JSON
+# {"text": ...} écrite sur stdin produit du PCM 16 bits mono sur stdout, puis
+# une ligne "Real-time factor: R (infer=I sec, audio=A sec)" sur stderr qui
+# marque la fin de l'énoncé (A donne le nombre d'échantillons attendus).
+#
+# PiperPool répartit les phrases d'une longue réponse sur plusieurs processus,
+# chacun épinglé sur ses propres cœurs, puis recolle le PCM dans l'ordre.
+# En flux (stream_pcm), le PCM est rendu par trames de taille fixe au fur et à
+# mesure que piper l'écrit sur stdout, une phrase d'avance au plus.
+
+import io
+import json
+import os
+import queue
+import re
+import shutil
+import struct
+import subprocess
+import threading
+import time
+import wave
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path
+
+import numpy as np
+
+from latency_window import LatencyWindow
+from sentence_stream import split_sentences
+
+RTF_RE = re.compile(r"Real-time factor: ([\d.]+) \(infer=([\d.]+) sec, audio=([\d.]+) sec\)")
+
+
+class PiperWorkerError(Exception):
+    pass
+
+
+def read_sample_rate(model_path: str, default: int = 22050) -> int:
+    """Fréquence d'échantillonnage déclarée dans <modèle>.onnx.json"""
+    try:
+        with open(f"{model_path}.json", "r", encoding="utf-8") as f:
+            return int(json.load(f)["audio"]["sample_rate"])
+    except (OSError, KeyError, ValueError):
+        return default
+
+
+def pool_cpu_sets(size: int, reserved_cores: int = 2) -> list:
+    """
+    Cœurs de chaque worker: les derniers cœurs autorisés, un par worker, les
+    `reserved_cores` premiers restant aux embeddings et à Whisper
+    """
+    if not hasattr(os, "sched_getaffinity"):
+        return [None] * size
+    cores = sorted(os.sched_getaffinity(0))
+    usable = cores[reserved_cores:] or cores[-1:]
+    return [{usable[-1 - (i % len(usable))]} for i in range(size)]
+
+
+def wav_stream_header(sample_rate: int) -> bytes:
+    """
+    En-tête WAV PCM 16 bits mono pour un flux de longueur inconnue: tailles RIFF et
+    data à 0xFFFFFFFF, que les navigateurs, ffmpeg et aplay lisent jusqu'à la fin du flux
+    """
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 0xFFFFFFFF, b"WAVE",
+        b"fmt ", 16, 1, 1, sample_rate, sample_rate * 2, 2, 16,
+        b"data", 0xFFFFFFFF
+    )
+
+
+def pcm_to_wav(pcm: bytes, sample_rate: int) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+class PiperWorker:
+    """
+    Un processus piper, une synthèse à la fois. Un processus mort ou bloqué est
+    relancé automatiquement; PiperWorkerError n'est levée qu'après l'échec d'une
+    seconde tentative avec un processus neuf (échec franc: binaire ou modèle absent...).
+    """
+
+    def __init__(self, piper_bin: str, model_path: str, timeout_s: float = 30.0, extra_args: list | None = None,
+                 cpus: set | None = None):
+        self.piper_bin = piper_bin
+        self.model_path = model_path
+        self.timeout_s = timeout_s
+        self.cpus = cpus
+        self.extra_args = extra_args or []
+        self.sample_rate = read_sample_rate(model_path)
+        self.lock = threading.Lock()  # une synthèse à la fois sur ce processus
+        self.process = None
+        self.pcm = bytearray()
+        self.pcm_ready = threading.Condition()
+        self.done = queue.Queue()  # durée audio (s) de chaque énoncé terminé, None si piper s'arrête
+        self.stderr_tail = deque(maxlen=20)
+        self.utterances = 0
+        self.starts = 0
+        self.failures = 0
+        self.last_rtf = None
+
+    def _start(self):
+        env = os.environ.copy()
+        # libpiper_phonemize / libespeak-ng livrées à côté du binaire
+        env["LD_LIBRARY_PATH"] = str(Path(self.piper_bin).parent)
+        command = [self.piper_bin, "--model", self.model_path, "--json-input", "--output-raw", *self.extra_args]
+        taskset = shutil.which("taskset") if self.cpus else None
+        if taskset:
+            # Affinité fixée avant l'exec: le pool de threads d'onnxruntime, créé au chargement
+            # du modèle, ne tourne que sur ces cœurs (preexec_fn n'est pas sûr avec des threads)
+            command = [taskset, "-c", ",".join(str(cpu) for cpu in sorted(self.cpus)), *command]
+        self.process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=env
+        )
+        if self.cpus and not taskset and hasattr(os, "sched_setaffinity"):
+            # Sans taskset: repli au mieux, les threads déjà créés par piper gardent l'affinité large
+            os.sched_setaffinity(self.process.pid, self.cpus)
+        self.pcm = bytearray()
+        self.done = queue.Queue()
+        self.stderr_tail.clear()
+        self.starts += 1
+        threading.Thread(target=self._read_stdout, args=(self.process, self.pcm), daemon=True).start()
+        threading.Thread(target=self._read_stderr, args=(self.process, self.done), daemon=True).start()
+
+    def _read_stdout(self, process, pcm: bytearray):
+        fd = process.stdout.fileno()
+        while True:
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                break
+            with self.pcm_ready:
+                pcm.extend(chunk)
+                self.pcm_ready.notify_all()
+
+    def _read_stderr(self, process, done: queue.Queue):
+        for raw_line in process.stderr:
+            line = raw_line.decode("utf-8", errors="replace").strip()
+            match = RTF_RE.search(line)
+            if match:
+                self.last_rtf = float(match.group(1))
+                done.put(float(match.group(3)))
+            elif line:
+                self.stderr_tail.append(line)
+        done.put(None)
+
+    def _stop(self):
+        process, self.process = self.process, None
+        if process is None:
+            return
+        try:
+            process.stdin.close()
+        except OSError:
+            pass
+        try:
+            process.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    def start(self):
+        """Lance le processus d'avance (modèle chargé avant la première requête)"""
+        with self.lock:
+            if self.process is None or self.process.poll() is not None:
+                self._start()
+
+    def _synthesize_once(self, text: str) -> bytes:
+        if self.process is None or self.process.poll() is not None:
+            self._start()
+        with self.pcm_ready:
+            self.pcm.clear()
+        line = json.dumps({"text": text}, ensure_ascii=False) + "\n"
+        self.process.stdin.write(line.encode("utf-8"))
+        self.process.stdin.flush()
+
+        try:
+            audio_s = self.done.get(timeout=self.timeout_s)
+        except queue.Empty:
+            raise PiperWorkerError(f"piper: pas de réponse après {self.timeout_s:.0f}s")
+        if audio_s is None:
+            raise PiperWorkerError(f"piper s'est arrêté: {' | '.join(self.stderr_tail) or 'sans message'}")
+
+        # La ligne stderr peut précéder la lecture des derniers octets de stdout
+        expected = int(audio_s * self.sample_rate) * 2
+        deadline = time.monotonic() + 1.0
+        with self.pcm_ready:
+            while len(self.pcm) < expected - 4 and time.monotonic() < deadline:
+                self.pcm_ready.wait(0.05)
+            pcm = bytes(self.pcm)
+            self.pcm.clear()
+        return pcm
+
+    def synthesize_pcm(self, text: str) -> bytes:
+        """PCM 16 bits mono à `sample_rate` Hz"""
+        if not text.strip():
+            return b""
+        with self.lock:
+            for attempt in (1, 2):
+                try:
+                    pcm = self._synthesize_once(text)
+                    self.utterances += 1
+                    return pcm
+                except (OSError, PiperWorkerError) as e:
+                    self.failures += 1
+                    self._stop()
+                    if attempt == 2:
+                        raise PiperWorkerError(f"Piper indisponible: {e}") from e
+                    print(f"⚠️  Worker Piper relancé: {e}")
+
+    def synthesize(self, text: str) -> bytes:
+        """Fichier WAV complet"""
+        return pcm_to_wav(self.synthesize_pcm(text), self.sample_rate)
+
+    def _synthesize_frames_once(self, text: str, on_frame, frame_bytes: int) -> int:
+        if self.process is None or self.process.poll() is not None:
+            self._start()
+        with self.pcm_ready:
+            self.pcm.clear()
+        line = json.dumps({"text": text}, ensure_ascii=False) + "\n"
+        self.process.stdin.write(line.encode("utf-8"))
+        self.process.stdin.flush()
+
+        deadline = time.monotonic() + self.timeout_s
+        expected = None  # octets attendus, connus à la ligne "Real-time factor"
+        sent = 0
+        while True:
+            if expected is None:
+                try:
+                    audio_s = self.done.get_nowait()
+                except queue.Empty:
+                    if time.monotonic() > deadline:
+                        raise PiperWorkerError(f"piper: pas de fin d'énoncé après {self.timeout_s:.0f}s")
+                else:
+                    if audio_s is None:
+                        raise PiperWorkerError(f"piper s'est arrêté: {' | '.join(self.stderr_tail) or 'sans message'}")
+                    expected = int(audio_s * self.sample_rate) * 2
+                    deadline = time.monotonic() + 1.0  # derniers octets de stdout
+            with self.pcm_ready:
+                if len(self.pcm) < frame_bytes:
+                    self.pcm_ready.wait(0.02)
+                buffered = len(self.pcm)
+                finished = expected is not None and (sent + buffered >= expected - 4 or time.monotonic() > deadline)
+                # Trames complètes seulement, sauf la dernière de l'énoncé
+                take = buffered if finished else buffered - buffered % frame_bytes
+                chunk = bytes(self.pcm[:take])
+                del self.pcm[:take]
+            for offset in range(0, len(chunk), frame_bytes):
+                on_frame(chunk[offset:offset + frame_bytes])
+            sent += len(chunk)
+            if finished:
+                return sent
+
+    def synthesize_frames(self, text: str, on_frame, frame_bytes: int = 4096) -> int:
+        """
+        Synthèse transmise à `on_frame` par trames de `frame_bytes` octets au fil de la lecture
+        de stdout (on_frame ne doit pas bloquer: le worker est tenu jusqu'à la fin de l'énoncé).
+        Relance possible tant qu'aucune trame n'a été transmise. Retourne le nombre d'octets.
+        """
+        if not text.strip():
+            return 0
+        with self.lock:
+            for attempt in (1, 2):
+                emitted = 0
+
+                def forward(frame):
+                    nonlocal emitted
+                    emitted += len(frame)
+                    on_frame(frame)
+
+                try:
+                    sent = self._synthesize_frames_once(text, forward, frame_bytes)
+                    self.utterances += 1
+                    return sent
+                except (OSError, PiperWorkerError) as e:
+                    self.failures += 1
+                    self._stop()
+                    if emitted or attempt == 2:
+                        raise PiperWorkerError(f"Piper indisponible: {e}") from e
+                    print(f"⚠️  Worker Piper relancé: {e}")
+
+    def close(self):
+        with self.lock:
+            self._stop()
+
+    def stats(self) -> dict:
+        process = self.process
+        return {
+            "alive": process is not None and process.poll() is None,
+            "pid": process.pid if process is not None else None,
+            "cpus": sorted(self.cpus) if self.cpus else None,
+            "utterances": self.utterances,
+            "starts": self.starts,
+            "restarts": max(self.starts - 1, 0),
+            "failures": self.failures,
+            "last_rtf": self.last_rtf
+        }
+
+
+_SENTENCE_END = object()
+
+
+class PiperPool:
+    """
+    `size` PiperWorker (un par jeu de cœurs). synthesize() découpe le texte en phrases,
+    les synthétise en parallèle sur les workers libres et renvoie un seul WAV, dans l'ordre.
+    """
+
+    def __init__(self, piper_bin: str, model_path: str, size: int = 2, cpu_sets: list | None = None,
+                 timeout_s: float = 30.0, min_chars: int = 40, sentence_silence_s: float = 0.2,
+                 frame_bytes: int = 4096):
+        cpu_sets = cpu_sets or [None] * size
+        self.workers = [
+            PiperWorker(piper_bin, model_path, timeout_s=timeout_s, cpus=cpu_sets[i]) for i in range(size)
+        ]
+        self.sample_rate = self.workers[0].sample_rate
+        self.min_chars = min_chars
+        self.frame_bytes = frame_bytes  # trames du flux: 4096 octets ~ 93 ms à 22050 Hz
+        # Piper insère ce silence entre les phrases d'un même énoncé: on le remet au recollage
+        self.silence = b"\x00\x00" * int(sentence_silence_s * self.sample_rate)
+        self.idle = queue.Queue()
+        for worker in self.workers:
+            self.idle.put(worker)
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="piper")
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.rtf = deque(maxlen=200)  # RTF par requête: durée de synthèse / durée audio
+        self.last_request = None
+        self.first_chunk = LatencyWindow()  # délai avant la première trame en flux
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+
+    def _synthesize_on_idle_worker(self, text: str) -> bytes:
+        worker = self.idle.get()
+        try:
+            return worker.synthesize_pcm(text)
+        finally:
+            self.idle.put(worker)
+
+    def synthesize(self, text: str) -> bytes:
+        return self.synthesize_with_report(text)[0]
+
+    def synthesize_with_report(self, text: str) -> tuple:
+        """(WAV complet, rapport de la requête); une phrase seule est synthétisée sur le thread appelant"""
+        started = time.perf_counter()
+        sentences = split_sentences(text, self.min_chars) or [text]
+        if len(sentences) == 1:
+            chunks = [self._synthesize_on_idle_worker(sentences[0])]
+        else:
+            # Une exception (échec franc d'un worker) remonte à l'appelant
+            chunks = list(self.executor.map(self._synthesize_on_idle_worker, sentences))
+        pcm = self.silence.join(chunk for chunk in chunks if chunk)
+        synthesis_s = time.perf_counter() - started
+
+        audio_s = len(pcm) / 2 / self.sample_rate
+        report = {
+            "sentences": len(sentences),
+            "audio_s": round(audio_s, 3),
+            "synthesis_s": round(synthesis_s, 3),
+            "rtf": round(synthesis_s / audio_s, 3) if audio_s else None
+        }
+        with self.lock:
+            self.requests += 1
+            self.last_request = report
+            if report["rtf"] is not None:
+                self.rtf.append(report["rtf"])
+        return pcm_to_wav(pcm, self.sample_rate), report
+
+    def _stream_sentence(self, sentence: str, frames: queue.Queue, slot, cancelled: threading.Event):
+        """
+        Thread d'une phrase du flux: place d'admission (`slot`), puis worker libre; les trames
+        sont poussées dans `frames`, suivies de _SENTENCE_END ou de l'exception
+        """
+        try:
+            with slot() if slot is not None else nullcontext():
+                if cancelled.is_set():
+                    return  # client parti avant le début de la phrase
+                worker = self.idle.get()
+                try:
+                    worker.synthesize_frames(sentence, frames.put, self.frame_bytes)
+                finally:
+                    self.idle.put(worker)
+            frames.put(_SENTENCE_END)
+        except Exception as e:
+            frames.put(e)
+
+    def stream_pcm(self, text: str, slot=None):
+        """
+        Trames PCM dans l'ordre du texte, rendues dès que piper les écrit. La phrase suivante
+        n'est lancée que lorsque la phrase en cours commence (une phrase d'avance au plus).
+        `slot()`: gestionnaire de contexte tenu pendant la synthèse de chaque phrase (admission),
+        jamais pendant l'envoi au client. Une phrase en échec interrompt le flux (PiperWorkerError).
+        """
+        started = time.perf_counter()
+        sentences = split_sentences(text, self.min_chars) or [text]
+        cancelled = threading.Event()
+
+        def launch(sentence: str) -> queue.Queue:
+            frames = queue.Queue()
+            threading.Thread(target=self._stream_sentence, args=(sentence, frames, slot, cancelled),
+                             daemon=True, name="piper-stream").start()
+            return frames
+
+        first = True
+        pending = launch(sentences[0])
+        try:
+            for position, sentence in enumerate(sentences):
+                current = pending
+                pending = launch(sentences[position + 1]) if position + 1 < len(sentences) else None
+                if position:
+                    yield self.silence
+                while True:
+                    item = current.get()
+                    if item is _SENTENCE_END:
+                        break
+                    if isinstance(item, Exception):
+                        print(f"⚠️  Phrase {position + 1}/{len(sentences)} en échec, flux interrompu: {item}")
+                        if isinstance(item, PiperWorkerError):
+                            raise item
+                        raise PiperWorkerError(f"Piper indisponible: {item}") from item
+                    if first:
+                        self.first_chunk.add(time.perf_counter() - started)
+                        first = False
+                    yield item
+        finally:
+            cancelled.set()
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        for worker in self.workers:
+            worker.close()
+
+    def stats(self) -> dict:
+        with self.lock:
+            rtf = np.array(self.rtf)
+            summary = {
+                "size": len(self.workers),
+                "requests": self.requests,
+                "last_request": self.last_request,
+                "rtf_p50": round(float(np.percentile(rtf, 50)), 3) if len(rtf) else None,
+                "rtf_p95": round(float(np.percentile(rtf, 95)), 3) if len(rtf) else None
+            }
+        summary["stream_first_chunk"] = self.first_chunk.stats()
+        summary["workers"] = [worker.stats() for worker in self.workers]
+        return summary
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+precompute_answers.py - Pré-calcul des réponses aux questions les plus fréquentes
+
+Lit le journal des questions (knowledge_store/question_log.jsonl) et, pour les N
+questions les plus posées par langue, enregistre contexte, réponse du LLM et audio
+dans knowledge_store/answer_store/, consulté en premier par /text/ask et /voice/ask.
+Le serveur reconstruit aussi ce magasin en tâche de fond (PRECOMPUTE_INTERVAL_S)
+et dès que la version des index change.
+
+Le calcul a lieu dans le serveur (/admin/precompute), qui a déjà chargé modèles,
+index et TTS: un second processus qui les chargerait doublerait la mémoire
+utilisée (trop pour un Pi 5). Hors serveur, seul --list est disponible.
+
+Usage (depuis la racine du projet):
+    python data_processing/precompute_answers.py --server http://localhost:8000 --top 30
+    python data_processing/precompute_answers.py --list
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).parent))
+from answer_store import QuestionLog
+
+QUESTION_LOG_FILE = Path("knowledge_store/question_log.jsonl")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pré-calcul des réponses aux questions fréquentes")
+    parser.add_argument("--top", type=int, default=30, help="Questions par langue")
+    parser.add_argument("--min-count", type=int, default=3, help="Occurrences minimales dans le journal")
+    parser.add_argument("--list", action="store_true", help="Afficher les questions retenues sans rien calculer")
+    parser.add_argument("--server", help="URL du serveur en cours d'exécution qui fait la reconstruction")
+    args = parser.parse_args()
+    if not args.list and not args.server:
+        parser.error("--server est requis pour pré-calculer (ou --list pour afficher les questions)")
+
+    if args.list:
+        top = QuestionLog(QUESTION_LOG_FILE).top_questions(args.top, args.min_count)
+        for language, questions in top.items():
+            print(f"\n[{language}] {len(questions)} questions")
+            for item in questions:
+                print(f"   {item['count']:>5}  {item['question']}")
+        return
+
+    response = requests.post(
+        f"{args.server.rstrip('/')}/admin/precompute",
+        params={"top_n": args.top, "min_count": args.min_count},
+        timeout=3600
+    )
+    response.raise_for_status()
+    summary = response.json()
+    print(f"✅ {summary['entries']} réponses pré-calculées ({summary['skipped']} ignorées) "
+          f"en {summary['duration_s']}s, version {summary['version']}")
+
+
+if __name__ == "__main__":
+    main()
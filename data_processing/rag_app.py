@@ -0,0 +1,145 @@
+# rag_app.py
+# Socle commun des serveurs RAG simples (rag_server_pi/tts/claude/openai/gpt4all):
+# chargement de l'index FAISS et des passages, recherche, génération par la
+# couche llm_backends (routeur sur la liste de backends du serveur) et
+# endpoints /ask, /health, /stats. Chaque serveur ne choisit que ses backends,
+# son prompt et, s'il en a, ses endpoints propres.
+# rag_server_voice.py n'utilise pas ce socle: il partage llm_backends mais garde
+# sa recherche hybride (BM25), le découpage du contexte, le cache sémantique,
+# l'admission et la génération asynchrone, que ce socle n'a pas vocation à porter.
+
+import json
+from pathlib import Path
+
+import numpy as np
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+from sentence_transformers import SentenceTransformer
+
+from index_factory import load_index
+from llm_backends import LatencyRouter
+
+INDEX_FILE = "orange_faq.index"
+METADATA_FILE = "metadata.json"
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+USER_TEMPLATE = """Contexte:
+{context}
+
+Question: {question}"""
+
+
+class QuestionRequest(BaseModel):
+    question: str
+
+
+class RAGPipeline:
+    """
+    Recherche des `top_k` passages les plus proches puis génération par le premier backend
+    disponible de `backends` (sans backend: retrieve_context seul, generate lève RuntimeError)
+    """
+
+    def __init__(self, backends: list, system_prompt: str, top_k: int = 5, user_template: str = USER_TEMPLATE,
+                 max_tokens: int = 200, temperature: float = 0.2, top_p: float = 1.0,
+                 index_file: str = INDEX_FILE, metadata_file: str = METADATA_FILE,
+                 embedding_model: str = EMBEDDING_MODEL):
+        self.system_prompt = system_prompt
+        self.user_template = user_template
+        self.top_k = top_k
+        self.generation = {"max_tokens": max_tokens, "temperature": temperature, "top_p": top_p}
+
+        print("🔄 Chargement du modèle d'embeddings...")
+        self.embed_model = SentenceTransformer(embedding_model)
+
+        print("🔄 Chargement de l'index FAISS...")
+        if not Path(index_file).exists() or not Path(metadata_file).exists():
+            raise FileNotFoundError("Index ou metadata non trouvés. Créez-les avant de lancer le serveur.")
+        self.faiss_index = load_index(index_file)  # flat, HNSW ou IVF, compressé ou non, selon le fichier
+        with open(metadata_file, "r") as f:
+            self.texts = json.load(f)
+
+        available = [backend for backend in backends if backend.available]
+        self.router = LatencyRouter(available, explore_rate=0.0) if available else None
+
+    def retrieve_context(self, query: str, top_k: int | None = None):
+        q_vec = self.embed_model.encode([query], convert_to_numpy=True)
+        q_vec = q_vec / np.linalg.norm(q_vec, axis=1, keepdims=True)
+        scores, indices = self.faiss_index.search(q_vec, top_k or self.top_k)
+        found = indices[0] >= 0  # un index approximatif peut renvoyer -1
+        passages = [self.texts[i] for i in indices[0][found]]
+        return passages, scores[0][found]
+
+    def generate(self, question: str, passages: list) -> str:
+        """Réponse du backend choisi par le routeur (lève si tous échouent)"""
+        if self.router is None:
+            raise RuntimeError("Aucun backend LLM disponible")
+        request = {
+            "messages": [
+                {"role": "system", "content": self.system_prompt},
+                {"role": "user", "content": self.user_template.format(context="\n\n".join(passages), question=question)}
+            ],
+            **self.generation
+        }
+        text, _ = self.router.generate(request)
+        return text
+
+    def answer(self, question: str, passages: list) -> str:
+        """Comme generate, mais une erreur devient le texte de la réponse (clients qui l'affichent ou la lisent)"""
+        if self.router is None:
+            return "Erreur: Service de génération non disponible (aucun backend LLM configuré)"
+        try:
+            return self.generate(question, passages)
+        except Exception as e:
+            return f"Erreur lors de la génération: {str(e)}"
+
+    def stats(self) -> dict:
+        return {
+            "faiss_vectors": self.faiss_index.ntotal,
+            "llm": self.router.stats() if self.router is not None else None
+        }
+
+
+def memory_stats() -> dict:
+    import psutil
+    mem = psutil.virtual_memory()
+    return {
+        "ram_total_gb": round(mem.total / 1024**3, 2),
+        "ram_used_gb": round(mem.used / 1024**3, 2),
+        "ram_available_gb": round(mem.available / 1024**3, 2),
+        "ram_percent": mem.percent
+    }
+
+
+def create_app(title: str, pipeline: RAGPipeline, health: dict, model_label: str | None = None) -> FastAPI:
+    """Application avec /ask, /health (contenu `health`) et /stats; le serveur peut y ajouter ses endpoints"""
+    app = FastAPI(title=title)
+
+    @app.post("/ask")
+    def ask(request: QuestionRequest):
+        question = request.question.strip()
+        if not question:
+            raise HTTPException(status_code=400, detail="Question vide")
+
+        passages, scores = pipeline.retrieve_context(question)
+        response_text = pipeline.generate(question, passages)
+
+        result = {
+            "question": question,
+            "retrieved_passages": passages,
+            "scores": scores.tolist(),
+            "response": response_text
+        }
+        if model_label:
+            result["model"] = model_label
+        return result
+
+    @app.get("/health")
+    def health_check():
+        return {"status": "ok", **health}
+
+    @app.get("/stats")
+    def stats():
+        """Statistiques d'utilisation mémoire et des backends"""
+        return {**memory_stats(), **pipeline.stats()}
+
+    return app
@@ -4,18 +4,21 @@ from fastapi.responses import StreamingResponse, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-import faiss
 import json
-import numpy as np
-from sentence_transformers import SentenceTransformer
 from pathlib import Path
+import sys
 import tempfile
 import os
-from groq import Groq
+from groq import Groq, APIConnectionError, APITimeoutError, RateLimitError, InternalServerError
 import edge_tts
 import asyncio
 from dotenv import load_dotenv
 
+# Modules locaux (même dossier que ce serveur)
+sys.path.insert(0, str(Path(__file__).parent))
+from llm_backends import ChatCompletionsBackend
+from rag_app import RAGPipeline
+
 # Charger les variables d'environnement depuis .env
 load_dotenv()
 
@@ -50,9 +53,6 @@ except Exception as e:
     print(f"⚠️  Erreur lors du chargement de l'index audio: {e}")
 
 # ----- CONFIG -----
-INDEX_FILE = "orange_faq.index"
-METADATA_FILE = "metadata.json"
-EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 TOP_K = 5  # nombre de passages à récupérer
 
 # Groq Configuration (Gratuit et ULTRA RAPIDE !)
@@ -74,18 +74,23 @@ WHISPER_MODEL = "whisper-large-v3"  # Modèle Groq Whisper (gratuit)
 TTS_VOICE = "fr-FR-HenriNeural"  # Voix masculine professionnelle par défaut
 
 # ----- CHARGEMENT DES RESSOURCES -----
-# Embeddings
-embed_model = SentenceTransformer(EMBEDDING_MODEL)
+# Embeddings, index FAISS et passages (socle commun rag_app.py); génération par Groq
+SYSTEM_PROMPT = "Tu es un assistant virtuel pour Orange Burkina Faso. Réponds de manière claire, concise et professionnelle en utilisant UNIQUEMENT les informations du contexte fourni. Si l'information n'est pas dans le contexte, dis 'Je n'ai pas cette information dans ma base de données.'"
+USER_TEMPLATE = """Contexte:
+{context}
 
-# FAISS index
-if not Path(INDEX_FILE).exists() or not Path(METADATA_FILE).exists():
-    raise FileNotFoundError("Index ou metadata non trouvés. Créez-les avant de lancer le serveur.")
+Question: {question}
 
-faiss_index = faiss.read_index(INDEX_FILE)
+Réponds de manière claire et concise en te basant uniquement sur le contexte ci-dessus."""
 
-# Metadata
-with open(METADATA_FILE, "r") as f:
-    texts = json.load(f)
+backends = []
+if groq_client:
+    backends.append(ChatCompletionsBackend(
+        "groq", groq_client, None, model=GROQ_MODEL,
+        retryable_errors=(APIConnectionError, APITimeoutError, RateLimitError, InternalServerError)
+    ))
+pipeline = RAGPipeline(backends, SYSTEM_PROMPT, top_k=TOP_K, user_template=USER_TEMPLATE,
+                       max_tokens=300, temperature=0.1, top_p=1.0)
 
 # ----- SCHEMA DE REQUÊTE -----
 class QuestionRequest(BaseModel):
@@ -256,54 +261,6 @@ def check_local_knowledge(question: str):
 
     return None
 
-# ----- UTIL -----
-def retrieve_context(query: str, top_k: int = TOP_K):
-    q_vec = embed_model.encode([query], convert_to_numpy=True)
-    q_vec = q_vec / np.linalg.norm(q_vec, axis=1, keepdims=True)
-    scores, indices = faiss_index.search(q_vec, top_k)
-    passages = [texts[i] for i in indices[0]]
-    return passages, scores[0]
-
-def generate_response(question: str, passages: list):
-    """Génère une réponse avec Groq LLaMA 3.1 (ultra rapide!)"""
-    if not groq_client:
-        return "Erreur: Service de génération non disponible (GROQ_API_KEY manquante)"
-
-    context = "\n\n".join(passages)
-
-    # Prompt optimisé pour Groq
-    messages = [
-        {
-            "role": "system",
-            "content": "Tu es un assistant virtuel pour Orange Burkina Faso. Réponds de manière claire, concise et professionnelle en utilisant UNIQUEMENT les informations du contexte fourni. Si l'information n'est pas dans le contexte, dis 'Je n'ai pas cette information dans ma base de données.'"
-        },
-        {
-            "role": "user",
-            "content": f"""Contexte:
-{context}
-
-Question: {question}
-
-Réponds de manière claire et concise en te basant uniquement sur le contexte ci-dessus."""
-        }
-    ]
-
-    try:
-        # Appel à Groq (ultra rapide!)
-        completion = groq_client.chat.completions.create(
-            model=GROQ_MODEL,
-            messages=messages,
-            temperature=0.1,
-            max_tokens=300,
-            top_p=1,
-            stream=False
-        )
-
-        return completion.choices[0].message.content
-
-    except Exception as e:
-        return f"Erreur lors de la génération: {str(e)}"
-
 # ----- ENDPOINTS -----
 @app.post("/ask")
 def ask(request: QuestionRequest):
@@ -337,8 +294,8 @@ def ask(request: QuestionRequest):
             }
 
     # Sinon, utiliser FAISS + Groq
-    passages, scores = retrieve_context(question)
-    response_text = generate_response(question, passages)
+    passages, scores = pipeline.retrieve_context(question)
+    response_text = pipeline.answer(question, passages)
 
     return {
         "question": question,
@@ -494,8 +451,8 @@ async def voice_chat(file: UploadFile = File(...)):
         os.unlink(tmp_input_path)
 
         # 2. Génération de la réponse RAG
-        passages, scores = retrieve_context(question)
-        response_text = generate_response(question, passages)
+        passages, scores = pipeline.retrieve_context(question)
+        response_text = pipeline.answer(question, passages)
 
         # 3. Conversion de la réponse en audio avec Edge-TTS
         tmp_output = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3")
@@ -553,8 +510,8 @@ async def text_ask(request: TextAskRequest):
                 response_text = local_answer
         else:
             # Sinon, utiliser FAISS + Groq
-            passages, scores = retrieve_context(question)
-            response_text = generate_response(question, passages)
+            passages, scores = pipeline.retrieve_context(question)
+            response_text = pipeline.answer(question, passages)
 
         # 2. Préparer la réponse de base
         response_data = {
@@ -631,8 +588,8 @@ async def voice_ask(
         os.unlink(tmp_input_path)
 
         # 2. Génération de la réponse RAG
-        passages, scores = retrieve_context(question)
-        response_text = generate_response(question, passages)
+        passages, scores = pipeline.retrieve_context(question)
+        response_text = pipeline.answer(question, passages)
 
         # 3. Générer audio de réponse avec Edge-TTS
         tmp_output = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3")
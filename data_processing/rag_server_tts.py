@@ -1,29 +1,29 @@
 # rag_server_tts.py
 # RAG Chatbot avec Synthèse Vocale (TTS)
 # Optimisé pour Raspberry Pi 5
+# Recherche et génération: socle commun rag_app.py (même LLM local que rag_server_pi.py)
 
 from fastapi import FastAPI, HTTPException
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import faiss
-import json
-import numpy as np
-from sentence_transformers import SentenceTransformer
 from pathlib import Path
-from llama_cpp import Llama
+import sys
 import io
 import wave
 import subprocess
 import tempfile
 
+# Modules locaux (même dossier que ce serveur)
+sys.path.insert(0, str(Path(__file__).parent))
+from llm_backends import LlamaCppBackend
+from rag_app import RAGPipeline, memory_stats
+
 app = FastAPI(title="RAG Chatbot TTS - Orange Burkina Faso")
 
 # ----- CONFIG -----
-INDEX_FILE = "orange_faq.index"
-METADATA_FILE = "metadata.json"
-EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 TOP_K = 3
 MODEL_PATH = "tinyllama-1.1b-chat-v1.0.Q4_K_M.gguf"
+SYSTEM_PROMPT = "Tu es un assistant virtuel pour Orange Burkina Faso. Réponds aux questions en te basant UNIQUEMENT sur le contexte fourni. Si l'information n'est pas dans le contexte, dis-le poliment."
 
 # TTS Configuration
 # Options: "piper" (meilleure qualité) ou "espeak" (plus léger, plus de langues)
@@ -32,28 +32,11 @@ PIPER_MODEL = "fr_FR-siwis-medium"  # Modèle français pour Piper
 DEFAULT_LANGUAGE = "fr"  # fr, moore, dioula
 
 # ----- CHARGEMENT DES RESSOURCES -----
-print("🔄 Chargement du modèle d'embeddings...")
-embed_model = SentenceTransformer(EMBEDDING_MODEL)
-
-print("🔄 Chargement de l'index FAISS...")
-if not Path(INDEX_FILE).exists() or not Path(METADATA_FILE).exists():
-    raise FileNotFoundError("Index ou metadata non trouvés.")
-
-faiss_index = faiss.read_index(INDEX_FILE)
-with open(METADATA_FILE, "r") as f:
-    texts = json.load(f)
+llm = LlamaCppBackend(MODEL_PATH, n_ctx=2048, n_threads=4)
+pipeline = RAGPipeline([llm], SYSTEM_PROMPT, top_k=TOP_K, max_tokens=200)
 
 print("🔄 Chargement du LLM...")
-llm = Llama(
-    model_path=MODEL_PATH,
-    n_ctx=2048,
-    n_threads=4,
-    n_batch=256,
-    n_gpu_layers=0,
-    use_mmap=True,
-    use_mlock=False,
-    verbose=False
-)
+llm.load()
 
 print("✅ Serveur prêt avec TTS!")
 
@@ -168,38 +151,6 @@ def get_tts_audio(text: str, language: str = "fr", engine: str = "piper") -> byt
     else:
         return text_to_speech_espeak(text, language)
 
-# ----- FONCTIONS RAG -----
-def retrieve_context(query: str, top_k: int = TOP_K):
-    q_vec = embed_model.encode([query], convert_to_numpy=True)
-    q_vec = q_vec / np.linalg.norm(q_vec, axis=1, keepdims=True)
-    scores, indices = faiss_index.search(q_vec, top_k)
-    passages = [texts[i] for i in indices[0]]
-    return passages, scores[0]
-
-def generate_response(question: str, passages: list):
-    context = "\n\n".join(passages)
-
-    prompt = f"""<|system|>
-Tu es un assistant virtuel pour Orange Burkina Faso. Réponds aux questions en te basant UNIQUEMENT sur le contexte fourni. Si l'information n'est pas dans le contexte, dis-le poliment.<|end|>
-<|user|>
-Contexte:
-{context}
-
-Question: {question}<|end|>
-<|assistant|>"""
-
-    response = llm(
-        prompt,
-        max_tokens=200,
-        temperature=0.1,
-        top_p=0.9,
-        repeat_penalty=1.1,
-        stop=["<|end|>", "<|user|>"],
-        echo=False
-    )
-
-    return response['choices'][0]['text'].strip()
-
 # ----- ENDPOINTS -----
 @app.post("/ask")
 def ask(request: QuestionRequest):
@@ -211,8 +162,8 @@ def ask(request: QuestionRequest):
         raise HTTPException(status_code=400, detail="Question vide")
 
     # Récupération du contexte et génération de la réponse
-    passages, scores = retrieve_context(question)
-    response_text = generate_response(question, passages)
+    passages, scores = pipeline.retrieve_context(question)
+    response_text = pipeline.generate(question, passages)
 
     result = {
         "question": question,
@@ -264,8 +215,8 @@ def speak(request: QuestionRequest):
         raise HTTPException(status_code=400, detail="Question vide")
 
     # Récupération et génération
-    passages, scores = retrieve_context(question)
-    response_text = generate_response(question, passages)
+    passages, scores = pipeline.retrieve_context(question)
+    response_text = pipeline.generate(question, passages)
 
     # Générer l'audio
     try:
@@ -312,13 +263,8 @@ def list_voices():
 @app.get("/stats")
 def stats():
     """Statistiques système"""
-    import psutil
-    mem = psutil.virtual_memory()
     return {
-        "ram_total_gb": round(mem.total / 1024**3, 2),
-        "ram_used_gb": round(mem.used / 1024**3, 2),
-        "ram_available_gb": round(mem.available / 1024**3, 2),
-        "ram_percent": mem.percent,
-        "faiss_vectors": faiss_index.ntotal,
+        **memory_stats(),
+        **pipeline.stats(),
         "tts_engine": TTS_ENGINE
     }
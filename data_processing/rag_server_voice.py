@@ -11,9 +11,11 @@ import json
 import numpy as np
 from sentence_transformers import SentenceTransformer
 from pathlib import Path
-from groq import Groq
+from groq import Groq, AsyncGroq, APIConnectionError, APITimeoutError, RateLimitError, InternalServerError
+import httpx
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+import openai
 import io
 import subprocess
 import tempfile
@@ -24,12 +26,35 @@ import base64
 from datetime import datetime, date
 from threading import Lock
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import uuid
 import zipfile
 import shutil
 import re
+import time
+import asyncio
+import gc
+import threading
 from html.parser import HTMLParser
 from xml.etree import ElementTree as ET
+import sys
+
+# Modules locaux (même dossier que ce serveur)
+sys.path.insert(0, str(Path(__file__).parent))
+from embedding_store import EmbeddingStore, QueryEmbeddingCache, normalize_query
+from semantic_cache import SemanticAnswerCache
+from retrieval_engine import RetrievalEngine
+from lexical_index import BM25Index
+from sentence_stream import SentenceBuffer, split_sentences
+from latency_window import LatencyWindow
+from single_flight import AsyncSingleFlight
+from context_packer import ContextPacker
+from answer_store import AnswerStore, QuestionLog, question_key
+from admission import AdmissionScheduler, AdmissionRejected, StageLimiter
+from piper_worker import PiperPool, PiperWorkerError, pcm_to_wav, pool_cpu_sets, wav_stream_header
+from tts_cache import HotClipCache, TTSDiskCache, TieredTTSCache, synthesis_cache_key
+from llm_backends import ChatCompletionsBackend, AnthropicBackend, LlamaCppBackend, CircuitBreaker, LatencyRouter
+from index_factory import index_memory_bytes, load_index, new_index, read_params
 
 # Charger les variables d'environnement
 load_dotenv()
@@ -48,12 +73,60 @@ app.add_middleware(
 # ----- CONFIG -----
 INDEX_FILE = "orange_faq_v2.index"
 METADATA_FILE = "metadata_v2.json"
+SOURCES_FILE = "metadata_v2_sources.json"  # URL de chaque passage (create_embeddings_v2.py)
+CLEAN_DATA_FILE = "orange_services_clean_v2.json"
 EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 TOP_K = 3
+# Contexte du LLM: CONTEXT_CANDIDATES passages retrouvés, dédoublonnés, fusionnés par page
+# puis retenus par score tant que le total tient dans CONTEXT_TOKEN_BUDGET tokens
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "6"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "200"))
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", "4"))  # recherches FAISS parallèles
+# Recherche hybride BM25 + vecteurs: weighted (cosinus pondéré + BM25 normalisé), rrf ou off
+HYBRID_FUSION = os.getenv("HYBRID_FUSION", "weighted").lower()
+HYBRID_VECTOR_WEIGHT = float(os.getenv("HYBRID_VECTOR_WEIGHT", "0.7"))
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+HYBRID_CANDIDATE_FACTOR = int(os.getenv("HYBRID_CANDIDATE_FACTOR", "4"))  # candidats = TOP_K * facteur
+VOICE_STREAM_TTS_WORKERS = int(os.getenv("VOICE_STREAM_TTS_WORKERS", "2"))  # phrases synthétisées en parallèle
+VOICE_STREAM_MIN_CHARS = int(os.getenv("VOICE_STREAM_MIN_CHARS", "25"))  # longueur minimale d'un segment audio
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "500"))  # /text/ask/batch
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))  # appels Groq simultanés par lot
+
+# Admission par priorité (voix > texte > admin/lot): appels LLM et synthèses TTS simultanés
+# bornés, file d'attente au-delà; une classe est refusée (503) quand la file atteint sa limite
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))
+TTS_CONCURRENCY = int(os.getenv("TTS_CONCURRENCY", "2"))
+ADMISSION_MAX_QUEUE = {
+    "voice": int(os.getenv("ADMISSION_QUEUE_VOICE", "32")),
+    "text": int(os.getenv("ADMISSION_QUEUE_TEXT", "16")),
+    "admin": int(os.getenv("ADMISSION_QUEUE_ADMIN", "4"))
+}
 
 # Configuration Groq API (cloud LLM)
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "20"))  # délai total par question, tentatives comprises
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_S = float(os.getenv("LLM_RETRY_BASE_S", "0.5"))  # attente max avant la 1re relance (x2 ensuite)
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "10"))  # connexions HTTP gardées ouvertes par API
+
+# Backends de génération: le routeur choisit le plus rapide récemment parmi ceux de
+# qualité >= LLM_MIN_QUALITY (OpenAI/Anthropic actifs seulement si leur clé est définie)
+LLM_BACKENDS = [name.strip() for name in os.getenv("LLM_BACKENDS", "groq,openai,anthropic,local").split(",") if name.strip()]
+OPENAI_LLM_MODEL = os.getenv("OPENAI_LLM_MODEL", "gpt-4o-mini")
+ANTHROPIC_MODEL = os.getenv("ANTHROPIC_MODEL", "claude-3-5-haiku-20241022")
+LLM_QUALITY = {"groq": 2, "openai": 2, "anthropic": 2, "local": 1}  # 1 = petit modèle local (TinyLlama)
+LLM_MIN_QUALITY = int(os.getenv("LLM_MIN_QUALITY", "2"))
+LLM_EXPLORE_RATE = float(os.getenv("LLM_EXPLORE_RATE", "0.05"))  # requêtes envoyées à un autre backend pour le mesurer
+
+# LLM local de secours (llama.cpp, même modèle que rag_server_pi.py) et disjoncteurs
+LOCAL_LLM_MODEL = os.getenv("LOCAL_LLM_MODEL", "tinyllama-1.1b-chat-v1.0.Q4_K_M.gguf")
+LOCAL_LLM_THREADS = int(os.getenv("LOCAL_LLM_THREADS", "4"))
+LOCAL_LLM_CTX = int(os.getenv("LOCAL_LLM_CTX", "2048"))
+LLM_LATENCY_BUDGET_S = float(os.getenv("LLM_LATENCY_BUDGET_S", "6"))  # au-delà, l'appel cloud compte comme un échec
+LLM_BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))  # sur les 20 derniers appels
+LLM_BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "5"))
+LLM_BREAKER_COOLDOWN_S = float(os.getenv("LLM_BREAKER_COOLDOWN_S", "30"))  # avant de resonder un backend
 
 # STT Configuration
 STT_ENGINE = "faster-whisper"  # Options: "whisper", "vosk", "faster-whisper"
@@ -64,12 +137,21 @@ VOSK_MODEL_PATH = "models/vosk-model-small-fr-0.22"  # Si vosk
 TTS_ENGINE = "piper"  # ou "espeak" (piper = meilleure qualité!)
 PIPER_BIN = "/home/suprox/Projet/Laravel/ai/orangebf/piper_bin/piper"
 PIPER_MODEL = "/home/suprox/Projet/Laravel/ai/orangebf/piper_models/fr_FR-siwis-medium.onnx"
+PIPER_TIMEOUT_S = float(os.getenv("PIPER_TIMEOUT_S", "30"))  # synthèse d'un énoncé par un worker persistant
+# Workers Piper épinglés chacun sur un cœur; les PIPER_RESERVED_CORES premiers restent aux embeddings/Whisper
+PIPER_RESERVED_CORES = int(os.getenv("PIPER_RESERVED_CORES", "2"))
+PIPER_POOL_SIZE = int(os.getenv("PIPER_POOL_SIZE", str(max(1, (os.cpu_count() or 1) - PIPER_RESERVED_CORES))))
 DEFAULT_LANGUAGE = "fr"
 
 # TTS Cache Configuration
 TTS_CACHE_DIR = Path("static/tts_cache")
-TTS_CACHE_DIR.mkdir(parents=True, exist_ok=True)
-tts_cache_stats = {"hits": 0, "misses": 0}  # Pour statistiques
+TTS_CACHE_MAX_MB = float(os.getenv("TTS_CACHE_MAX_MB", "500"))  # au-delà, éviction (carte SD)
+TTS_CACHE_POLICY = os.getenv("TTS_CACHE_POLICY", "lru")  # lru ou lfu
+TTS_MEMORY_CACHE_MB = float(os.getenv("TTS_MEMORY_CACHE_MB", "32"))  # clips chauds gardés en RAM
+tts_cache = TieredTTSCache(
+    HotClipCache(int(TTS_MEMORY_CACHE_MB * 1024 * 1024)),
+    TTSDiskCache(TTS_CACHE_DIR, int(TTS_CACHE_MAX_MB * 1024 * 1024), TTS_CACHE_POLICY)
+)
 
 # Répertoires et fichiers pour la base de connaissances dynamique
 KNOWLEDGE_STORE_DIR = Path("knowledge_store")
@@ -78,9 +160,29 @@ KNOWLEDGE_UPLOADS_DIR = KNOWLEDGE_STORE_DIR / "uploads"
 KNOWLEDGE_UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
 CUSTOM_DOCS_FILE = KNOWLEDGE_STORE_DIR / "documents.json"
 CUSTOM_SEGMENTS_FILE = KNOWLEDGE_STORE_DIR / "segments.json"
+EMBEDDING_CACHE_DIR = KNOWLEDGE_STORE_DIR / "embeddings"
+EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float16")  # float16 ou float32
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "2048"))
+QUERY_CACHE_PERSIST = os.getenv("QUERY_CACHE_PERSIST", "true").lower() in ("1", "true", "yes")
+QUERY_CACHE_FILE = KNOWLEDGE_STORE_DIR / "query_embeddings.npz"
+# Compression des index de documents importés: none, fp16, sq8 ou pq (entraîné sur le corpus de base)
+CUSTOM_INDEX_CODEC = os.getenv("CUSTOM_INDEX_CODEC", "none")
+
+# Cache sémantique des réponses (questions paraphrasées -> même réponse)
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.93"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "512"))
+
+# Réponses pré-calculées (contexte + réponse LLM + audio) des questions les plus posées
+QUESTION_LOG_FILE = KNOWLEDGE_STORE_DIR / "question_log.jsonl"
+ANSWER_STORE_DIR = KNOWLEDGE_STORE_DIR / "answer_store"
+PRECOMPUTE_TOP_N = int(os.getenv("PRECOMPUTE_TOP_N", "30"))  # par langue
+PRECOMPUTE_MIN_COUNT = int(os.getenv("PRECOMPUTE_MIN_COUNT", "3"))  # occurrences minimales dans le journal
+PRECOMPUTE_INTERVAL_S = float(os.getenv("PRECOMPUTE_INTERVAL_S", "21600"))  # 0 = pas de tâche de fond
 knowledge_documents = {}
 custom_segments = []
-custom_index = None
+custom_segments_by_id = {}  # vector_id FAISS -> segment
+next_segment_id = 0
+custom_indexes = {}  # catégorie -> IndexIDMap2
 knowledge_lock = Lock()
 
 # Paramètres en temps réel (LLM, TTS, etc.)
@@ -134,20 +236,106 @@ network_settings = {
 # ----- CHARGEMENT DES RESSOURCES -----
 print("🔄 Chargement du modèle d'embeddings...")
 embed_model = SentenceTransformer(EMBEDDING_MODEL)
+embedding_store = EmbeddingStore(
+    EMBEDDING_CACHE_DIR,
+    EMBEDDING_MODEL,
+    embed_model.get_sentence_embedding_dimension(),
+    EMBEDDING_CACHE_DTYPE
+)
+print(f"✅ Cache d'embeddings: {embedding_store.stats()['rows']} segments déjà encodés")
+query_cache = QueryEmbeddingCache(
+    EMBEDDING_MODEL,
+    max_entries=QUERY_CACHE_SIZE,
+    persist_path=QUERY_CACHE_FILE if QUERY_CACHE_PERSIST else None
+)
+semantic_cache = SemanticAnswerCache(SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_SIZE)
+answer_flights = AsyncSingleFlight()  # questions identiques simultanées -> un seul calcul
+question_log = QuestionLog(QUESTION_LOG_FILE)
+answer_store = AnswerStore(ANSWER_STORE_DIR)
+precompute_lock = Lock()  # une seule reconstruction du magasin à la fois
+precompute_wakeup = threading.Event()  # réveille la tâche de fond (index ou modèle changé)
+admission = AdmissionScheduler({
+    "llm": StageLimiter("llm", LLM_CONCURRENCY, ADMISSION_MAX_QUEUE),
+    "tts": StageLimiter("tts", TTS_CONCURRENCY, ADMISSION_MAX_QUEUE)
+})
+index_version = ""  # empreinte des index base + personnalisé
 
 print("🔄 Chargement de l'index FAISS...")
 if not Path(INDEX_FILE).exists() or not Path(METADATA_FILE).exists():
     raise FileNotFoundError("Index ou metadata non trouvés.")
 
-faiss_index = faiss.read_index(INDEX_FILE)
+faiss_index = load_index(INDEX_FILE)  # flat, HNSW ou IVF, compressé ou non, selon le fichier
 with open(METADATA_FILE, "r") as f:
     texts = json.load(f)
 
+def load_base_sources() -> list | None:
+    """URL de chaque passage de base (pour fusionner les phrases voisines d'une même page)"""
+    if Path(SOURCES_FILE).exists():
+        with open(SOURCES_FILE, "r", encoding="utf-8") as f:
+            urls = json.load(f)
+    elif Path(CLEAN_DATA_FILE).exists():
+        # Index construit avant le fichier des sources: même filtre que create_embeddings_v2.py
+        with open(CLEAN_DATA_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        urls = [item.get("url") for item in data if "text" in item and len(item["text"]) > 10]
+    else:
+        return None
+    if len(urls) != len(texts):
+        print(f"⚠️  Sources des passages ignorées ({len(urls)} URL pour {len(texts)} passages)")
+        return None
+    return urls
+
+base_urls = load_base_sources()
+
+base_index_info = {**read_params(INDEX_FILE), "memory_bytes": index_memory_bytes(faiss_index)}
+print(f"✅ Index de base: {faiss_index.ntotal} vecteurs, {base_index_info.get('factory', 'Flat')}, "
+      f"{base_index_info['memory_bytes'] / 1e6:.1f} Mo")
+
+retrieval_engine = RetrievalEngine(max_workers=RETRIEVAL_WORKERS)
+retrieval_engine.register(
+    "base",
+    faiss_index,
+    lambda idx: {
+        "text": texts[idx],
+        "source": "base",
+        "url": base_urls[idx] if base_urls else None,
+        "position": idx
+    } if idx < len(texts) else None,
+    category="base"
+)
+
+context_packer = ContextPacker(budget_tokens=CONTEXT_TOKEN_BUDGET)
+
+# Index lexical (codes USSD, numéros, noms de produits) sur le corpus de base + documents importés
+lexical_index = BM25Index()
+if HYBRID_FUSION != "off":
+    started = time.perf_counter()
+    lexical_index.add_many((("base", idx), text) for idx, text in enumerate(texts))
+    retrieval_engine.attach_lexical(
+        lexical_index,
+        method=HYBRID_FUSION,
+        vector_weight=HYBRID_VECTOR_WEIGHT,
+        rrf_k=HYBRID_RRF_K,
+        candidate_factor=HYBRID_CANDIDATE_FACTOR
+    )
+    print(f"✅ Index BM25: {lexical_index.stats()['terms']} termes, fusion {HYBRID_FUSION} "
+          f"({time.perf_counter() - started:.2f}s)")
+
 print("🔄 Initialisation du client Groq API...")
 if not GROQ_API_KEY:
     raise ValueError("GROQ_API_KEY non définie dans le fichier .env")
 
-groq_client = Groq(api_key=GROQ_API_KEY)
+groq_client = Groq(api_key=GROQ_API_KEY, timeout=LLM_TIMEOUT_S)
+# Client asynchrone pour les endpoints async: pool de connexions partagé, relances gérées
+# par RemoteBackend.agenerate (délai global + jitter) plutôt que par le SDK
+groq_async_client = AsyncGroq(
+    api_key=GROQ_API_KEY,
+    max_retries=0,
+    http_client=httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=LLM_POOL_SIZE, max_keepalive_connections=LLM_POOL_SIZE),
+        timeout=httpx.Timeout(LLM_TIMEOUT_S, connect=5.0)
+    )
+)
 print(f"✅ Groq API prêt avec modèle: {GROQ_MODEL}")
 
 # Configuration OpenAI TTS
@@ -160,6 +348,87 @@ else:
     openai_client = None
     print("⚠️  OPENAI_API_KEY non définie - endpoint /speak désactivé")
 
+def _async_http_client() -> httpx.AsyncClient:
+    """Pool de connexions d'un client LLM asynchrone"""
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=LLM_POOL_SIZE, max_keepalive_connections=LLM_POOL_SIZE),
+        timeout=httpx.Timeout(LLM_TIMEOUT_S, connect=5.0)
+    )
+
+def build_llm_backends() -> list:
+    """Backends de LLM_BACKENDS utilisables (clé API définie, SDK installé, modèle local présent)"""
+    retry_settings = {"timeout_s": LLM_TIMEOUT_S, "max_retries": LLM_MAX_RETRIES, "retry_base_s": LLM_RETRY_BASE_S}
+    backends = []
+    for name in LLM_BACKENDS:
+        if name == "groq":
+            backends.append(ChatCompletionsBackend(
+                "groq", groq_client, groq_async_client, quality=LLM_QUALITY["groq"],
+                # Erreurs transitoires: réseau, délai dépassé côté HTTP, quota (429), erreur serveur (5xx)
+                retryable_errors=(APIConnectionError, APITimeoutError, RateLimitError, InternalServerError),
+                **retry_settings
+            ))
+        elif name == "openai":
+            if not OPENAI_API_KEY:
+                continue
+            backends.append(ChatCompletionsBackend(
+                "openai",
+                OpenAI(api_key=OPENAI_API_KEY, timeout=LLM_TIMEOUT_S),
+                AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0, http_client=_async_http_client()),
+                model=OPENAI_LLM_MODEL,
+                quality=LLM_QUALITY["openai"],
+                retryable_errors=(openai.APIConnectionError, openai.APITimeoutError,
+                                  openai.RateLimitError, openai.InternalServerError),
+                **retry_settings
+            ))
+        elif name == "anthropic":
+            if not os.getenv("ANTHROPIC_API_KEY"):
+                continue
+            try:
+                import anthropic
+            except ImportError:
+                print("⚠️  ANTHROPIC_API_KEY définie mais SDK absent. Installez: pip install anthropic")
+                continue
+            backends.append(AnthropicBackend(
+                "anthropic",
+                anthropic.Anthropic(timeout=LLM_TIMEOUT_S),
+                anthropic.AsyncAnthropic(max_retries=0, http_client=_async_http_client()),
+                model=ANTHROPIC_MODEL,
+                quality=LLM_QUALITY["anthropic"],
+                retryable_errors=(anthropic.APIConnectionError, anthropic.APITimeoutError,
+                                  anthropic.RateLimitError, anthropic.InternalServerError),
+                **retry_settings
+            ))
+        elif name == "local":
+            backend = LlamaCppBackend(LOCAL_LLM_MODEL, n_ctx=LOCAL_LLM_CTX, n_threads=LOCAL_LLM_THREADS,
+                                      quality=LLM_QUALITY["local"])
+            if not backend.available:
+                print(f"⚠️  {LOCAL_LLM_MODEL} introuvable: pas de LLM local de secours")
+                continue
+            backends.append(backend)
+        else:
+            print(f"⚠️  Backend LLM inconnu ignoré: {name}")
+    return backends
+
+def _llm_breaker(backend) -> CircuitBreaker:
+    # Le modèle local sur CPU est lent par nature: seul son taux d'erreur compte
+    latency_budget_s = LLM_LATENCY_BUDGET_S if backend.quality >= LLM_MIN_QUALITY else float("inf")
+    return CircuitBreaker(
+        latency_budget_s=latency_budget_s,
+        error_rate=LLM_BREAKER_ERROR_RATE,
+        min_calls=LLM_BREAKER_MIN_CALLS,
+        cooldown_s=LLM_BREAKER_COOLDOWN_S,
+        name=backend.name
+    )
+
+llm_router = LatencyRouter(
+    build_llm_backends(),
+    min_quality=LLM_MIN_QUALITY,
+    explore_rate=LLM_EXPLORE_RATE,
+    breaker_factory=_llm_breaker
+)
+for backend in llm_router.backends:
+    print(f"✅ Backend LLM {backend.name}: {backend.model or GROQ_MODEL} (qualité {backend.quality})")
+
 # Configuration Google Cloud TTS
 print("🔄 Initialisation du client Google Cloud TTS...")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
@@ -332,20 +601,166 @@ def save_documents_state():
     except Exception as e:
         print(f"❌ Erreur sauvegarde segments: {e}")
 
+def _encode_normalized(texts_to_embed: list) -> np.ndarray:
+    embeddings = embed_model.encode(texts_to_embed, convert_to_numpy=True).astype(np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+def embed_texts(texts_to_embed: list) -> np.ndarray:
+    """Embeddings normalisés, en n'encodant que les textes absents du cache disque"""
+    return embedding_store.get_or_encode(texts_to_embed, _encode_normalized)
+
+custom_index_template = None  # index vide (entraîné si besoin) cloné pour chaque catégorie
+
+def _base_training_vectors() -> np.ndarray:
+    """
+    Vecteurs du corpus de base pour entraîner SQ8/PQ: relus depuis l'index, sinon réencodés
+    directement (hors cache d'embeddings: compact() les supprimerait au prochain démarrage)
+    """
+    try:
+        return faiss_index.reconstruct_n(0, faiss_index.ntotal)
+    except RuntimeError:
+        return _encode_normalized(texts)
+
+def _new_custom_index():
+    """Index FAISS avec identifiants stables: permet l'ajout et la suppression ciblés"""
+    global custom_index_template
+    if custom_index_template is None:
+        dimension = embed_model.get_sentence_embedding_dimension()
+        params = {"codec": CUSTOM_INDEX_CODEC}
+        try:
+            train_vectors = _base_training_vectors() if CUSTOM_INDEX_CODEC in ("sq8", "pq") else None
+            custom_index_template, effective = new_index(dimension, "flat", params, train_vectors)
+            print(f"✅ Index personnalisés: {effective['factory']}")
+        except Exception as e:
+            print(f"⚠️  Codec {CUSTOM_INDEX_CODEC} indisponible pour les documents importés ({e}), vecteurs float32")
+            custom_index_template, _ = new_index(dimension, "flat")
+    return faiss.IndexIDMap2(faiss.clone_index(custom_index_template))
+
+def _custom_index_name(category: str) -> str:
+    return f"custom:{category}"
+
+def _segment_category(segment: dict) -> str:
+    return segment.get("category") or knowledge_documents.get(segment.get("doc_id"), {}).get("category", "general")
+
+def _lookup_custom_segment(vector_id: int):
+    segment = custom_segments_by_id.get(vector_id)
+    if segment is None:
+        return None
+    return {"text": segment["text"], "source": "custom", "doc_id": segment.get("doc_id"), "position": segment.get("order")}
+
+def custom_vectors_count() -> int:
+    return sum(index.ntotal for index in custom_indexes.values())
+
+def _assign_segment_ids(segments: list):
+    global next_segment_id
+    for segment in segments:
+        if segment.get("vector_id") is None:
+            segment["vector_id"] = next_segment_id
+            next_segment_id += 1
+
+def _publish_custom_index(category: str, index):
+    """Remplace le sous-index publié; vide, il est retiré du moteur"""
+    if index.ntotal == 0:
+        custom_indexes.pop(category, None)
+        retrieval_engine.unregister(_custom_index_name(category))
+        return
+    custom_indexes[category] = index
+    retrieval_engine.register(_custom_index_name(category), index, _lookup_custom_segment, category=category)
+
+def _add_segments_to_index(segments: list):
+    """
+    Encode uniquement les nouveaux segments et les ajoute au sous-index de leur catégorie.
+    Un index publié n'est jamais modifié (recherches en cours sur d'autres threads):
+    la copie modifiée remplace l'ancienne dans le moteur.
+    """
+    if not segments:
+        return
+    _assign_segment_ids(segments)
+    embeddings = embed_texts([segment["text"] for segment in segments])
+
+    positions_by_category = {}
+    for position, segment in enumerate(segments):
+        segment["category"] = _segment_category(segment)
+        positions_by_category.setdefault(segment["category"], []).append(position)
+        custom_segments_by_id[segment["vector_id"]] = segment
+
+    for category, positions in positions_by_category.items():
+        current = custom_indexes.get(category)
+        index = faiss.clone_index(current) if current is not None else _new_custom_index()
+        ids = np.array([segments[position]["vector_id"] for position in positions], dtype=np.int64)
+        index.add_with_ids(embeddings[positions], ids)
+        _publish_custom_index(category, index)
+        if retrieval_engine.lexical is not None:
+            name = _custom_index_name(category)
+            lexical_index.add_many(((name, segments[position]["vector_id"]), segments[position]["text"])
+                                   for position in positions)
+
+def _remove_ids_from_index(ids: list):
+    ids_by_category = {}
+    for vector_id in ids:
+        segment = custom_segments_by_id.pop(vector_id, None)
+        if segment is not None:
+            ids_by_category.setdefault(segment.get("category"), []).append(vector_id)
+
+    for category, category_ids in ids_by_category.items():
+        current = custom_indexes.get(category)
+        if current is None:
+            continue
+        index = faiss.clone_index(current)
+        index.remove_ids(np.array(category_ids, dtype=np.int64))
+        _publish_custom_index(category, index)
+        lexical_index.remove((_custom_index_name(category), vector_id) for vector_id in category_ids)
+
 def rebuild_custom_index():
-    """Reconstruit l'index FAISS des documents importés via l'UI"""
-    global custom_index
+    """Reconstruit entièrement les sous-index FAISS des documents importés via l'UI"""
+    global next_segment_id
+    for category in list(custom_indexes):
+        retrieval_engine.unregister(_custom_index_name(category))
+        lexical_index.remove_index(_custom_index_name(category))
+    custom_indexes.clear()
+    custom_segments_by_id.clear()
+    existing_ids = [segment["vector_id"] for segment in custom_segments if segment.get("vector_id") is not None]
+    next_segment_id = max(existing_ids, default=-1) + 1
     if not custom_segments:
-        custom_index = None
         return
 
-    texts_segments = [segment["text"] for segment in custom_segments]
-    embeddings = embed_model.encode(texts_segments, convert_to_numpy=True)
-    embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    _add_segments_to_index(custom_segments)
+    print(f"✅ Index personnalisés reconstruits ({custom_vectors_count()} segments, {len(custom_indexes)} catégories)")
 
-    custom_index = faiss.IndexFlatIP(embeddings.shape[1])
-    custom_index.add(embeddings)
-    print(f"✅ Index personnalisé reconstruit ({custom_index.ntotal} segments)")
+def rebuild_audio_index():
+    """Index des descriptions audio (hymne, salutations...), interrogé sur demande (catégorie "audio")"""
+    entries = [(audio_id, entry) for audio_id, entry in audio_map.items() if entry.get("description")]
+    if not entries:
+        retrieval_engine.unregister("audio")
+        semantic_cache.invalidate()
+        return
+
+    descriptions = [f"{entry['description']} ({entry.get('langue', '')})" for _, entry in entries]
+    index = faiss.IndexFlatIP(embed_model.get_sentence_embedding_dimension())
+    index.add(embed_texts(descriptions))
+
+    def lookup(position: int):
+        if position >= len(entries):
+            return None
+        audio_id, entry = entries[position]
+        return {"text": descriptions[position], "source": "audio", "audio_id": audio_id}
+
+    retrieval_engine.register("audio", index, lookup, category="audio", default=False)
+    semantic_cache.invalidate()
+
+def bump_index_version():
+    """Recalcule l'empreinte des index (base + personnalisé) et invalide le cache sémantique"""
+    global index_version
+    digest = hashlib.sha1()
+    index_path = Path(INDEX_FILE)
+    if index_path.exists():
+        stat = index_path.stat()
+        digest.update(f"{INDEX_FILE}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+    for segment in custom_segments:
+        digest.update(f"{segment.get('doc_id')}:{segment.get('vector_id')}".encode("utf-8"))
+    index_version = digest.hexdigest()[:16]
+    semantic_cache.invalidate()
+    precompute_wakeup.set()
 
 def load_custom_documents():
     global knowledge_documents, custom_segments
@@ -362,6 +777,10 @@ def load_custom_documents():
             print(f"⚠️  Impossible de charger {CUSTOM_SEGMENTS_FILE}: {e}")
             custom_segments = []
     rebuild_custom_index()
+    bump_index_version()
+    removed = embedding_store.compact([segment["text"] for segment in custom_segments])
+    if removed:
+        print(f"🧹 Cache d'embeddings compacté ({removed} vecteurs obsolètes)")
 
 def add_log(message: str, scope: str = "system", level: str = "info"):
     entry = {
@@ -398,6 +817,7 @@ def get_metrics_snapshot():
 # Charger les documents personnalisés existants au démarrage
 print("🔄 Chargement des documents personnalisés...")
 load_custom_documents()
+rebuild_audio_index()
 
 def format_response_text(text: str) -> str:
     """Nettoie les réponses pour supprimer le markdown et les bullets bruts"""
@@ -412,10 +832,14 @@ def format_response_text(text: str) -> str:
     return clean.strip()
 
 def _remove_segments_for_document(doc_id: str):
+    """Retire les segments d'un document ainsi que leurs vecteurs de l'index"""
     global custom_segments
     if not custom_segments:
         return
+    removed_ids = [segment["vector_id"] for segment in custom_segments
+                   if segment.get("doc_id") == doc_id and segment.get("vector_id") is not None]
     custom_segments = [segment for segment in custom_segments if segment.get("doc_id") != doc_id]
+    _remove_ids_from_index(removed_ids)
 
 def _persist_document(
     doc_id: str,
@@ -445,15 +869,15 @@ def _persist_document(
     knowledge_documents[doc_id] = metadata
     _remove_segments_for_document(doc_id)
 
-    for order, chunk in enumerate(chunks):
-        custom_segments.append({
-            "doc_id": doc_id,
-            "text": chunk,
-            "order": order
-        })
+    new_segments = [
+        {"doc_id": doc_id, "text": chunk, "order": order}
+        for order, chunk in enumerate(chunks)
+    ]
+    _add_segments_to_index(new_segments)
+    custom_segments.extend(new_segments)
+    bump_index_version()
 
     save_documents_state()
-    rebuild_custom_index()
     return metadata
 
 def convert_audio_to_wav(source_path: Path, target_path: Path):
@@ -467,10 +891,6 @@ def convert_audio_to_wav(source_path: Path, target_path: Path):
         capture_output=True
     )
 
-# Initialisation STT (lazy loading)
-whisper_model = None
-vosk_model = None
-
 print("✅ Serveur vocal prêt!")
 
 # ----- SCHEMAS -----
@@ -482,6 +902,15 @@ class TextQuestion(BaseModel):
     question: str
     language: str = "fr"
     enable_voice: bool = True
+    categories: list[str] | None = None  # ex: ["base", "tarifs"]; None = tous les index par défaut
+
+class BatchQuestion(BaseModel):
+    question: str
+    language: str = "fr"
+
+class TextBatchRequest(BaseModel):
+    questions: list[BatchQuestion]
+    categories: list[str] | None = None
 
 class SpeakRequest(BaseModel):
     text: str
@@ -507,40 +936,118 @@ class NetworkSettingsUpdate(BaseModel):
     system_update: dict | None = None
 
 # ----- FONCTIONS STT -----
-def init_whisper():
-    """Initialisation lazy de Whisper"""
-    global whisper_model
-    if whisper_model is None:
+# Registre des modèles STT: chaque moteur est chargé une seule fois puis gardé
+# en mémoire. Le moteur actif est préchargé au démarrage et remplacé proprement
+# lorsque /settings/dialogue change "stt_engine".
+stt_registry_lock = Lock()
+stt_models = {}
+
+def _process_rss_mb():
+    """Mémoire résidente du processus (Mo), None si psutil indisponible"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except Exception:
+        return None
+
+def _load_stt_model(engine: str):
+    """Construit le modèle pour un moteur STT donné"""
+    if engine == "whisper":
         try:
             import whisper
-            print(f"🔄 Chargement de Whisper ({WHISPER_MODEL})...")
-            whisper_model = whisper.load_model(WHISPER_MODEL)
-            print("✅ Whisper chargé")
         except ImportError:
             raise Exception("Whisper non installé. Installez: pip install openai-whisper")
-    return whisper_model
-
-def init_vosk():
-    """Initialisation lazy de Vosk"""
-    global vosk_model
-    if vosk_model is None:
+        return whisper.load_model(WHISPER_MODEL)
+    if engine == "vosk":
         try:
             from vosk import Model
-            print(f"🔄 Chargement de Vosk...")
-            if not Path(VOSK_MODEL_PATH).exists():
-                raise FileNotFoundError(f"Modèle Vosk non trouvé: {VOSK_MODEL_PATH}")
-            vosk_model = Model(VOSK_MODEL_PATH)
-            print("✅ Vosk chargé")
         except ImportError:
             raise Exception("Vosk non installé. Installez: pip install vosk")
-    return vosk_model
+        if not Path(VOSK_MODEL_PATH).exists():
+            raise FileNotFoundError(f"Modèle Vosk non trouvé: {VOSK_MODEL_PATH}")
+        return Model(VOSK_MODEL_PATH)
+    if engine == "faster-whisper":
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError:
+            raise Exception("Faster-Whisper non installé. Installez: pip install faster-whisper")
+        return WhisperModel(WHISPER_MODEL, device="cpu", compute_type="int8")
+    raise Exception(f"Moteur STT inconnu: {engine}")
+
+def get_stt_model(engine: str):
+    """Retourne le modèle chargé pour ce moteur (chargement unique)"""
+    entry = stt_models.get(engine)
+    if entry is not None:
+        return entry["model"]
+
+    with stt_registry_lock:
+        entry = stt_models.get(engine)
+        if entry is None:
+            print(f"🔄 Chargement du moteur STT {engine}...")
+            rss_before = _process_rss_mb()
+            started = time.perf_counter()
+            model = _load_stt_model(engine)
+            load_time = time.perf_counter() - started
+            rss_after = _process_rss_mb()
+            entry = {
+                "model": model,
+                "loaded_at": datetime.utcnow().isoformat() + "Z",
+                "load_time_s": round(load_time, 3),
+                "rss_mb": round(rss_after - rss_before, 1) if rss_before is not None and rss_after is not None else None,
+                "inference_count": 0,
+                "inference_total_s": 0.0,
+                "last_inference_s": None
+            }
+            stt_models[engine] = entry
+            print(f"✅ {engine} chargé en {load_time:.2f}s")
+    return entry["model"]
+
+def release_stt_model(engine: str):
+    """Décharge un moteur STT du registre"""
+    with stt_registry_lock:
+        entry = stt_models.pop(engine, None)
+    if entry is not None:
+        # Les requêtes en cours gardent leur référence au modèle jusqu'à la fin
+        del entry
+        gc.collect()
+        print(f"♻️  Moteur STT {engine} déchargé")
+
+def swap_stt_engine(new_engine: str, previous_engine: str | None):
+    """Charge le nouveau moteur avant de libérer l'ancien"""
+    get_stt_model(new_engine)
+    if previous_engine and previous_engine != new_engine:
+        release_stt_model(previous_engine)
+
+def record_stt_inference(engine: str, elapsed: float):
+    with stt_registry_lock:
+        entry = stt_models.get(engine)
+        if entry is None:
+            return
+        entry["inference_count"] += 1
+        entry["inference_total_s"] += elapsed
+        entry["last_inference_s"] = round(elapsed, 3)
+
+def get_stt_registry_snapshot():
+    with stt_registry_lock:
+        snapshot = {}
+        for engine, entry in stt_models.items():
+            count = entry["inference_count"]
+            snapshot[engine] = {
+                "loaded_at": entry["loaded_at"],
+                "load_time_s": entry["load_time_s"],
+                "rss_mb": entry["rss_mb"],
+                "inference_count": count,
+                "avg_inference_s": round(entry["inference_total_s"] / count, 3) if count else None,
+                "last_inference_s": entry["last_inference_s"]
+            }
+        return snapshot
 
 def speech_to_text_whisper(audio_file: str, language: str = "fr") -> str:
     """
     Transcription audio avec Whisper
     Retourne le texte transcrit
     """
-    model = init_whisper()
+    model = get_stt_model("whisper")
 
     # Mapping des codes de langue
     lang_map = {
@@ -566,7 +1073,7 @@ def speech_to_text_vosk(audio_file: str, language: str = "fr") -> str:
     """
     Transcription audio avec Vosk
     """
-    model = init_vosk()
+    model = get_stt_model("vosk")
 
     try:
         from vosk import KaldiRecognizer
@@ -604,19 +1111,14 @@ def speech_to_text_faster_whisper(audio_file: str, language: str = "fr") -> str:
     """
     Transcription avec Faster-Whisper (plus rapide que Whisper standard)
     """
-    try:
-        from faster_whisper import WhisperModel
-
-        # Charger le modèle (cache automatique)
-        model = WhisperModel(WHISPER_MODEL, device="cpu", compute_type="int8")
+    model = get_stt_model("faster-whisper")
 
+    try:
         segments, info = model.transcribe(audio_file, language=language, beam_size=5)
 
         text = " ".join([segment.text for segment in segments])
         return text.strip()
 
-    except ImportError:
-        raise Exception("Faster-Whisper non installé. Installez: pip install faster-whisper")
     except Exception as e:
         raise Exception(f"Erreur Faster-Whisper: {e}")
 
@@ -626,77 +1128,90 @@ def transcribe_audio(audio_file: str, language: str = "fr", engine: str = None)
     """
     stt = engine or STT_ENGINE
 
+    started = time.perf_counter()
     if stt == "whisper":
-        return speech_to_text_whisper(audio_file, language)
+        text = speech_to_text_whisper(audio_file, language)
     elif stt == "vosk":
-        return speech_to_text_vosk(audio_file, language)
+        text = speech_to_text_vosk(audio_file, language)
     elif stt == "faster-whisper":
-        return speech_to_text_faster_whisper(audio_file, language)
+        text = speech_to_text_faster_whisper(audio_file, language)
     else:
         raise Exception(f"Moteur STT inconnu: {stt}")
+    record_stt_inference(stt, time.perf_counter() - started)
+    return text
+
+# Précharger le moteur actif pour éviter le temps de chargement à la première requête
+print(f"🔄 Préchargement du moteur STT ({runtime_settings['stt_engine']})...")
+try:
+    get_stt_model(runtime_settings["stt_engine"])
+except Exception as e:
+    print(f"⚠️  Préchargement STT impossible: {e}")
 
 # ----- FONCTIONS TTS -----
+# Processus Piper persistants (modèle chargé une fois), relancés s'ils plantent; les phrases
+# d'une longue réponse sont synthétisées en parallèle puis recollées en un seul WAV
+piper_pool = PiperPool(
+    PIPER_BIN,
+    PIPER_MODEL,
+    size=PIPER_POOL_SIZE,
+    cpu_sets=pool_cpu_sets(PIPER_POOL_SIZE, PIPER_RESERVED_CORES),
+    timeout_s=PIPER_TIMEOUT_S
+)
+if TTS_ENGINE == "piper":
+    print(f"🔄 Démarrage de {PIPER_POOL_SIZE} worker(s) Piper...")
+    try:
+        piper_pool.start()
+        print(f"✅ Workers Piper prêts ({piper_pool.sample_rate} Hz, cœurs "
+              f"{[worker.stats()['cpus'] for worker in piper_pool.workers]})")
+    except Exception as e:
+        print(f"⚠️  Workers Piper non démarrés (repli espeak si l'échec persiste): {e}")
+
+def piper_cache_name(text: str, language: str) -> str:
+    """Clé du cache: tous les paramètres de synthèse (un changement de réglage ne sert pas d'audio périmé)"""
+    return synthesis_cache_key(
+        text,
+        language,
+        "piper",
+        runtime_settings.get("voice_profile", "piper_fr"),
+        runtime_settings.get("tts_speed", 1.0),
+        runtime_settings.get("tts_pitch", 0.0)
+    )
+
 def text_to_speech_piper(text: str, language: str = "fr") -> bytes:
     """Convertit texte en audio avec Piper + Cache"""
     # Pour l'instant, seulement français est supporté avec Piper
     if language != "fr":
         return text_to_speech_espeak(text, language)
 
-    # Calculer le hash du texte pour le cache
-    text_hash = hashlib.md5(text.encode('utf-8')).hexdigest()
-    cache_file = TTS_CACHE_DIR / f"{text_hash}_{language}.wav"
+    cache_name = piper_cache_name(text, language)
 
-    # Vérifier si dans le cache
-    if cache_file.exists():
-        tts_cache_stats["hits"] += 1
-        print(f"✅ TTS Cache HIT: {text[:50]}... (hash: {text_hash[:8]}...)")
-        with open(cache_file, 'rb') as f:
-            return f.read()
+    # Vérifier si dans le cache (mémoire puis disque)
+    cached_audio = tts_cache.get(cache_name)
+    if cached_audio is not None:
+        print(f"✅ TTS Cache HIT: {text[:50]}... (clé: {cache_name[:8]}...)")
+        return cached_audio
 
     # Cache miss - générer le TTS
-    tts_cache_stats["misses"] += 1
     print(f"⚙️  TTS Cache MISS: {text[:50]}... (génération en cours)")
 
     try:
-        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_file:
-            temp_path = temp_file.name
-
-        # Utiliser les chemins absolus définis en configuration
-        env = os.environ.copy()
-        env['LD_LIBRARY_PATH'] = '/home/suprox/Projet/Laravel/ai/orangebf/piper_bin'
-
-        process = subprocess.Popen(
-            [PIPER_BIN, '--model', PIPER_MODEL, '--output_file', temp_path],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            env=env
-        )
-
-        stdout, stderr = process.communicate(input=text.encode('utf-8'))
-
-        if process.returncode != 0:
-            print(f"Erreur Piper: {stderr.decode()}")
-            return text_to_speech_espeak(text, language)
-
-        with open(temp_path, 'rb') as f:
-            audio_data = f.read()
-
-        # Sauvegarder dans le cache
-        try:
-            with open(cache_file, 'wb') as f:
-                f.write(audio_data)
-            print(f"💾 TTS sauvegardé dans cache: {cache_file.name}")
-        except Exception as cache_error:
-            print(f"⚠️  Erreur sauvegarde cache: {cache_error}")
-
-        Path(temp_path).unlink()
-        return audio_data
-
+        audio_data, report = piper_pool.synthesize_with_report(text)
+        print(f"🔊 Piper: {report['sentences']} phrase(s), {report['audio_s']}s d'audio en "
+              f"{report['synthesis_s']}s (RTF {report['rtf']})")
     except Exception as e:
+        # Le worker a déjà été relancé une fois: échec franc, repli sur espeak
         print(f"Exception Piper: {e}")
         return text_to_speech_espeak(text, language)
 
+    # Sauvegarder dans le cache (éviction si le budget est dépassé)
+    try:
+        tts_cache.put(cache_name, audio_data)
+        print(f"💾 TTS sauvegardé dans cache: {cache_name}")
+    except Exception as cache_error:
+        print(f"⚠️  Erreur sauvegarde cache: {cache_error}")
+
+    return audio_data
+
 def text_to_speech_espeak(text: str, language: str = "fr") -> bytes:
     """Convertit texte en audio avec espeak-ng"""
     espeak_voices = {
@@ -734,51 +1249,90 @@ def get_tts_audio(text: str, language: str = "fr", engine: str | None = None) ->
         return text_to_speech_piper(text, language)
     return text_to_speech_espeak(text, language)
 
+TTS_STREAM_CHUNK_BYTES = 32 * 1024
+
+def stream_tts_audio(text: str, language: str, engine: str, priority: str, on_first_chunk=None):
+    """
+    Octets WAV envoyés au fil de la synthèse: en-tête aux tailles "inconnues" dès la première
+    trame Piper, puis le PCM trame par trame. La place TTS est tenue par phrase pendant sa
+    synthèse, jamais pendant l'écriture vers le client; un clip en cache est envoyé hors place.
+    espeak (ou Piper en échec avant tout envoi) produit un WAV entier.
+    À appeler après admission.check("tts", priority).
+    """
+    if engine == "piper" and language == "fr":
+        cache_name = piper_cache_name(text, language)
+        cached_audio = tts_cache.get(cache_name)
+        if cached_audio is not None:
+            if on_first_chunk:
+                on_first_chunk()
+            for start in range(0, len(cached_audio), TTS_STREAM_CHUNK_BYTES):
+                yield cached_audio[start:start + TTS_STREAM_CHUNK_BYTES]
+            return
+
+        pcm = bytearray()
+        # Chaque phrase prend sa place TTS (file à priorité) avant d'occuper un worker Piper
+        chunks = piper_pool.stream_pcm(text, slot=lambda: admission.slot("tts", priority, shed=False))
+        try:
+            for chunk in chunks:
+                if not pcm:
+                    if on_first_chunk:
+                        on_first_chunk()
+                    yield wav_stream_header(piper_pool.sample_rate)
+                pcm.extend(chunk)
+                yield chunk
+        except PiperWorkerError as e:
+            print(f"Exception Piper (flux): {e}")
+            if pcm:
+                raise  # en-tête déjà envoyé: connexion interrompue plutôt qu'un WAV tronqué sans signal
+        else:
+            try:
+                tts_cache.put(cache_name, pcm_to_wav(bytes(pcm), piper_pool.sample_rate))
+            except Exception as cache_error:
+                print(f"⚠️  Erreur sauvegarde cache: {cache_error}")
+            return
+        finally:
+            chunks.close()
+
+    with admission.slot("tts", priority, shed=False):
+        audio_data = text_to_speech_espeak(text, language)
+    if on_first_chunk:
+        on_first_chunk()
+    yield audio_data
+
+# Synthèse des phrases du mode vocal en flux (/voice/ask/stream)
+tts_pipeline_executor = ThreadPoolExecutor(max_workers=VOICE_STREAM_TTS_WORKERS, thread_name_prefix="tts-pipeline")
+
+# Délai entre la réception de la requête vocale et le premier audio prêt à être envoyé
+time_to_first_audio = {"voice/ask": LatencyWindow(), "voice/ask/stream": LatencyWindow()}
+
 # ----- FONCTIONS RAG -----
 # Importer les connaissances locales
-import sys
-sys.path.insert(0, str(Path(__file__).parent))
 from local_knowledge import get_fact, local_facts
 
-def retrieve_context(query: str, top_k: int = TOP_K):
-    q_vec = embed_model.encode([query], convert_to_numpy=True)
-    q_vec = q_vec / np.linalg.norm(q_vec, axis=1, keepdims=True)
+def embed_query(query: str) -> np.ndarray:
+    """Embedding normalisé (1, d) d'une question, via le cache LRU"""
+    return query_cache.get_or_encode(query, _encode_normalized)
 
-    combined = []
+def embed_queries(queries: list) -> np.ndarray:
+    """Embeddings (n, d) de plusieurs questions en un seul appel au modèle"""
+    return query_cache.get_or_encode_many(queries, _encode_normalized)
 
-    if faiss_index is not None and faiss_index.ntotal > 0:
-        limit = min(top_k, faiss_index.ntotal)
-        base_scores, base_indices = faiss_index.search(q_vec, limit)
-        for idx, score in zip(base_indices[0], base_scores[0]):
-            combined.append({
-                "text": texts[idx],
-                "score": float(score),
-                "source": "base"
-            })
-
-    if custom_index is not None and custom_index.ntotal > 0 and custom_segments:
-        limit = min(top_k, custom_index.ntotal)
-        custom_scores, custom_indices = custom_index.search(q_vec, limit)
-        for idx, score in zip(custom_indices[0], custom_scores[0]):
-            segment = custom_segments[idx]
-            combined.append({
-                "text": segment["text"],
-                "score": float(score),
-                "source": "custom",
-                "doc_id": segment.get("doc_id")
-            })
+def retrieve_items(query: str, top_k: int = CONTEXT_CANDIDATES, categories: list | None = None) -> list:
+    """Passages les plus proches, tous index confondus, avec leur source et leur score"""
+    return retrieval_engine.search(embed_query(query), top_k, categories=categories, query=query)
 
-    if not combined:
-        return [], np.array([])
+def retrieve_context(query: str, top_k: int = CONTEXT_CANDIDATES, categories: list | None = None):
+    return _passages_and_scores(retrieve_items(query, top_k, categories))
 
-    combined.sort(key=lambda item: item["score"], reverse=True)
-    selected = combined[:top_k]
-    passages = [item["text"] for item in selected]
-    scores = np.array([item["score"] for item in selected], dtype=np.float32)
+def _passages_and_scores(selected: list):
+    """Passages retrouvés -> (blocs de contexte sous budget de tokens, leurs scores)"""
+    blocks = context_packer.pack(selected)
+    passages = [block["text"] for block in blocks]
+    scores = np.array([block["score"] for block in blocks], dtype=np.float32)
     return passages, scores
 
-def generate_response(question: str, passages: list, language: str = "fr"):
-    """Génère une réponse en utilisant Groq API avec contexte RAG"""
+def match_local_knowledge(question: str, language: str = "fr"):
+    """Réponses issues des connaissances locales (hymne, président, salutations, numéros), sinon None"""
 
     # VÉRIFIER D'ABORD LES CONNAISSANCES LOCALES
     q_lower = question.lower()
@@ -837,7 +1391,10 @@ def generate_response(question: str, passages: list, language: str = "fr"):
         response += f"• Connaître votre numéro: {nums['codes_ussd']['numero_orange']}\n"
         return {"type": "text", "text": format_response_text(response)}
 
-    # SI PAS DE CONNAISSANCE LOCALE, CONTINUER AVEC RAG
+    return None
+
+def build_llm_messages(question: str, passages: list, language: str = "fr") -> list:
+    """Construit les messages système + utilisateur avec le contexte RAG"""
     context = "\n\n".join(passages)
 
     # Messages système et utilisateur selon la langue
@@ -867,29 +1424,266 @@ Answer in English clearly, concisely and professionally."""
 
 Question: {question}"""
 
-    try:
-        # Appel à l'API Groq
-        chat_completion = groq_client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": system_msg},
-                {"role": "user", "content": user_msg}
-            ],
-            model=runtime_settings.get("llm_model", GROQ_MODEL),
-            max_tokens=200,
-            temperature=0.2,
-            top_p=0.95
-        )
+    return [
+        {"role": "system", "content": system_msg},
+        {"role": "user", "content": user_msg}
+    ]
+
+def _llm_request(question: str, passages: list, language: str = "fr") -> dict:
+    """Paramètres communs des appels LLM (réponse complète ou en flux), traduits par chaque backend"""
+    return {
+        "messages": build_llm_messages(question, passages, language),
+        "model": runtime_settings.get("llm_model", GROQ_MODEL),
+        "max_tokens": 200,
+        "temperature": 0.2,
+        "top_p": 0.95
+    }
+
+def generate_llm_response(question: str, passages: list, language: str = "fr"):
+    """Génération avec contexte RAG par le backend choisi par le routeur (lève si tous échouent)"""
+    response_text, backend = llm_router.generate(_llm_request(question, passages, language))
+    return {"type": "text", "text": format_response_text(response_text), "backend": backend}
+
+def stream_llm_response(question: str, passages: list, language: str = "fr"):
+    """Générateur des fragments de texte du backend choisi par le routeur, lève en cas d'échec"""
+    yield from llm_router.stream(_llm_request(question, passages, language))
 
-        response_text = chat_completion.choices[0].message.content.strip()
-        response_text = format_response_text(response_text)
-        return {"type": "text", "text": response_text}
+def llm_error_response(error: Exception):
+    print(f"Erreur LLM: {error}")
+    return {"type": "text", "text": f"Désolé, je ne peux pas répondre pour le moment. Erreur: {str(error)}"}
 
+async def generate_llm_response_async(question: str, passages: list, language: str = "fr"):
+    """
+    Version non bloquante de generate_llm_response: délai global et relances avec jitter
+    par backend distant, bascule sur le backend suivant en cas d'échec.
+    L'annulation de la tâche (client déconnecté) interrompt la requête HTTP en cours.
+    """
+    response_text, backend = await llm_router.agenerate(_llm_request(question, passages, language))
+    return {"type": "text", "text": format_response_text(response_text), "backend": backend}
+
+async def generate_response_async(question: str, passages: list, language: str = "fr"):
+    """Génère une réponse avec contexte RAG (connaissances locales, sinon LLM), sans bloquer la boucle d'événements"""
+    local_answer = match_local_knowledge(question, language)
+    if local_answer is not None:
+        return local_answer
+
+    try:
+        return await generate_llm_response_async(question, passages, language)
     except Exception as e:
-        print(f"Erreur Groq API: {e}")
-        return {"type": "text", "text": f"Désolé, je ne peux pas répondre pour le moment. Erreur: {str(e)}"}
+        return llm_error_response(e)
+
+def _cache_scope(language: str, categories: list | None) -> str:
+    # Un filtre de catégories change le contexte: il fait partie de la clé du cache
+    return f"{language}|{','.join(sorted(categories))}" if categories else language
+
+async def answer_question_async(question: str, language: str = "fr", categories: list | None = None,
+                                priority: str = "text"):
+    """
+    Pipeline complet question -> (réponse, scores): connaissances locales, cache sémantique,
+    puis recherche (dans un thread) + LLM asynchrone (place "llm" de classe `priority`)
+    """
+    local_answer = match_local_knowledge(question, language)
+    if local_answer is not None:
+        _, scores = await asyncio.to_thread(retrieve_context, question, CONTEXT_CANDIDATES, categories)
+        return local_answer, scores
+
+    cache_scope = _cache_scope(language, categories)
+    q_vec = await asyncio.to_thread(embed_query, question)
+    cached = semantic_cache.lookup(q_vec, cache_scope, index_version)
+    if cached is not None:
+        response_data, scores, similarity = cached
+        print(f"✅ Cache sémantique HIT (similarité {similarity:.3f})")
+        return response_data, scores
+
+    started = time.perf_counter()
+    passages, scores = await asyncio.to_thread(retrieve_context, question, CONTEXT_CANDIDATES, categories)
+    async with admission.aslot("llm", priority):
+        try:
+            response_data = await generate_llm_response_async(question, passages, language)
+        except Exception as e:
+            return llm_error_response(e), scores
+
+    semantic_cache.store(q_vec, cache_scope, index_version, response_data, scores, time.perf_counter() - started)
+    return response_data, scores
+
+async def answer_question_coalesced(question: str, language: str = "fr", categories: list | None = None,
+                                    priority: str = "text"):
+    """
+    answer_question_async partagé entre les requêtes identiques arrivées en même temps
+    (le calcul garde la priorité de la première requête)
+    """
+    key = (
+        normalize_query(question),
+        language,
+        runtime_settings.get("llm_model", GROQ_MODEL),
+        tuple(sorted(categories)) if categories else None
+    )
+    response_data, scores = await answer_flights.run(
+        key, lambda: answer_question_async(question, language, categories, priority)
+    )
+    # Chaque requête reçoit sa copie: les endpoints complètent la réponse
+    return dict(response_data), scores
+
+def answer_questions_batch(items: list, categories: list | None = None):
+    """
+    Pipeline par lot, générateur de (position, réponse, scores, origine) dans l'ordre de complétion:
+    un seul encode et une recherche (n, d) par index, connaissances locales et cache
+    sémantique résolus d'emblée, puis appels LLM en parallèle bornée
+    """
+    questions = [item["question"] for item in items]
+    q_matrix = embed_queries(questions)
+    retrieved = retrieval_engine.search_batch(q_matrix, CONTEXT_CANDIDATES, categories=categories, queries=questions)
+    contexts = [_passages_and_scores(selected) for selected in retrieved]
+
+    pending = []
+    for position, item in enumerate(items):
+        passages, scores = contexts[position]
+        local_answer = match_local_knowledge(item["question"], item["language"])
+        if local_answer is not None:
+            yield position, local_answer, scores, "local"
+            continue
+        cached = semantic_cache.lookup(q_matrix[position], _cache_scope(item["language"], categories), index_version)
+        if cached is not None:
+            yield position, cached[0], cached[1], "cache"
+            continue
+        pending.append(position)
+
+    if not pending:
+        return
+
+    def generate(position):
+        item = items[position]
+        passages, scores = contexts[position]
+        started = time.perf_counter()
+        # Lot déjà admis (admission.check dans l'endpoint): attendre son tour plutôt qu'échouer
+        with admission.slot("llm", "admin", shed=False):
+            try:
+                response_data = generate_llm_response(item["question"], passages, item["language"])
+            except Exception as e:
+                return position, llm_error_response(e), scores, "error"
+        semantic_cache.store(q_matrix[position], _cache_scope(item["language"], categories), index_version,
+                             response_data, scores, time.perf_counter() - started)
+        return position, response_data, scores, "llm"
+
+    executor = ThreadPoolExecutor(max_workers=BATCH_LLM_CONCURRENCY, thread_name_prefix="batch-llm")
+    try:
+        futures = [executor.submit(generate, position) for position in pending]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        # Client déconnecté: les questions pas encore envoyées au LLM sont abandonnées
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def answer_store_version() -> str:
+    """Les réponses pré-calculées dépendent des index et du modèle LLM"""
+    return f"{index_version}|{runtime_settings.get('llm_model', GROQ_MODEL)}"
+
+def lookup_precomputed(question: str, language: str, categories: list | None = None):
+    """Entrée du magasin de réponses pré-calculées, ou None (jamais avec un filtre de catégories)"""
+    if categories:
+        return None
+    return answer_store.lookup(question, language, answer_store_version())
+
+def precompute_answers(top_n: int = PRECOMPUTE_TOP_N, min_count: int = PRECOMPUTE_MIN_COUNT) -> dict:
+    """
+    Reconstruit le magasin à partir du journal des questions: pour les `top_n` questions
+    les plus posées par langue, contexte retrouvé, réponse du LLM et audio de la réponse
+    """
+    with precompute_lock:
+        version = answer_store_version()
+        tts_engine = runtime_settings.get("tts_engine", TTS_ENGINE)
+        started = time.perf_counter()
+        entries, skipped = {}, 0
+        for language, questions in question_log.top_questions(top_n, min_count).items():
+            for item in questions:
+                question = item["question"]
+                if match_local_knowledge(question, language) is not None:
+                    continue  # déjà instantané
+                passages, scores = retrieve_context(question)
+                with admission.slot("llm", "admin", shed=False):
+                    try:
+                        response_data = generate_llm_response(question, passages, language)
+                    except Exception as e:
+                        print(f"⚠️  Pré-calcul ignoré ({question[:50]}): {e}")
+                        skipped += 1
+                        continue
+
+                key = question_key(question, language)
+                audio_file = None
+                try:
+                    with admission.slot("tts", "admin", shed=False):
+                        audio_data = get_tts_audio(response_data["text"], language, tts_engine)
+                    audio_file = answer_store.audio_name(key)
+                    (ANSWER_STORE_DIR / audio_file).write_bytes(audio_data)
+                except Exception as e:
+                    print(f"⚠️  Audio non pré-calculé ({question[:50]}): {e}")
+                entries[key] = {
+                    "question": question,
+                    "language": language,
+                    "count": item["count"],
+                    "passages": passages,
+                    "response": response_data,
+                    "scores": scores.tolist(),
+                    "audio_file": audio_file,
+                    "tts_engine": tts_engine
+                }
+
+        duration_s = time.perf_counter() - started
+        answer_store.replace(version, entries, duration_s)
+        print(f"✅ Réponses pré-calculées: {len(entries)} ({skipped} ignorées) en {duration_s:.1f}s")
+        return {"entries": len(entries), "skipped": skipped, "version": version, "duration_s": round(duration_s, 2)}
+
+def precompute_loop():
+    """Tâche de fond: reconstruit le magasin dès que sa version est périmée, et toutes les PRECOMPUTE_INTERVAL_S"""
+    last_build = time.monotonic()
+    while True:
+        precompute_wakeup.wait(timeout=60)
+        precompute_wakeup.clear()
+        stale = not answer_store.is_current(answer_store_version())
+        if not stale and time.monotonic() - last_build < PRECOMPUTE_INTERVAL_S:
+            continue
+        try:
+            precompute_answers()
+            add_log("Réponses fréquentes pré-calculées", scope="system")
+        except Exception as e:
+            print(f"⚠️  Pré-calcul des réponses impossible: {e}")
+        last_build = time.monotonic()
+
+def sse_event(event: str, data: dict) -> str:
+    """Formate un événement Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 # ----- ENDPOINTS -----
 
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request, error: AdmissionRejected):
+    """Travail délesté par l'ordonnanceur: 503 + Retry-After"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(error), "stage": error.stage, "priority": error.priority_class},
+        headers={"Retry-After": str(error.retry_after_s)}
+    )
+
+@app.on_event("startup")
+def start_precompute_job():
+    if PRECOMPUTE_INTERVAL_S > 0:
+        threading.Thread(target=precompute_loop, name="precompute-answers", daemon=True).start()
+
+@app.on_event("shutdown")
+def save_caches():
+    """Sauvegarde les caches persistants à l'arrêt du serveur"""
+    query_cache.save()
+    tts_cache.save()
+    question_log.close()
+
+@app.on_event("shutdown")
+def stop_piper_workers():
+    piper_pool.close()
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    await llm_router.aclose()
+
 @app.post("/voice/ask")
 async def voice_ask(
     audio: UploadFile = File(...),
@@ -906,6 +1700,7 @@ async def voice_ask(
       -F "response_format=both"
     """
 
+    request_started = time.perf_counter()
     try:
         # Sauvegarder l'audio uploadé
         with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_file:
@@ -918,14 +1713,18 @@ async def voice_ask(
         # 1. STT: Audio → Texte
         print("🎤 Transcription...")
         stt_engine = runtime_settings.get("stt_engine", STT_ENGINE)
-        question = transcribe_audio(temp_path, language, stt_engine)
+        question = await asyncio.to_thread(transcribe_audio, temp_path, language, stt_engine)
         print(f"📝 Question détectée: {question}")
 
-        # 2. RAG: Recherche + Génération
-        print("🔍 Recherche...")
-        passages, scores = retrieve_context(question)
-        print("🤖 Génération de la réponse...")
-        response_data = generate_response(question, passages, language)
+        # 2. RAG: réponse pré-calculée, sinon Recherche + Génération
+        question_log.append(question, language, "voice/ask")
+        precomputed = lookup_precomputed(question, language)
+        if precomputed is not None:
+            print("✅ Réponse pré-calculée")
+            response_data, scores = precomputed["response"], np.array(precomputed["scores"], dtype=np.float32)
+        else:
+            print("🔍 Recherche + 🤖 génération de la réponse...")
+            response_data, scores = await answer_question_coalesced(question, language, priority="voice")
 
         # Extraire le texte de la réponse (peut être dict avec type="text" ou type="audio")
         if isinstance(response_data, dict):
@@ -935,12 +1734,20 @@ async def voice_ask(
 
         print(f"✅ Réponse: {response_text[:100] if response_text else 'Audio response'}...")
 
-        # 3. TTS: Texte → Audio (si demandé)
+        # 3. TTS: Texte → Audio (si demandé); en "audio", synthèse envoyée en flux
         audio_data = None
         if response_format in ["audio", "both"]:
             print("🔊 Synthèse vocale...")
             tts_engine = runtime_settings.get("tts_engine", TTS_ENGINE)
-            audio_data = get_tts_audio(response_text, language, tts_engine)
+            if precomputed is not None and precomputed["tts_engine"] == tts_engine:
+                audio_data = await asyncio.to_thread(answer_store.audio, precomputed)
+            if audio_data is None and response_format == "audio":
+                admission.check("tts", "voice")
+            elif audio_data is None:
+                async with admission.aslot("tts", "voice"):
+                    audio_data = await asyncio.to_thread(get_tts_audio, response_text, language, tts_engine)
+            if audio_data is not None:
+                time_to_first_audio["voice/ask"].add(time.perf_counter() - request_started)
 
         # Nettoyer le fichier temporaire
         Path(temp_path).unlink()
@@ -955,8 +1762,15 @@ async def voice_ask(
             }
         elif response_format == "audio":
             add_log(f"Interaction vocale (stream) traitée ({language})", scope="voice")
+            if audio_data is not None:
+                audio_stream = iter([audio_data])
+            else:
+                audio_stream = stream_tts_audio(
+                    response_text, language, tts_engine, "voice",
+                    on_first_chunk=lambda: time_to_first_audio["voice/ask"].add(time.perf_counter() - request_started)
+                )
             return StreamingResponse(
-                io.BytesIO(audio_data),
+                audio_stream,
                 media_type="audio/wav",
                 headers={
                     "X-Question": question,
@@ -984,8 +1798,150 @@ async def voice_ask(
         # Nettoyer en cas d'erreur
         if 'temp_path' in locals() and Path(temp_path).exists():
             Path(temp_path).unlink()
+        if isinstance(e, AdmissionRejected):
+            raise
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
+@app.post("/voice/ask/stream")
+async def voice_ask_stream(audio: UploadFile = File(...), language: str = "fr"):
+    """
+    Mode vocal en flux (text/event-stream): la réponse du LLM est découpée en phrases,
+    chaque phrase est synthétisée dès qu'elle est complète et envoyée dans l'ordre.
+    - event "question": transcription de la question
+    - event "context": scores des passages retrouvés
+    - event "audio": {"position", "text", "audio_base64"} un WAV par phrase
+    - event "answer": réponse complète + time_to_first_audio_s, ferme le flux
+    Une réponse audio des connaissances locales (hymne) arrive directement en "answer" avec audio_url.
+
+    Usage:
+    curl -N -X POST "http://localhost:8000/voice/ask/stream?language=fr" -F "audio=@question.wav"
+    """
+    request_started = time.perf_counter()
+    with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_file:
+        temp_file.write(await audio.read())
+        temp_path = temp_file.name
+
+    record_request("voice/ask/stream")
+    stt_engine = runtime_settings.get("stt_engine", STT_ENGINE)
+    tts_engine = runtime_settings.get("tts_engine", TTS_ENGINE)
+    try:
+        admission.check("llm", "voice")
+    except AdmissionRejected:
+        Path(temp_path).unlink(missing_ok=True)
+        raise
+
+    def synthesize(sentence: str) -> bytes:
+        with admission.slot("tts", "voice", shed=False):
+            return get_tts_audio(sentence, language, tts_engine)
+
+    def stream():
+        pending = deque()  # (position, phrase, future) dans l'ordre de la réponse
+        metrics = {"submitted": 0, "chunks": 0, "first_audio_s": None}
+
+        def submit(sentence: str):
+            sentence = format_response_text(sentence)
+            if sentence:
+                position = metrics["submitted"]
+                metrics["submitted"] += 1
+                pending.append((position, sentence, tts_pipeline_executor.submit(synthesize, sentence)))
+
+        def ready_audio(wait: bool):
+            # Les phrases sont émises dans l'ordre, même si une synthèse suivante finit avant
+            while pending and (wait or pending[0][2].done()):
+                position, sentence, future = pending.popleft()
+                try:
+                    audio_bytes = future.result()
+                except Exception as e:
+                    yield sse_event("error", {"position": position, "detail": f"TTS: {e}"})
+                    continue
+                metrics["chunks"] += 1
+                if metrics["first_audio_s"] is None:
+                    metrics["first_audio_s"] = time.perf_counter() - request_started
+                    time_to_first_audio["voice/ask/stream"].add(metrics["first_audio_s"])
+                yield sse_event("audio", {
+                    "position": position,
+                    "text": sentence,
+                    "audio_base64": base64.b64encode(audio_bytes).decode("utf-8")
+                })
+
+        def closing(response_data: dict, scores, question: str):
+            yield from ready_audio(wait=True)
+            add_log(f"Interaction vocale (flux) traitée ({language})", scope="voice")
+            first_audio_s = metrics["first_audio_s"]
+            yield sse_event("answer", {
+                **response_data,
+                "question": question,
+                "response": response_data.get("text", ""),
+                "language": language,
+                "scores": scores.tolist() if isinstance(scores, np.ndarray) else list(scores),
+                "chunks": metrics["chunks"],
+                "time_to_first_audio_s": round(first_audio_s, 3) if first_audio_s is not None else None,
+                "total_s": round(time.perf_counter() - request_started, 3)
+            })
+
+        try:
+            question = transcribe_audio(temp_path, language, stt_engine)
+            question_log.append(question, language, "voice/ask/stream")
+            yield sse_event("question", {"question": question, "stt_s": round(time.perf_counter() - request_started, 3)})
+
+            local_answer = match_local_knowledge(question, language)
+            if local_answer is not None:
+                if local_answer.get("type") == "text":
+                    for sentence in split_sentences(local_answer["text"], VOICE_STREAM_MIN_CHARS):
+                        submit(sentence)
+                yield from closing(local_answer, [], question)
+                return
+
+            cache_scope = _cache_scope(language, None)
+            q_vec = embed_query(question)
+            cached = semantic_cache.lookup(q_vec, cache_scope, index_version)
+            if cached is not None:
+                response_data, scores, _ = cached
+                yield sse_event("context", {"scores": scores.tolist(), "cached": True})
+                for sentence in split_sentences(response_data.get("text", ""), VOICE_STREAM_MIN_CHARS):
+                    submit(sentence)
+                yield from closing(response_data, scores, question)
+                return
+
+            generation_started = time.perf_counter()
+            passages, scores = _passages_and_scores(retrieval_engine.search(q_vec, CONTEXT_CANDIDATES, query=question))
+            yield sse_event("context", {"scores": scores.tolist()})
+
+            sentences = SentenceBuffer(VOICE_STREAM_MIN_CHARS)
+            parts = []
+            try:
+                with admission.slot("llm", "voice", shed=False):
+                    for delta in stream_llm_response(question, passages, language):
+                        parts.append(delta)
+                        for sentence in sentences.feed(delta):
+                            submit(sentence)
+                        yield from ready_audio(wait=False)
+            except Exception as e:
+                yield sse_event("error", {"detail": str(e)})
+                response_data = llm_error_response(e)
+                submit(response_data["text"])
+                yield from closing(response_data, scores, question)
+                return
+
+            for sentence in sentences.flush():
+                submit(sentence)
+            response_data = {"type": "text", "text": format_response_text("".join(parts).strip())}
+            semantic_cache.store(q_vec, cache_scope, index_version, response_data, scores,
+                                 time.perf_counter() - generation_started)
+            yield from closing(response_data, scores, question)
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+        finally:
+            for _, _, future in pending:
+                future.cancel()
+            Path(temp_path).unlink(missing_ok=True)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/voice/transcribe")
 async def transcribe_only(audio: UploadFile = File(...), language: str = "fr"):
     """
@@ -999,7 +1955,7 @@ async def transcribe_only(audio: UploadFile = File(...), language: str = "fr"):
 
         stt_engine = runtime_settings.get("stt_engine", STT_ENGINE)
         record_request("voice/transcribe")
-        text = transcribe_audio(temp_path, language, stt_engine)
+        text = await asyncio.to_thread(transcribe_audio, temp_path, language, stt_engine)
         Path(temp_path).unlink()
         add_log(f"Transcription audio réussie ({language})", scope="stt")
 
@@ -1014,7 +1970,7 @@ async def transcribe_only(audio: UploadFile = File(...), language: str = "fr"):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/text/ask")
-def text_ask(request: TextQuestion):
+async def text_ask(request: TextQuestion):
     """
     Endpoint texte: envoie question → reçoit texte OU audio_url
 
@@ -1027,8 +1983,12 @@ def text_ask(request: TextQuestion):
         raise HTTPException(status_code=400, detail="Question vide")
 
     record_request("text/ask")
-    passages, scores = retrieve_context(question)
-    response_data = generate_response(question, passages, request.language)
+    question_log.append(question, request.language, "text/ask")
+    precomputed = lookup_precomputed(question, request.language, request.categories)
+    if precomputed is not None:
+        response_data, scores = precomputed["response"], np.array(precomputed["scores"], dtype=np.float32)
+    else:
+        response_data, scores = await answer_question_coalesced(question, request.language, request.categories)
 
     # Ajouter les métadonnées
     if response_data.get("type") == "text" and response_data.get("text"):
@@ -1048,21 +2008,169 @@ def text_ask(request: TextQuestion):
     add_log(f"Question texte traitée ({request.language})", scope="text")
     return result
 
+@app.post("/text/ask/stream")
+def text_ask_stream(request: TextQuestion):
+    """
+    Endpoint texte en flux SSE (text/event-stream):
+    - event "context": scores et sources des passages retrouvés (avant la génération)
+    - event "token": fragment de texte généré par le LLM
+    - event "answer": réponse finale formatée (même forme que /text/ask), ferme le flux
+    - event "error": échec du LLM, suivi de "answer" avec le message d'erreur
+    Les réponses des connaissances locales arrivent directement en "answer".
+
+    Usage:
+    curl -N -X POST http://localhost:8000/text/ask/stream -H "Content-Type: application/json" \
+      -d '{"question": "Comment activer Orange Money?", "language": "fr"}'
+    """
+    question = request.question.strip()
+    if not question:
+        raise HTTPException(status_code=400, detail="Question vide")
+
+    record_request("text/ask/stream")
+    question_log.append(question, request.language, "text/ask/stream")
+    admission.check("llm", "text")
+    language = request.language
+    categories = request.categories
+
+    def final_answer(response_data: dict, scores, origin: str) -> str:
+        result = {
+            **response_data,
+            "question": question,
+            "language": language,
+            "scores": scores.tolist() if isinstance(scores, np.ndarray) else list(scores),
+            "origin": origin
+        }
+        if request.enable_voice and response_data.get("type") == "text":
+            result["tts_url"] = f"/tts?text={response_data['text']}&lang={language}"
+        add_log(f"Question texte (flux) traitée ({language})", scope="text")
+        return sse_event("answer", result)
+
+    def stream():
+        local_answer = match_local_knowledge(question, language)
+        if local_answer is not None:
+            yield final_answer(local_answer, [], "local")
+            return
+
+        cache_scope = _cache_scope(language, categories)
+        q_vec = embed_query(question)
+        cached = semantic_cache.lookup(q_vec, cache_scope, index_version)
+        if cached is not None:
+            response_data, scores, similarity = cached
+            yield sse_event("context", {"scores": scores.tolist(), "cached": True, "similarity": round(similarity, 3)})
+            yield final_answer(response_data, scores, "cache")
+            return
+
+        started = time.perf_counter()
+        blocks = context_packer.pack(retrieval_engine.search(q_vec, CONTEXT_CANDIDATES, categories=categories, query=question))
+        passages = [block["text"] for block in blocks]
+        scores = np.array([block["score"] for block in blocks], dtype=np.float32)
+        yield sse_event("context", {
+            "scores": scores.tolist(),
+            "sources": [{"index": block["index"], "category": block["category"], "source": block.get("source"),
+                         "url": block.get("url"), "tokens": block["tokens"]} for block in blocks]
+        })
+
+        parts = []
+        try:
+            with admission.slot("llm", "text", shed=False):
+                for delta in stream_llm_response(question, passages, language):
+                    parts.append(delta)
+                    yield sse_event("token", {"text": delta})
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+            yield final_answer(llm_error_response(e), scores, "error")
+            return
+
+        response_data = {"type": "text", "text": format_response_text("".join(parts).strip())}
+        semantic_cache.store(q_vec, cache_scope, index_version, response_data, scores, time.perf_counter() - started)
+        yield final_answer(response_data, scores, "llm")
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/text/ask/batch")
+def text_ask_batch(request: TextBatchRequest):
+    """
+    Lot de questions -> flux NDJSON, une ligne par réponse dès qu'elle est prête
+    (champ "position" = rang dans la requête), puis une ligne finale {"done": true, ...}
+
+    Usage:
+    curl -N -X POST http://localhost:8000/text/ask/batch -H "Content-Type: application/json" \
+      -d '{"questions": [{"question": "Comment consulter mon solde?", "language": "fr"}]}'
+    """
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="Aucune question")
+    if len(request.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"Maximum {BATCH_MAX_QUESTIONS} questions par lot")
+
+    record_request("text/ask/batch")
+    admission.check("llm", "admin")
+    items = []
+    rejected = []
+    for position, entry in enumerate(request.questions):
+        question = entry.question.strip()
+        if question:
+            items.append({"position": position, "question": question, "language": entry.language})
+        else:
+            rejected.append(position)
+
+    def stream():
+        started = time.perf_counter()
+        counts = {}
+        for position in rejected:
+            counts["rejected"] = counts.get("rejected", 0) + 1
+            yield json.dumps({"position": position, "error": "Question vide"}, ensure_ascii=False) + "\n"
+        for index, response_data, scores, origin in answer_questions_batch(items, request.categories):
+            item = items[index]
+            counts[origin] = counts.get(origin, 0) + 1
+            line = {
+                **response_data,
+                "position": item["position"],
+                "question": item["question"],
+                "language": item["language"],
+                "scores": scores.tolist(),
+                "origin": origin
+            }
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+        elapsed = time.perf_counter() - started
+        add_log(f"Lot de {len(request.questions)} questions traité en {elapsed:.1f}s", scope="text")
+        yield json.dumps({"done": True, "count": len(request.questions), "origins": counts,
+                          "elapsed_s": round(elapsed, 2)}) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
 @app.get("/tts")
-def tts_endpoint(text: str, lang: str = "fr"):
-    """Convertit du texte en audio"""
+def tts_endpoint(text: str, lang: str = "fr", stream: bool = False):
+    """
+    Convertit du texte en audio. stream=true: WAV envoyé au fil de la synthèse Piper
+    (en-tête aux tailles inconnues), la lecture peut commencer avant la fin du texte.
+    """
     if not text:
         raise HTTPException(status_code=400, detail="Texte vide")
 
     try:
         record_request("tts")
-        audio_data = get_tts_audio(text, lang, runtime_settings.get("tts_engine", TTS_ENGINE))
+        if stream:
+            admission.check("tts", "admin")
+            add_log(f"TTS en flux ({lang})", scope="tts")
+            return StreamingResponse(
+                stream_tts_audio(text, lang, runtime_settings.get("tts_engine", TTS_ENGINE), "admin"),
+                media_type="audio/wav",
+                headers={"Content-Disposition": f"inline; filename=tts_{lang}.wav"}
+            )
+        with admission.slot("tts", "admin"):
+            audio_data = get_tts_audio(text, lang, runtime_settings.get("tts_engine", TTS_ENGINE))
         add_log(f"TTS généré ({lang})", scope="tts")
         return StreamingResponse(
             io.BytesIO(audio_data),
             media_type="audio/wav",
             headers={"Content-Disposition": f"attachment; filename=tts_{lang}.wav"}
         )
+    except AdmissionRejected:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1074,7 +2182,7 @@ def list_documents():
     return {
         "count": len(sorted_docs),
         "documents": sorted_docs,
-        "segments_indexed": custom_index.ntotal if custom_index else 0
+        "segments_indexed": custom_vectors_count()
     }
 
 @app.get("/knowledge/segments/{doc_id}")
@@ -1159,10 +2267,11 @@ def delete_document(doc_id: str):
     if doc_id not in knowledge_documents:
         raise HTTPException(status_code=404, detail="Document introuvable")
 
-    doc_meta = knowledge_documents.pop(doc_id)
-    _remove_segments_for_document(doc_id)
-    save_documents_state()
-    rebuild_custom_index()
+    with knowledge_lock:
+        doc_meta = knowledge_documents.pop(doc_id)
+        _remove_segments_for_document(doc_id)
+        bump_index_version()
+        save_documents_state()
 
     stored_path = Path(doc_meta["path"])
     if stored_path.exists():
@@ -1215,6 +2324,7 @@ async def upload_audio(
 
     audio_map[audio_id] = entry
     save_audio_index()
+    rebuild_audio_index()
 
     record_request("audio/upload")
     add_log(f"Audio '{file.filename}' ajouté ({category})", scope="audio")
@@ -1262,6 +2372,7 @@ async def replace_audio(
 
     audio_map[audio_id] = entry
     save_audio_index()
+    rebuild_audio_index()
 
     record_request("audio/update")
     add_log(f"Audio '{audio_id}' mis à jour", scope="audio")
@@ -1285,6 +2396,7 @@ def convert_audio_endpoint(audio_id: str):
     entry["alternate_wav"] = wav_filename
     audio_map[audio_id] = entry
     save_audio_index()
+    rebuild_audio_index()
 
     record_request("audio/convert")
     add_log(f"Audio '{audio_id}' converti en WAV", scope="audio")
@@ -1297,6 +2409,7 @@ def delete_audio(audio_id: str):
 
     entry = audio_map.pop(audio_id)
     save_audio_index()
+    rebuild_audio_index()
 
     for key in ["path", "alternate_wav"]:
         file_value = entry.get(key)
@@ -1314,7 +2427,7 @@ def delete_audio(audio_id: str):
 def admin_metrics():
     """Expose les métriques + journaux pour le tableau de bord"""
     snapshot = get_metrics_snapshot()
-    knowledge_segments = custom_index.ntotal if custom_index else 0
+    knowledge_segments = custom_vectors_count()
     try:
         import psutil
         cpu = psutil.cpu_percent(interval=None)
@@ -1323,12 +2436,38 @@ def admin_metrics():
 
     return {
         "requests": snapshot,
-        "tts_cache": tts_cache_stats,
+        "tts_cache": tts_cache.stats(),
+        "query_embedding_cache": query_cache.stats(),
+        "semantic_cache": {**semantic_cache.stats(), "index_version": index_version},
+        "coalescing": answer_flights.stats(),
+        "admission": admission.stats(),
+        "answer_store": {
+            **answer_store.stats(),
+            "current": answer_store.is_current(answer_store_version()),
+            "question_log": question_log.stats()
+        },
+        "context_packer": context_packer.stats(),
+        "llm": llm_router.stats(),
         "audio_files": len(audio_map),
         "knowledge_segments": knowledge_segments,
+        "retrieval_indexes": retrieval_engine.stats(),
+        "base_index": base_index_info,
+        "lexical_index": retrieval_engine.lexical_stats(),
+        "piper_pool": piper_pool.stats(),
+        "time_to_first_audio": {endpoint: window.stats() for endpoint, window in time_to_first_audio.items()},
+        "embedding_cache": embedding_store.stats(),
+        "stt_models": get_stt_registry_snapshot(),
         "cpu_percent": cpu
     }
 
+@app.post("/admin/precompute")
+async def admin_precompute(top_n: int = PRECOMPUTE_TOP_N, min_count: int = PRECOMPUTE_MIN_COUNT):
+    """Reconstruit tout de suite le magasin de réponses pré-calculées"""
+    record_request("admin/precompute")
+    summary = await asyncio.to_thread(precompute_answers, top_n, min_count)
+    add_log(f"Réponses pré-calculées: {summary['entries']}", scope="system")
+    return summary
+
 @app.post("/admin/restart")
 def restart_robot():
     """Simule un redémarrage logiciel du robot"""
@@ -1365,7 +2504,10 @@ def update_dialogue_settings(payload: DialogueSettingsUpdate):
     changed = {}
 
     if payload.llm_model:
+        if payload.llm_model != runtime_settings.get("llm_model"):
+            semantic_cache.invalidate()
         runtime_settings["llm_model"] = payload.llm_model
+        precompute_wakeup.set()  # la version du magasin inclut le modèle
         changed["llm_model"] = payload.llm_model
 
     if payload.tts_engine:
@@ -1377,6 +2519,10 @@ def update_dialogue_settings(payload: DialogueSettingsUpdate):
     if payload.stt_engine:
         if payload.stt_engine not in allowed_stt:
             raise HTTPException(status_code=400, detail=f"Moteur STT invalide: {payload.stt_engine}")
+        try:
+            swap_stt_engine(payload.stt_engine, runtime_settings.get("stt_engine"))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Chargement du moteur STT impossible: {e}")
         runtime_settings["stt_engine"] = payload.stt_engine
         changed["stt_engine"] = payload.stt_engine
 
@@ -1474,6 +2620,7 @@ async def reload_audio_index():
     Usage: POST /load_audio_index
     """
     load_audio_index()
+    rebuild_audio_index()
     return {
         "status": "success",
         "message": f"Index rechargé: {len(audio_map)} fichiers",
@@ -1666,7 +2813,7 @@ def health():
     return {
         "status": "ok",
         "platform": "Raspberry Pi 5",
-        "llm_provider": "Groq API",
+        "llm_provider": "Routeur LLM (" + ", ".join(backend.name for backend in llm_router.backends) + ")",
         "llm_model": runtime_settings.get("llm_model", GROQ_MODEL),
         "stt_engine": runtime_settings.get("stt_engine", STT_ENGINE),
         "tts_engine": runtime_settings.get("tts_engine", TTS_ENGINE),
@@ -1697,17 +2844,23 @@ def capabilities():
             "cache": {
                 "enabled": True,
                 "directory": str(TTS_CACHE_DIR),
-                "stats": tts_cache_stats
+                "key": ["engine", "voice_profile", "tts_speed", "tts_pitch", "lang", "text"],
+                "stats": tts_cache.stats()
             }
         },
         "llm": {
             "provider": "Groq API",
             "model": GROQ_MODEL,
-            "context_window": 8192
+            "context_window": 8192,
+            "backends": {backend.name: backend.model or GROQ_MODEL for backend in llm_router.backends},
+            "routing": "latency",
+            "min_quality": LLM_MIN_QUALITY
         },
         "rag": {
             "index_size": faiss_index.ntotal,
-            "top_k": TOP_K
+            "top_k": TOP_K,
+            "context_candidates": CONTEXT_CANDIDATES,
+            "context_token_budget": CONTEXT_TOKEN_BUDGET
         }
     }
 
@@ -1725,10 +2878,11 @@ def stats():
         "ram_percent": mem.percent,
         "cpu_percent": cpu_percent,
         "faiss_vectors": faiss_index.ntotal,
-        "custom_vectors": custom_index.ntotal if custom_index else 0,
+        "custom_vectors": custom_vectors_count(),
         "stt_engine": STT_ENGINE,
         "tts_engine": TTS_ENGINE,
-        "stt_loaded": whisper_model is not None or vosk_model is not None,
+        "stt_loaded": bool(stt_models),
+        "stt_models": get_stt_registry_snapshot(),
         "requests": snapshot
     }
 
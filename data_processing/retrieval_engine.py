@@ -0,0 +1,186 @@
+# retrieval_engine.py
+# Moteur de recherche multi-index: N index FAISS nommés (base, un par catégorie
+# de documents importés, descriptions audio...) interrogés en parallèle,
+# fusionnés, dédupliqués puis coupés au top-k. Un index lexical BM25 optionnel
+# (lexical_index.py) est fusionné avec les résultats vectoriels (RRF ou pondéré).
+
+import heapq
+import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+import numpy as np
+
+from lexical_index import fuse
+
+
+class NamedIndex:
+    """Un index FAISS + la fonction qui retrouve le passage associé à un identifiant"""
+
+    def __init__(self, name: str, index, lookup, category: str | None = None, default: bool = True):
+        self.name = name
+        self.index = index
+        self.lookup = lookup  # id FAISS -> dict {"text": ..., ...} ou None
+        self.category = category or name
+        self.default = default  # interrogé quand l'appelant ne précise rien
+
+    @property
+    def size(self) -> int:
+        return self.index.ntotal if self.index is not None else 0
+
+
+class RetrievalEngine:
+    def __init__(self, max_workers: int = 4):
+        self.indexes = {}
+        self.lock = Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="faiss-search")
+        self.lexical = None
+        self.fusion = {}
+        self.lexical_latencies_ms = deque(maxlen=500)
+        self.lexical_searches = 0
+
+    def attach_lexical(self, lexical_index, method: str = "rrf", vector_weight: float = 0.7,
+                       rrf_k: int = 60, candidate_factor: int = 4):
+        """Active la recherche hybride: `lexical_index` est un BM25Index dont les clés sont (nom, id)"""
+        self.lexical = lexical_index
+        self.fusion = {
+            "method": method,
+            "vector_weight": vector_weight,
+            "rrf_k": rrf_k,
+            "candidate_factor": max(1, candidate_factor)
+        }
+
+    def register(self, name: str, index, lookup, category: str | None = None, default: bool = True):
+        with self.lock:
+            self.indexes[name] = NamedIndex(name, index, lookup, category, default)
+
+    def unregister(self, name: str):
+        with self.lock:
+            self.indexes.pop(name, None)
+
+    def get(self, name: str):
+        with self.lock:
+            return self.indexes.get(name)
+
+    def _select(self, names=None, categories=None) -> list:
+        with self.lock:
+            candidates = list(self.indexes.values())
+        if names:
+            candidates = [entry for entry in candidates if entry.name in names]
+        if categories:
+            candidates = [entry for entry in candidates if entry.category in categories]
+        if not names and not categories:
+            candidates = [entry for entry in candidates if entry.default]
+        return [entry for entry in candidates if entry.size > 0]
+
+    @staticmethod
+    def _search_many(entry: NamedIndex, q_matrix: np.ndarray, top_k: int) -> list:
+        """Une seule recherche (n, d) sur l'index; retourne une liste de résultats par requête"""
+        scores, ids = entry.index.search(q_matrix, min(top_k, entry.size))
+        rows = []
+        for row_ids, row_scores in zip(ids, scores):
+            results = []
+            for vector_id, score in zip(row_ids, row_scores):
+                if vector_id < 0:
+                    continue
+                payload = entry.lookup(int(vector_id))
+                if payload is None:
+                    continue
+                results.append({
+                    **payload,
+                    "score": float(score),
+                    "index": entry.name,
+                    "category": entry.category
+                })
+            rows.append(results)
+        return rows
+
+    @staticmethod
+    def _merge(partials: list, top_k: int) -> list:
+        """Fusion par score décroissant, sans doublons de texte"""
+        best_by_text = {}
+        for item in (item for partial in partials for item in partial):
+            key = re.sub(r"\s+", " ", item["text"]).strip().lower()
+            current = best_by_text.get(key)
+            if current is None or item["score"] > current["score"]:
+                best_by_text[key] = item
+        return heapq.nlargest(top_k, best_by_text.values(), key=lambda item: item["score"])
+
+    def _search_lexical(self, query: str, selected: list, depth: int) -> list:
+        by_name = {entry.name: entry for entry in selected}
+        started = time.perf_counter()
+        results = []
+        for (name, vector_id), score in self.lexical.search(query, depth, names=by_name.keys()):
+            entry = by_name[name]
+            payload = entry.lookup(int(vector_id))
+            if payload is None:
+                continue
+            results.append({**payload, "score": score, "index": entry.name, "category": entry.category})
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self.lock:
+            self.lexical_searches += 1
+            self.lexical_latencies_ms.append(elapsed_ms)
+        return results
+
+    def search_batch(self, q_matrix: np.ndarray, top_k: int, names=None, categories=None,
+                     queries: list | None = None) -> list:
+        """
+        Recherche de n requêtes à la fois: une liste de résultats fusionnés par ligne de `q_matrix`.
+        Avec `queries` (textes des requêtes) et un index lexical attaché, la recherche est hybride.
+        """
+        q_matrix = np.ascontiguousarray(q_matrix, dtype=np.float32).reshape(-1, q_matrix.shape[-1])
+        selected = self._select(names, categories)
+        if not selected:
+            return [[] for _ in range(len(q_matrix))]
+
+        hybrid = self.lexical is not None and queries is not None
+        depth = top_k * self.fusion["candidate_factor"] if hybrid else top_k
+        if len(selected) == 1:
+            per_index = [self._search_many(selected[0], q_matrix, depth)]
+        else:
+            # faiss relâche le GIL pendant la recherche: les index sont parcourus en parallèle
+            futures = [self.executor.submit(self._search_many, entry, q_matrix, depth) for entry in selected]
+            per_index = [future.result() for future in futures]
+
+        results = []
+        for row in range(len(q_matrix)):
+            vector_hits = self._merge([rows[row] for rows in per_index], depth)
+            if not hybrid:
+                results.append(vector_hits)
+                continue
+            lexical_hits = self._search_lexical(queries[row], selected, depth)
+            results.append(fuse(
+                vector_hits, lexical_hits, top_k,
+                method=self.fusion["method"],
+                vector_weight=self.fusion["vector_weight"],
+                rrf_k=self.fusion["rrf_k"]
+            ))
+        return results
+
+    def search(self, q_vec: np.ndarray, top_k: int, names=None, categories=None, query: str | None = None) -> list:
+        """Recherche dans les index sélectionnés, fusion par score décroissant sans doublons"""
+        return self.search_batch(q_vec, top_k, names, categories, [query] if query is not None else None)[0]
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                name: {"category": entry.category, "vectors": entry.size, "default": entry.default}
+                for name, entry in self.indexes.items()
+            }
+
+    def lexical_stats(self) -> dict | None:
+        if self.lexical is None:
+            return None
+        with self.lock:
+            latencies = np.array(self.lexical_latencies_ms)
+            searches = self.lexical_searches
+        return {
+            **self.lexical.stats(),
+            **self.fusion,
+            "searches": searches,
+            "last_ms": round(float(latencies[-1]), 3) if len(latencies) else None,
+            "p50_ms": round(float(np.percentile(latencies, 50)), 3) if len(latencies) else None,
+            "p95_ms": round(float(np.percentile(latencies, 95)), 3) if len(latencies) else None
+        }
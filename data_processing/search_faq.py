@@ -1,9 +1,9 @@
 # search_faq.py
 import json
-import faiss
 import numpy as np
 from sentence_transformers import SentenceTransformer
 from local_knowledge import get_fact
+from index_factory import load_index
 
 # --- Config ---
 index_file = "orange_faq.index"
@@ -12,7 +12,7 @@ model_name = "sentence-transformers/all-MiniLM-L6-v2"
 top_k = 5
 
 # Charger l'index FAISS et les métadonnées
-index = faiss.read_index(index_file)
+index = load_index(index_file)
 with open(metadata_file, "r") as f:
     texts = json.load(f)
 
@@ -25,6 +25,8 @@ def search_faq(query):
     D, I = index.search(embedding, top_k)
     results = []
     for score, idx in zip(D[0], I[0]):
+        if idx < 0:
+            continue
         results.append({"text": texts[idx], "score": float(score)})
     return results
 
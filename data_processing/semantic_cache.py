@@ -0,0 +1,84 @@
+# semantic_cache.py
+# Cache sémantique des réponses: une question dont l'embedding est assez proche
+# d'une question déjà traitée (même langue, même version d'index) reçoit la
+# réponse mémorisée sans nouvel appel au LLM.
+
+import time
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """Cache (embedding, langue, version d'index) -> réponse finale formatée"""
+
+    def __init__(self, threshold: float = 0.93, max_entries: int = 512):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.lock = Lock()
+        self.entries = OrderedDict()  # id -> entrée
+        self.next_id = 0
+        self.lookups = 0
+        self.hits = 0
+        self.latency_saved_s = 0.0
+        self.invalidations = 0
+
+    def lookup(self, q_vec: np.ndarray, language: str, index_version: str):
+        """Retourne (réponse, scores, similarité) ou None"""
+        query = np.asarray(q_vec, dtype=np.float32).reshape(-1)
+        with self.lock:
+            self.lookups += 1
+            candidates = [
+                (entry_id, entry) for entry_id, entry in self.entries.items()
+                if entry["language"] == language and entry["index_version"] == index_version
+            ]
+            if not candidates:
+                return None
+            matrix = np.vstack([entry["vector"] for _, entry in candidates])
+            similarities = matrix @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+
+            entry_id, entry = candidates[best]
+            self.entries.move_to_end(entry_id)
+            entry["hits"] += 1
+            self.hits += 1
+            self.latency_saved_s += entry["generation_s"]
+            return dict(entry["response"]), entry["scores"], float(similarities[best])
+
+    def store(self, q_vec: np.ndarray, language: str, index_version: str,
+              response: dict, scores: np.ndarray, generation_s: float):
+        with self.lock:
+            self.entries[self.next_id] = {
+                "vector": np.asarray(q_vec, dtype=np.float32).reshape(-1),
+                "language": language,
+                "index_version": index_version,
+                "response": dict(response),
+                "scores": scores,
+                "generation_s": generation_s,
+                "created_at": time.time(),
+                "hits": 0
+            }
+            self.next_id += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self):
+        """Vide le cache (index de base ou personnalisé modifié, modèle LLM changé)"""
+        with self.lock:
+            self.entries.clear()
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "threshold": self.threshold,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else None,
+                "latency_saved_s": round(self.latency_saved_s, 2),
+                "invalidations": self.invalidations
+            }
@@ -0,0 +1,45 @@
+# sentence_stream.py
+# Découpage en phrases d'un texte produit au fil de l'eau par le LLM, pour
+# lancer la synthèse vocale d'une phrase dès qu'elle est complète.
+
+import re
+
+# Fin de phrase: ponctuation forte (suivie d'un espace) ou retour à la ligne.
+# "1.5", "*144#." ou "www.orange.bf" ne coupent pas: il faut un blanc après le point.
+SENTENCE_END_RE = re.compile(r"[.!?…]+[\"»)\]]*\s+|\n+")
+
+
+def split_sentences(text: str, min_chars: int = 25) -> list:
+    """Phrases d'un texte complet, les fragments trop courts étant regroupés avec la suite"""
+    buffer = SentenceBuffer(min_chars)
+    return buffer.feed(text) + buffer.flush()
+
+
+class SentenceBuffer:
+    """
+    Accumule les fragments du LLM et rend les phrases complètes.
+    Une phrase plus courte que `min_chars` attend la suivante (évite de
+    synthétiser "Bonjour." seul), sauf en fin de flux.
+    """
+
+    def __init__(self, min_chars: int = 25):
+        self.min_chars = min_chars
+        self.pending = ""
+
+    def feed(self, delta: str) -> list:
+        self.pending += delta
+        sentences = []
+        start = 0
+        for match in SENTENCE_END_RE.finditer(self.pending):
+            candidate = self.pending[start:match.end()].strip()
+            if len(candidate) < self.min_chars:
+                continue
+            sentences.append(candidate)
+            start = match.end()
+        self.pending = self.pending[start:]
+        return sentences
+
+    def flush(self) -> list:
+        rest = self.pending.strip()
+        self.pending = ""
+        return [rest] if rest else []
@@ -0,0 +1,48 @@
+# single_flight.py
+# Regroupement des calculs identiques en cours ("single-flight"): si la même
+# question arrive plusieurs fois avant que la première réponse soit prête,
+# un seul calcul est lancé et tous les appelants reçoivent son résultat.
+
+import asyncio
+from threading import Lock
+
+
+class AsyncSingleFlight:
+    def __init__(self):
+        self.in_flight = {}  # clé -> asyncio.Task
+        self.lock = Lock()  # protège les compteurs lus depuis d'autres threads (/admin/metrics)
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def run(self, key, coroutine_factory):
+        """
+        Exécute `coroutine_factory()` une seule fois par clé en cours.
+        Le calcul tourne dans sa propre tâche: si l'appelant qui l'a lancé est annulé
+        (client déconnecté), les autres appelants reçoivent quand même le résultat.
+        """
+        task = self.in_flight.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(coroutine_factory())
+            self.in_flight[key] = task
+
+            def forget(done_task):
+                if self.in_flight.get(key) is done_task:
+                    del self.in_flight[key]
+
+            task.add_done_callback(forget)
+            with self.lock:
+                self.leaders += 1
+        else:
+            with self.lock:
+                self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        with self.lock:
+            total = self.leaders + self.coalesced
+            return {
+                "in_flight": len(self.in_flight),
+                "computed": self.leaders,
+                "coalesced": self.coalesced,
+                "coalesced_rate": round(self.coalesced / total, 3) if total else None
+            }
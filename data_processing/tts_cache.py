@@ -0,0 +1,289 @@
+# tts_cache.py
+# Cache disque des synthèses vocales (static/tts_cache) borné en octets.
+# index.json garde pour chaque fichier sa taille, son dernier accès et son
+# nombre de hits; au-delà du budget, les fichiers sont évincés par ancienneté
+# d'accès (lru) ou par fréquence d'utilisation (lfu). Compteurs protégés par
+# un verrou: le cache est appelé depuis le threadpool de FastAPI et les pools TTS.
+# Les lectures de fichiers et l'écriture de l'index se font hors de ce verrou;
+# l'index est sauvegardé au plus toutes les `index_save_interval_s` secondes.
+#
+# TieredTTSCache place devant ce cache disque un niveau mémoire borné (clips
+# les plus récemment servis) pour éviter de relire la carte SD à chaque hit.
+
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock, get_ident
+
+POLICIES = ("lru", "lfu")
+
+
+def synthesis_cache_key(text: str, language: str, engine: str, voice_profile: str,
+                        speed: float, pitch: float) -> str:
+    """Nom de fichier dérivé de tous les paramètres qui changent l'audio produit"""
+    params = json.dumps(
+        {"engine": engine, "voice_profile": voice_profile, "speed": float(speed), "pitch": float(pitch),
+         "lang": language, "text": text},
+        ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.sha1(params.encode("utf-8")).hexdigest() + ".wav"
+
+
+class TTSDiskCache:
+    def __init__(self, directory: Path, max_bytes: int, policy: str = "lru", index_save_interval_s: float = 30.0):
+        if policy not in POLICIES:
+            raise ValueError(f"Politique d'éviction inconnue: {policy} (attendu: {', '.join(POLICIES)})")
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.directory / "index.json"
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.index_save_interval_s = index_save_interval_s
+        self.lock = Lock()
+        self.index_lock = Lock()  # écriture de index.json
+        self.entries = {}  # nom de fichier -> {"size", "last_access", "hits"}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.dirty = False
+        self.last_save = 0.0
+        self.generation = 0  # instantané de l'index le plus récent
+        self.written_generation = 0
+        self._load_index()
+        with self.lock:
+            self._evict()
+            snapshot = self._index_snapshot(force=True)
+        self._write_index(snapshot)
+
+    def _load_index(self):
+        """Index relu puis réconcilié avec le répertoire (fichiers ajoutés ou supprimés à la main)"""
+        saved = {}
+        if self.index_path.exists():
+            try:
+                saved = json.loads(self.index_path.read_text(encoding="utf-8"))
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"⚠️  Index du cache TTS illisible, reconstruit: {e}")
+        for path in self.directory.glob("*.wav"):
+            stat = path.stat()
+            entry = saved.get(path.name, {})
+            self.entries[path.name] = {
+                "size": stat.st_size,
+                "last_access": entry.get("last_access", stat.st_mtime),
+                "hits": entry.get("hits", 0)
+            }
+            self.total_bytes += stat.st_size
+
+    def _index_snapshot(self, force: bool = False):
+        """Sous verrou: contenu de l'index à écrire, ou None (rien de neuf ou sauvegarde récente)"""
+        if not force and (not self.dirty or time.monotonic() - self.last_save < self.index_save_interval_s):
+            return None
+        self.dirty = False
+        self.last_save = time.monotonic()
+        self.generation += 1
+        return self.generation, json.dumps(self.entries)
+
+    def _write_index(self, snapshot):
+        if snapshot is None:
+            return
+        generation, content = snapshot
+        with self.index_lock:
+            if generation < self.written_generation:
+                return  # un instantané plus récent est déjà écrit
+            tmp_path = self.index_path.with_suffix(".tmp")
+            tmp_path.write_text(content, encoding="utf-8")
+            os.replace(tmp_path, self.index_path)
+            self.written_generation = generation
+
+    def _eviction_order(self) -> list:
+        if self.policy == "lfu":
+            key = lambda name: (self.entries[name]["hits"], self.entries[name]["last_access"])
+        else:
+            key = lambda name: self.entries[name]["last_access"]
+        return sorted(self.entries, key=key)
+
+    def _evict(self):
+        if self.total_bytes <= self.max_bytes:
+            return
+        for name in self._eviction_order():
+            if self.total_bytes <= self.max_bytes:
+                break
+            (self.directory / name).unlink(missing_ok=True)
+            self.total_bytes -= self.entries.pop(name)["size"]
+            self.evictions += 1
+            self.dirty = True
+
+    def get(self, name: str):
+        """Octets du fichier en cache, ou None (compté comme miss)"""
+        with self.lock:
+            if name not in self.entries:
+                self.misses += 1
+                return None
+
+        try:
+            data = (self.directory / name).read_bytes()
+        except OSError:
+            data = None
+
+        with self.lock:
+            entry = self.entries.get(name)
+            if data is None:
+                # Évincé entre-temps ou supprimé hors du cache: l'index se corrige
+                if entry is not None and not (self.directory / name).exists():
+                    self.total_bytes -= self.entries.pop(name)["size"]
+                    self.dirty = True
+                self.misses += 1
+                return None
+            if entry is not None:
+                entry["last_access"] = time.time()
+                entry["hits"] += 1
+                self.dirty = True
+            self.hits += 1
+            snapshot = self._index_snapshot()
+        self._write_index(snapshot)
+        return data
+
+    def touch(self, name: str):
+        """Accès servi par un cache plus rapide: met à jour last_access et hits sans lire le fichier"""
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None:
+                return
+            entry["last_access"] = time.time()
+            entry["hits"] += 1
+            self.dirty = True
+            snapshot = self._index_snapshot()
+        self._write_index(snapshot)
+
+    def put(self, name: str, data: bytes):
+        path = self.directory / name
+        tmp_path = path.with_name(f"{path.name}.{get_ident()}.tmp")  # écritures concurrentes du même fichier
+        tmp_path.write_bytes(data)
+        with self.lock:
+            os.replace(tmp_path, path)
+            previous = self.entries.get(name)
+            if previous is not None:
+                self.total_bytes -= previous["size"]
+            self.entries[name] = {
+                "size": len(data),
+                "last_access": time.time(),
+                "hits": previous["hits"] if previous else 0
+            }
+            self.total_bytes += len(data)
+            self._evict()
+            self.dirty = True
+            snapshot = self._index_snapshot()
+        self._write_index(snapshot)
+
+    def save(self):
+        """Sauvegarde l'index si des accès n'y sont pas encore (appelé à l'arrêt)"""
+        with self.lock:
+            snapshot = self._index_snapshot(force=True) if self.dirty else None
+        self._write_index(snapshot)
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "files": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "usage": round(self.total_bytes / self.max_bytes, 3) if self.max_bytes else None,
+                "evictions": self.evictions,
+                "policy": self.policy
+            }
+
+
+class HotClipCache:
+    """Niveau mémoire: LRU borné en octets; les clips plus gros que `max_clip_bytes` n'y entrent pas"""
+
+    def __init__(self, max_bytes: int, max_clip_bytes: int | None = None):
+        self.max_bytes = max_bytes
+        self.max_clip_bytes = max_clip_bytes if max_clip_bytes is not None else max_bytes // 4
+        self.lock = Lock()
+        self.clips = OrderedDict()  # nom -> octets
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, name: str):
+        with self.lock:
+            data = self.clips.get(name)
+            if data is None:
+                self.misses += 1
+                return None
+            self.clips.move_to_end(name)
+            self.hits += 1
+            return data
+
+    def put(self, name: str, data: bytes):
+        if len(data) > self.max_clip_bytes:
+            return
+        with self.lock:
+            previous = self.clips.pop(name, None)
+            if previous is not None:
+                self.total_bytes -= len(previous)
+            self.clips[name] = data
+            self.total_bytes += len(data)
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self.clips.popitem(last=False)
+                self.total_bytes -= len(evicted)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "clips": len(self.clips),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions
+            }
+
+
+class TieredTTSCache:
+    """Mémoire puis disque; un hit disque remonte le clip en mémoire"""
+
+    def __init__(self, memory: HotClipCache, disk: TTSDiskCache):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, name: str):
+        data = self.memory.get(name)
+        if data is not None:
+            self.disk.touch(name)  # garde l'ordre LRU/LFU du disque fidèle aux accès réels
+            return data
+        data = self.disk.get(name)
+        if data is not None:
+            self.memory.put(name, data)
+        return data
+
+    def put(self, name: str, data: bytes):
+        self.disk.put(name, data)
+        self.memory.put(name, data)
+
+    def save(self):
+        self.disk.save()
+
+    def stats(self) -> dict:
+        memory = self.memory.stats()
+        disk = self.disk.stats()
+        lookups = memory["hits"] + memory["misses"]
+        hits = memory["hits"] + disk["hits"]
+        return {
+            "hit_rate": round(hits / lookups, 3) if lookups else None,
+            "hits": hits,
+            "misses": lookups - hits,
+            "memory": memory,
+            "disk": disk
+        }